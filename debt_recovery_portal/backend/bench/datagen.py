@@ -0,0 +1,263 @@
+"""Deterministic synthetic data for load benchmarks.
+
+Creates users across roles, cases with documents and tickets at skewed,
+production-like distributions, and real uploaded files of varied sizes. The
+same --seed always produces the same rows and file contents, so benchmark
+runs against a freshly generated database are comparable between commits.
+
+Run from the backend directory against a scratch database:
+
+    SQLALCHEMY_DATABASE_URI=sqlite:////tmp/bench.db \\
+        python -m bench.datagen --users 500 --cases 20000 --manifest bench/manifest.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+from src.main import app
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.document import Document
+from src.models.ticket import Ticket
+from src.services.storage import get_storage
+
+BENCH_PASSWORD = 'benchpass123'
+BATCH_SIZE = 1000
+
+ROLE_WEIGHTS = [('client', 80), ('staff', 12), ('legal', 5), ('admin', 3)]
+CASE_STATUS_WEIGHTS = [('Open', 35), ('In Progress', 40), ('Resolved', 15), ('Closed', 10)]
+TICKET_STATUS_WEIGHTS = [('Received', 30), ('In Review', 25), ('Ongoing', 25), ('Resolved', 20)]
+PRIORITY_WEIGHTS = [('Low', 20), ('Medium', 50), ('High', 22), ('Critical', 8)]
+# extension, mime type, weight
+FILE_TYPES = [
+    ('pdf', 'application/pdf', 50),
+    ('jpg', 'image/jpeg', 15),
+    ('png', 'image/png', 10),
+    ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document', 15),
+    ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 5),
+    ('txt', 'text/plain', 5),
+]
+COMPANY_WORDS = ['Accra', 'Gold', 'Coast', 'Volta', 'Ashanti', 'Star', 'Atlantic', 'Harbour',
+                 'Sunrise', 'Unity', 'Prime', 'Kente', 'Savanna', 'Delta', 'Crown', 'Eagle']
+COMPANY_SUFFIXES = ['Ltd', 'Limited', 'Company Limited', 'Enterprises', 'Holdings', 'PLC', 'Ventures']
+FIRST_NAMES = ['Kwame', 'Ama', 'Kofi', 'Akosua', 'Yaw', 'Abena', 'Kojo', 'Efua', 'John', 'Sarah',
+               'Michael', 'Grace', 'Daniel', 'Esi', 'Samuel', 'Adwoa']
+LAST_NAMES = ['Mensah', 'Owusu', 'Boateng', 'Asante', 'Osei', 'Agyeman', 'Appiah', 'Darko',
+              'Smith', 'Johnson', 'Addo', 'Acheampong', 'Quaye', 'Tetteh', 'Amoah', 'Ofori']
+
+def weighted(rng, choices):
+    values = [choice[0] for choice in choices]
+    weights = [choice[-1] for choice in choices]
+    return rng.choices(values, weights=weights)[0]
+
+def company_name(rng):
+    words = rng.sample(COMPANY_WORDS, rng.randint(1, 2))
+    return f"{' '.join(words)} {rng.choice(COMPANY_SUFFIXES)}"
+
+def debtor_spelling(rng, name):
+    """The same debtor as a different client might type it"""
+    variant = rng.randint(0, 4)
+    if variant == 0:
+        return name.upper()
+    if variant == 1:
+        return name.replace('Limited', 'Ltd') if 'Limited' in name else name.replace('Ltd', 'Limited')
+    if variant == 2:
+        return name.replace(' ', '-', 1) + '.'
+    if variant == 3:
+        return 'The ' + name
+    position = rng.randrange(1, len(name))
+    return name[:position - 1] + name[position:]
+
+def file_size(rng, max_bytes):
+    """Log-normal document sizes: mostly tens of KB, with a tail of multi-MB scans"""
+    return max(256, min(int(rng.lognormvariate(10.5, 1.4)), max_bytes))
+
+def save_batch(batch):
+    """Insert a batch, return its ids and drop it from the identity map"""
+    db.session.add_all(batch)
+    db.session.commit()
+    ids = [record.id for record in batch]
+    db.session.expunge_all()
+    return ids
+
+def generate_users(rng, count, password_hash, now):
+    users = []
+    for index in range(count):
+        role = weighted(rng, ROLE_WEIGHTS)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(User(
+            username=f'bench_{role}_{index}',
+            email=f'bench_{role}_{index}@bench.example.com',
+            password_hash=password_hash,
+            first_name=first,
+            last_name=last,
+            phone=f'+233{rng.randint(200000000, 599999999)}',
+            company=company_name(rng) if role == 'client' else "Demaek's Global Limited",
+            role=role,
+            is_active=rng.random() > 0.03,
+            created_at=now - timedelta(days=rng.randint(30, 1000))
+        ))
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+def generate_cases(rng, count, clients, staff, debtors, now):
+    """Case volume per client is heavy-tailed: a few large clients own most cases.
+
+    Returns {case id: client id}, in insertion order.
+    """
+    client_weights = [rng.paretovariate(1.2) for _ in clients]
+    case_clients = {}
+    for start in range(0, count, BATCH_SIZE):
+        batch = []
+        for _ in range(min(BATCH_SIZE, count - start)):
+            created_at = now - timedelta(days=rng.randint(0, 730), seconds=rng.randint(0, 86399))
+            client = rng.choices(clients, weights=client_weights)[0]
+            debtor = rng.choice(debtors)
+            batch.append(Case(
+                title=f'Recovery of outstanding invoices #{rng.randint(1000, 99999)}',
+                description='Synthetic benchmark case. ' * rng.randint(1, 20),
+                amount_owed=round(rng.lognormvariate(9.0, 1.3), 2),
+                debtor_company=debtor if rng.random() > 0.2 else debtor_spelling(rng, debtor),
+                debtor_contact=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                status=weighted(rng, CASE_STATUS_WEIGHTS),
+                priority=weighted(rng, PRIORITY_WEIGHTS),
+                created_at=created_at,
+                updated_at=created_at + timedelta(days=rng.randint(0, 60)),
+                client_id=client.id,
+                assigned_staff_id=rng.choice(staff).id if staff and rng.random() > 0.05 else None
+            ))
+        client_ids = [case.client_id for case in batch]
+        case_clients.update(zip(save_batch(batch), client_ids))
+    return case_clients
+
+def generate_documents(rng, case_ids, uploaders, max_file_bytes, storage):
+    """Zero to eight documents per case, written through the configured storage backend"""
+    document_ids = []
+    batch = []
+    for case_id in case_ids:
+        for _ in range(min(int(rng.expovariate(0.6)), 8)):
+            extension, mime_type, _weight = rng.choices(FILE_TYPES, weights=[t[2] for t in FILE_TYPES])[0]
+            unique_filename = f'{uuid.UUID(int=rng.getrandbits(128), version=4)}.{extension}'
+            file_key = storage.new_key(unique_filename)
+            size = storage.save(file_key, io.BytesIO(rng.randbytes(file_size(rng, max_file_bytes))), mime_type)
+            batch.append(Document(
+                filename=unique_filename,
+                original_filename=f'evidence_{rng.randint(1, 9999)}.{extension}',
+                file_path=file_key,
+                file_size=size,
+                mime_type=mime_type,
+                description='Synthetic benchmark document',
+                case_id=case_id,
+                uploaded_by_id=rng.choice(uploaders).id
+            ))
+        if len(batch) >= BATCH_SIZE:
+            document_ids.extend(save_batch(batch))
+            batch = []
+    if batch:
+        document_ids.extend(save_batch(batch))
+    return document_ids
+
+def generate_tickets(rng, case_clients, clients, staff, now):
+    """Most cases get a couple of tickets, raised by the case's client; one in ten tickets has no case"""
+    ticket_ids = []
+    batch = []
+    for case_id in list(case_clients) + [None] * (len(case_clients) // 10):
+        for _ in range(min(int(rng.expovariate(0.8)), 5) if case_id else 1):
+            created_at = now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+            status = weighted(rng, TICKET_STATUS_WEIGHTS)
+            batch.append(Ticket(
+                ticket_id=str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                title=f'Query about payment schedule {rng.randint(1, 9999)}',
+                description='Synthetic benchmark ticket. ' * rng.randint(1, 10),
+                status=status,
+                priority=weighted(rng, PRIORITY_WEIGHTS),
+                category=rng.choice(['Payment Issues', 'Legal Matters', 'Document Management',
+                                     'Account Issues', 'General Inquiry']),
+                created_at=created_at,
+                updated_at=created_at + timedelta(hours=rng.randint(0, 500)),
+                resolved_at=created_at + timedelta(hours=rng.randint(1, 500)) if status == 'Resolved' else None,
+                case_id=case_id,
+                created_by_id=case_clients[case_id] if case_id else rng.choice(clients).id,
+                assigned_to_id=rng.choice(staff).id if staff else None
+            ))
+            if len(batch) >= BATCH_SIZE:
+                ticket_ids.extend(save_batch(batch))
+                batch = []
+    if batch:
+        ticket_ids.extend(save_batch(batch))
+    return ticket_ids
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate deterministic benchmark data')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--debtors', type=int, default=500, help='distinct debtor companies')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-file-kb', type=int, default=4096, help='cap on generated file size')
+    parser.add_argument('--manifest', default='bench/manifest.json',
+                        help='where to write ids and credentials for the load driver')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    # Fixed reference time keeps generated timestamps identical between runs
+    now = datetime(2026, 1, 1)
+
+    with app.app_context():
+        # Generated ids are read back after each batch commit; skip the reload round trip
+        db.session().expire_on_commit = False
+        if User.query.filter(User.username.like('bench_%')).first():
+            parser.error('database already contains benchmark data; point SQLALCHEMY_DATABASE_URI at a fresh file')
+
+        # Hashing once keeps generation fast; every bench user shares the password
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        users = generate_users(rng, args.users, password_hash, now)
+        active = [user for user in users if user.is_active]
+        clients = [user for user in active if user.role == 'client']
+        staff = [user for user in active if user.role == 'staff']
+        internal = [user for user in active if user.role in ('staff', 'legal', 'admin')]
+        if not clients or not internal:
+            parser.error('need at least one active client and one internal user; raise --users')
+
+        # Real debtor names rather than numbered copies, so the duplicate-debtor index sees realistic overlap
+        debtors = []
+        for _ in range(args.debtors * 10):
+            name = f'{rng.choice(LAST_NAMES)} {company_name(rng)}'
+            if name not in debtors:
+                debtors.append(name)
+            if len(debtors) == args.debtors:
+                break
+        case_clients = generate_cases(rng, args.cases, clients, staff, debtors, now)
+        case_ids = list(case_clients)
+        document_ids = generate_documents(rng, case_ids, internal, args.max_file_kb * 1024, get_storage())
+        ticket_ids = generate_tickets(rng, case_clients, clients, staff, now)
+
+        manifest = {
+            'seed': args.seed,
+            'password': BENCH_PASSWORD,
+            'users': {role: [user.username for user in active if user.role == role]
+                      for role, _weight in ROLE_WEIGHTS},
+            'user_ids': [user.id for user in users],
+            'case_ids': case_ids,
+            'document_ids': document_ids,
+            'ticket_ids': ticket_ids
+        }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.manifest)), exist_ok=True)
+    with open(args.manifest, 'w') as handle:
+        json.dump(manifest, handle)
+
+    print(f'Generated {len(users)} users, {len(case_ids)} cases, '
+          f'{len(document_ids)} documents, {len(ticket_ids)} tickets')
+    print(f'Manifest written to {args.manifest}')
+
+if __name__ == '__main__':
+    main()
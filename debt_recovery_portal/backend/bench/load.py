@@ -0,0 +1,305 @@
+"""Stdlib load driver for the Flask API.
+
+Replays every blueprint endpoint at one or more concurrency levels against
+a running server seeded by bench.datagen and reports throughput and
+p50/p95/p99 latency as JSON. Each worker thread logs in once and keeps its
+own keep-alive connection. Request paths are picked with a seeded RNG, so
+two runs against the same generated data send the same workload.
+
+    python -m bench.load --base-url http://127.0.0.1:5001 --concurrency 1,8,32 \\
+        --requests 500 --output bench/results.json
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# (name, method, path template, role, writes)
+# Templates are filled from the manifest ids: {case_id}, {ticket_id}, {document_id}, {user_id}
+# *_retry scenarios send an Idempotency-Key derived from the body, so repeated bodies are client retries
+SCENARIOS = [
+    ('health', 'GET', '/api/health', None, False),
+    ('auth_me', 'GET', '/api/auth/me', 'client', False),
+    ('auth_login', 'POST', '/api/auth/login', None, False),
+    ('cases_list_client', 'GET', '/api/cases', 'client', False),
+    ('cases_list_staff', 'GET', '/api/cases', 'staff', False),
+    ('case_detail', 'GET', '/api/cases/{case_id}', 'staff', False),
+    ('case_documents', 'GET', '/api/cases/{case_id}/documents', 'staff', False),
+    ('my_cases', 'GET', '/api/my-cases', 'staff', False),
+    ('tickets_list_client', 'GET', '/api/tickets', 'client', False),
+    ('tickets_list_staff', 'GET', '/api/tickets', 'staff', False),
+    ('ticket_detail', 'GET', '/api/tickets/{ticket_id}', 'staff', False),
+    ('tickets_by_status', 'GET', '/api/tickets/by-status/Received', 'staff', False),
+    ('my_tickets', 'GET', '/api/my-tickets', 'staff', False),
+    ('document_detail', 'GET', '/api/documents/{document_id}', 'staff', False),
+    ('document_download', 'GET', '/api/documents/{document_id}/download', 'staff', False),
+    ('related_debtors', 'GET', '/api/cases/{case_id}/related-debtors', 'staff', False),
+    ('case_bundle', 'GET', '/api/cases/{case_id}/bundle.zip', 'staff', False),
+    ('users_list', 'GET', '/api/users', 'admin', False),
+    ('user_detail', 'GET', '/api/users/{user_id}', 'admin', False),
+    ('users_page', 'GET', '/api/users?page=2&per_page=50', 'admin', False),
+    ('users_search', 'GET', '/api/users/search?q=ama&role=staff,legal', 'staff', False),
+    ('changes_feed', 'GET', '/api/changes?since=0', 'staff', False),
+    ('metrics', 'GET', '/api/metrics', 'admin', False),
+    ('aging_report', 'GET', '/api/reports/aging?group_by=assigned_staff', 'staff', False),
+    ('aging_export_csv', 'GET', '/api/reports/aging?format=csv&detail=1', 'staff', False),
+    ('aging_export_xlsx', 'GET', '/api/reports/aging?format=xlsx&group_by=client_company', 'staff', False),
+    ('batch_dashboard', 'POST', '/api/batch', 'staff', False),
+    ('batch_dashboard_parallel', 'POST', '/api/batch', 'staff', False),
+    ('case_create', 'POST', '/api/cases', 'client', True),
+    ('case_create_retry', 'POST', '/api/cases', 'client', True),
+    ('case_update', 'PUT', '/api/cases/{case_id}', 'staff', True),
+    ('ticket_create', 'POST', '/api/tickets', 'client', True),
+    ('ticket_update', 'PUT', '/api/tickets/{ticket_id}', 'staff', True),
+    ('document_upload', 'POST', '/api/cases/{case_id}/documents', 'staff', True),
+]
+RETRY_PAYLOADS = 20
+# What the staff dashboard fetches on load, sent as one /api/batch call
+DASHBOARD_REQUESTS = ['/api/my-cases', '/api/my-tickets', '/api/tickets/by-status/Received',
+                      '/api/cases/{case_id}', '/api/tickets/{ticket_id}', '/api/auth/me']
+
+def request_body(name, rng, manifest):
+    """Return (body bytes, content type) for scenarios that send a payload"""
+    if name == 'auth_login':
+        username = rng.choice(manifest['users']['client'])
+        return json.dumps({'username': username, 'password': manifest['password']}).encode(), 'application/json'
+    if name == 'case_create':
+        return json.dumps({'title': 'Load test case', 'amount_owed': rng.randint(100, 100000),
+                           'debtor_company': 'Load Test Debtor Ltd'}).encode(), 'application/json'
+    if name == 'case_create_retry':
+        # A small pool of payloads, so most requests replay an earlier response
+        amount = 1000 + rng.randrange(RETRY_PAYLOADS)
+        return json.dumps({'title': 'Load test retried case', 'amount_owed': amount,
+                           'debtor_company': 'Load Test Debtor Ltd'}).encode(), 'application/json'
+    if name in ('batch_dashboard', 'batch_dashboard_parallel'):
+        sub_requests = [{'id': str(index), 'method': 'GET', 'path': fill_path(path, rng, manifest)}
+                        for index, path in enumerate(DASHBOARD_REQUESTS)]
+        return json.dumps({'requests': sub_requests, 'parallel': name.endswith('_parallel')}).encode(), \
+            'application/json'
+    if name == 'case_update':
+        return json.dumps({'status': rng.choice(['Open', 'In Progress'])}).encode(), 'application/json'
+    if name == 'ticket_create':
+        return json.dumps({'title': 'Load test ticket', 'description': 'Payment schedule query'}).encode(), 'application/json'
+    if name == 'ticket_update':
+        return json.dumps({'status': rng.choice(['In Review', 'Ongoing'])}).encode(), 'application/json'
+    if name == 'document_upload':
+        boundary = uuid.UUID(int=rng.getrandbits(128)).hex
+        payload = rng.randbytes(32 * 1024)
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load.pdf"\r\n'
+                f'Content-Type: application/pdf\r\n\r\n').encode() + payload + f'\r\n--{boundary}--\r\n'.encode()
+        return body, f'multipart/form-data; boundary={boundary}'
+    return None, None
+
+def fill_path(template, rng, manifest):
+    return template.format(
+        case_id=rng.choice(manifest['case_ids']) if '{case_id}' in template else '',
+        ticket_id=rng.choice(manifest['ticket_ids']) if '{ticket_id}' in template else '',
+        document_id=rng.choice(manifest['document_ids']) if '{document_id}' in template else '',
+        user_id=rng.choice(manifest['user_ids']) if '{user_id}' in template else ''
+    )
+
+class Worker:
+    """One thread, one keep-alive connection, one logged-in user"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.cookie = None
+
+    def send(self, method, path, body=None, content_type=None, idempotency_key=None):
+        headers = {'Connection': 'keep-alive'}
+        if body is not None:
+            headers['Content-Type'] = content_type
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # Server closed the keep-alive connection; retry once on a fresh one
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+    def login(self, username, password):
+        body = json.dumps({'username': username, 'password': password}).encode()
+        status = self.send('POST', '/api/auth/login', body, 'application/json')
+        if status != 200:
+            raise RuntimeError(f'login failed for {username}: HTTP {status}')
+
+    def close(self):
+        self.connection.close()
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_scenario(scenario, concurrency, total_requests, args, manifest):
+    name, method, template, role, _writes = scenario
+    per_worker = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0)
+                  for i in range(concurrency)]
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    failures = []
+    ready = threading.Barrier(concurrency + 1)
+
+    def work(index):
+        rng = random.Random(f'{args.seed}:{name}:{concurrency}:{index}')
+        worker = Worker(args.base_url, args.timeout)
+        try:
+            if role:
+                candidates = manifest['users'].get(role) or manifest['users']['admin']
+                try:
+                    worker.login(rng.choice(candidates), manifest['password'])
+                except (RuntimeError, http.client.HTTPException, OSError) as e:
+                    # Release the other workers and the coordinator instead of hanging
+                    failures.append(str(e) or repr(e))
+                    ready.abort()
+                    return
+            ready.wait()
+            for _ in range(per_worker[index]):
+                path = fill_path(template, rng, manifest)
+                body, content_type = request_body(name, rng, manifest)
+                key = hashlib.sha256(body).hexdigest() if name.endswith('_retry') else None
+                started = time.perf_counter()
+                try:
+                    status = worker.send(method, path, body, content_type, key)
+                except (http.client.HTTPException, OSError):
+                    status = 599
+                latencies[index].append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[index] += 1
+        except threading.BrokenBarrierError:
+            pass
+        finally:
+            worker.close()
+
+    threads = [threading.Thread(target=work, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        return {
+            'scenario': name,
+            'method': method,
+            'path': template,
+            'concurrency': concurrency,
+            'requests': 0,
+            'errors': 0,
+            'failed': failures[0] if failures else 'workers did not start'
+        }
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(value for worker_latencies in latencies for value in worker_latencies)
+    milliseconds = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'scenario': name,
+        'method': method,
+        'path': template,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(errors),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': milliseconds(percentile(samples, 0.50)),
+            'p95': milliseconds(percentile(samples, 0.95)),
+            'p99': milliseconds(percentile(samples, 0.99)),
+            'mean': milliseconds(sum(samples) / len(samples)) if samples else None,
+            'max': milliseconds(samples[-1]) if samples else None
+        }
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-benchmark every API endpoint')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001')
+    parser.add_argument('--manifest', default='bench/manifest.json')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated worker counts')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario and concurrency level')
+    parser.add_argument('--only', default='', help='comma-separated scenario name substrings')
+    parser.add_argument('--writes', action='store_true', help='include scenarios that modify data')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', default='-', help='JSON results file, - for stdout')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as handle:
+        manifest = json.load(handle)
+
+    levels = [int(level) for level in args.concurrency.split(',') if level]
+    filters = [name for name in args.only.split(',') if name]
+    scenarios = [scenario for scenario in SCENARIOS
+                 if (args.writes or not scenario[4])
+                 and (not filters or any(name in scenario[0] for name in filters))]
+
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            result = run_scenario(scenario, concurrency, max(args.requests, concurrency), args, manifest)
+            results.append(result)
+            if 'failed' in result:
+                print(f"{result['scenario']:<26} c={concurrency:<4} failed: {result['failed']}", file=sys.stderr)
+                continue
+            print(f"{result['scenario']:<26} c={concurrency:<4} {result['throughput_rps']:>9} rps  "
+                  f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms "
+                  f"errors={result['errors']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'started_at': datetime.utcnow().isoformat(),
+            'base_url': args.base_url,
+            'seed': args.seed,
+            'manifest_seed': manifest.get('seed'),
+            'requests_per_run': args.requests,
+            'concurrency': levels,
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as handle:
+            handle.write(output)
+
+if __name__ == '__main__':
+    main()
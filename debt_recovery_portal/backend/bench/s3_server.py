@@ -0,0 +1,321 @@
+"""Minimal S3-compatible server for exercising the s3 storage backend locally.
+
+Serves one or more path-style buckets from a directory and implements what
+the driver uses: PUT/GET/HEAD/DELETE object, multipart uploads,
+ListObjectsV2 and pre-signed GETs. Every request must carry a valid SigV4
+signature (header or query string) for the configured credentials.
+
+    python -m bench.s3_server --port 9000 --data /tmp/s3 --bucket documents \\
+        --access-key bench --secret-key benchsecret
+
+    STORAGE_BACKEND=s3 STORAGE_S3_ENDPOINT=http://127.0.0.1:9000 STORAGE_S3_BUCKET=documents \\
+        STORAGE_S3_ACCESS_KEY=bench STORAGE_S3_SECRET_KEY=benchsecret python src/main.py
+"""
+import argparse
+import hashlib
+import hmac
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.storage import sigv4_signature
+
+NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+COPY_BUFFER_SIZE = 1024 * 1024
+MAX_CLOCK_SKEW = 15 * 60
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'BenchS3/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # Routing
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_PUT(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def dispatch(self):
+        url = urlsplit(self.path)
+        self.raw_path = url.path
+        self.params = parse_qsl(url.query, keep_blank_values=True)
+        self.query = dict(self.params)
+        bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+        self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.authorized():
+            return self.error(403, 'SignatureDoesNotMatch')
+        if bucket not in self.server.buckets:
+            return self.error(404, 'NoSuchBucket')
+        if not key:
+            if self.command == 'GET' and self.query.get('list-type') == '2':
+                return self.list_objects(bucket)
+            return self.error(400, 'InvalidRequest')
+        handler = {
+            ('PUT', False): self.put_object, ('GET', False): self.get_object, ('HEAD', False): self.get_object,
+            ('DELETE', False): self.delete_object, ('POST', False): self.create_upload,
+            ('PUT', True): self.upload_part, ('POST', True): self.complete_upload, ('DELETE', True): self.abort_upload,
+        }.get((self.command, 'uploadId' in self.query))
+        if handler is None or (self.command == 'POST' and 'uploadId' not in self.query and 'uploads' not in self.query):
+            return self.error(400, 'InvalidRequest')
+        handler(bucket, key)
+
+    # Authentication
+
+    def authorized(self):
+        server = self.server
+        if 'X-Amz-Signature' in self.query:
+            credential = self.query.get('X-Amz-Credential', '').split('/')
+            amz_date = self.query.get('X-Amz-Date', '')
+            try:
+                signed_at = datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc).timestamp()
+                expired = time.time() > signed_at + int(self.query.get('X-Amz-Expires', '0'))
+            except ValueError:
+                return False
+            if expired or credential[0] != server.access_key:
+                return False
+            names = self.query.get('X-Amz-SignedHeaders', '').split(';')
+            params = [(name, value) for name, value in self.params if name != 'X-Amz-Signature']
+            expected = self.query['X-Amz-Signature']
+            payload_hash = 'UNSIGNED-PAYLOAD'
+        else:
+            authorization = self.headers.get('Authorization', '')
+            if not authorization.startswith('AWS4-HMAC-SHA256 '):
+                return False
+            fields = dict(part.strip().split('=', 1) for part in authorization[len('AWS4-HMAC-SHA256 '):].split(','))
+            credential = fields.get('Credential', '').split('/')
+            amz_date = self.headers.get('x-amz-date', '')
+            if credential[0] != server.access_key:
+                return False
+            names = fields.get('SignedHeaders', '').split(';')
+            params = self.params
+            expected = fields.get('Signature', '')
+            payload_hash = self.headers.get('x-amz-content-sha256', '')
+            if payload_hash != 'UNSIGNED-PAYLOAD' and payload_hash != hashlib.sha256(self.body).hexdigest():
+                return False
+        if len(credential) != 5:
+            return False
+        headers = {name: self.headers.get(name, '') for name in names}
+        _, signature = sigv4_signature(server.secret_key, credential[2], amz_date, self.command, unquote(self.raw_path),
+                                       params, headers, payload_hash)
+        return hmac.compare_digest(signature, expected)
+
+    # Responses
+
+    def respond(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if 'Content-Length' not in (headers or {}):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+
+    def xml(self, status, root, children):
+        body = ''.join(f'<{name}>{escape(str(value))}</{name}>' if not isinstance(value, list)
+                       else ''.join(f'<{name}>{inner}</{name}>' for inner in value)
+                       for name, value in children)
+        payload = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{NAMESPACE}">{body}</{root}>'.encode()
+        self.respond(status, payload, {'Content-Type': 'application/xml'})
+
+    def error(self, status, code):
+        self.xml(status, 'Error', [('Code', code), ('Resource', self.raw_path)])
+
+    # Objects
+
+    def object_path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.server.data, bucket, key))
+        if not path.startswith(os.path.join(self.server.data, bucket) + os.sep):
+            raise ValueError(key)
+        return path
+
+    def store(self, bucket, key, source_paths=None):
+        """Write the request body (or concatenated part files) to the object atomically"""
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        digest = hashlib.md5()
+        with open(temporary, 'wb') as target:
+            if source_paths is None:
+                target.write(self.body)
+                digest.update(self.body)
+            else:
+                for source_path in source_paths:
+                    with open(source_path, 'rb') as source:
+                        for chunk in iter(lambda: source.read(COPY_BUFFER_SIZE), b''):
+                            target.write(chunk)
+                            digest.update(chunk)
+        os.replace(temporary, path)
+        etag = f'"{digest.hexdigest()}"'
+        with self.server.lock:
+            self.server.metadata[(bucket, key)] = {
+                'content_type': self.headers.get('Content-Type') or 'application/octet-stream', 'etag': etag}
+        return etag
+
+    def put_object(self, bucket, key):
+        etag = self.store(bucket, key)
+        self.respond(200, headers={'ETag': etag})
+
+    def get_object(self, bucket, key):
+        path = self.object_path(bucket, key)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return self.error(404, 'NoSuchKey')
+        with handle:
+            stat = os.fstat(handle.fileno())
+            meta = self.server.metadata.get((bucket, key), {})
+            headers = {
+                'Content-Length': str(stat.st_size),
+                'Content-Type': self.query.get('response-content-type') or meta.get('content_type',
+                                                                                    'application/octet-stream'),
+                'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+                'ETag': meta.get('etag', '"0"'),
+            }
+            if 'response-content-disposition' in self.query:
+                headers['Content-Disposition'] = self.query['response-content-disposition']
+            self.respond(200, headers=headers)
+            if self.command == 'GET':
+                shutil.copyfileobj(handle, self.wfile, COPY_BUFFER_SIZE)
+
+    def delete_object(self, bucket, key):
+        try:
+            os.remove(self.object_path(bucket, key))
+        except FileNotFoundError:
+            pass
+        with self.server.lock:
+            self.server.metadata.pop((bucket, key), None)
+        self.respond(204)
+
+    def list_objects(self, bucket):
+        root = os.path.join(self.server.data, bucket)
+        prefix = self.query.get('prefix', '')
+        start_after = self.query.get('continuation-token') or self.query.get('start-after') or ''
+        max_keys = int(self.query.get('max-keys') or 1000)
+        keys = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+                if key.startswith(prefix) and key > start_after:
+                    keys.append(key)
+        # S3 lists in UTF-8 byte order
+        keys.sort(key=lambda key: key.encode())
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = []
+        for key in page:
+            stat = os.stat(os.path.join(root, *key.split('/')))
+            modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            contents.append(f'<Key>{escape(key)}</Key><LastModified>{modified}</LastModified>'
+                            f'<Size>{stat.st_size}</Size><StorageClass>STANDARD</StorageClass>')
+        children = [('Name', bucket), ('Prefix', prefix), ('KeyCount', len(page)), ('MaxKeys', max_keys),
+                    ('IsTruncated', 'true' if truncated else 'false'), ('Contents', contents)]
+        if truncated:
+            children.append(('NextContinuationToken', page[-1]))
+        self.xml(200, 'ListBucketResult', children)
+
+    # Multipart uploads
+
+    def create_upload(self, bucket, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.server.data, '.uploads', upload_id))
+        with self.server.lock:
+            self.server.uploads[upload_id] = (bucket, key)
+        self.xml(200, 'InitiateMultipartUploadResult', [('Bucket', bucket), ('Key', key), ('UploadId', upload_id)])
+
+    def upload_part(self, bucket, key):
+        upload_id = self.query['uploadId']
+        if self.server.uploads.get(upload_id) != (bucket, key):
+            return self.error(404, 'NoSuchUpload')
+        number = int(self.query.get('partNumber', '0'))
+        with open(os.path.join(self.server.data, '.uploads', upload_id, f'{number:05d}'), 'wb') as handle:
+            handle.write(self.body)
+        self.respond(200, headers={'ETag': f'"{hashlib.md5(self.body).hexdigest()}"'})
+
+    def complete_upload(self, bucket, key):
+        upload_id = self.query['uploadId']
+        if self.server.uploads.get(upload_id) != (bucket, key):
+            return self.error(404, 'NoSuchUpload')
+        parts_dir = os.path.join(self.server.data, '.uploads', upload_id)
+        numbers = [int(element.text) for element in ElementTree.fromstring(self.body).iter()
+                   if element.tag.rsplit('}', 1)[-1] == 'PartNumber']
+        paths = [os.path.join(parts_dir, f'{number:05d}') for number in numbers]
+        if not numbers or numbers != sorted(numbers) or not all(os.path.exists(path) for path in paths):
+            return self.error(400, 'InvalidPart')
+        etag = self.store(bucket, key, paths)
+        self.finish_upload(upload_id)
+        self.xml(200, 'CompleteMultipartUploadResult', [('Bucket', bucket), ('Key', key), ('ETag', etag)])
+
+    def abort_upload(self, bucket, key):
+        self.finish_upload(self.query['uploadId'])
+        self.respond(204)
+
+    def finish_upload(self, upload_id):
+        with self.server.lock:
+            self.server.uploads.pop(upload_id, None)
+        shutil.rmtree(os.path.join(self.server.data, '.uploads', upload_id), ignore_errors=True)
+
+def create_server(host, port, data, buckets=('documents',), access_key='bench', secret_key='benchsecret',
+                  verbose=False):
+    """Server bound to host:port (0 picks a free port), ready for serve_forever()"""
+    server = ThreadingHTTPServer((host, port), S3Handler)
+    server.daemon_threads = True
+    server.data = os.path.abspath(data)
+    server.buckets = set(buckets)
+    server.access_key = access_key
+    server.secret_key = secret_key
+    server.verbose = verbose
+    server.metadata = {}
+    server.uploads = {}
+    server.lock = threading.Lock()
+    for bucket in server.buckets:
+        os.makedirs(os.path.join(server.data, bucket), exist_ok=True)
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local S3-compatible stand-in for the document storage backend')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--data', default='bench/s3data', help='directory holding bucket contents')
+    parser.add_argument('--bucket', action='append', default=None, help='bucket to serve; repeat for several')
+    parser.add_argument('--access-key', default='bench')
+    parser.add_argument('--secret-key', default='benchsecret')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, args.data, args.bucket or ['documents'],
+                           args.access_key, args.secret_key, args.verbose)
+    print(f'Serving buckets {", ".join(sorted(server.buckets))} from {server.data} on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
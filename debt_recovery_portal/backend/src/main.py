@@ -9,11 +9,33 @@ from src.models.user import db
 from src.models.case import Case
 from src.models.document import Document
 from src.models.ticket import Ticket
+from src.models.change_log import ChangeLog
+from src.models.archive import ArchivedCase, ArchivedTicket, ArchivedDocument
+from src.models.debtor import DebtorName, DebtorTrigram
+from src.models.sla_breach import SlaBreach
+from src.models.replication import ReplicationHeartbeat
+from src.models.idempotency import IdempotencyKey
+from src.models.schema import add_missing_columns, rebuild_autoincrement_tables
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.cases import cases_bp
 from src.routes.tickets import tickets_bp
 from src.routes.documents import documents_bp
+from src.routes.changes import changes_bp
+from src.routes.metrics import metrics_bp
+from src.routes.batch import batch_bp
+from src.routes.reports import reports_bp
+from src.services.metrics import init_metrics
+from src.services.query_debug import init_query_debug
+from src.services.interest import accrue_interest_command
+from src.services.aging import aging_report_command
+from src.services.archive import archive_cases_command, purge_cases_command
+from src.services.debtors import cluster_debtors_command
+from src.services.sla import sla_scheduler_command
+from src.services.db_routing import init_db_routing, replicate_sqlite_command, replication_heartbeat_command
+from src.services.idempotency import purge_idempotency_keys_command
+from src.services.reconcile import reconcile_documents_command
+from src.services.storage import init_storage, sync_storage_command
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
@@ -28,15 +50,60 @@ app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(cases_bp, url_prefix='/api')
 app.register_blueprint(tickets_bp, url_prefix='/api')
 app.register_blueprint(documents_bp, url_prefix='/api')
+app.register_blueprint(changes_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
+app.register_blueprint(batch_bp, url_prefix='/api')
+app.register_blueprint(reports_bp, url_prefix='/api')
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'SQLALCHEMY_DATABASE_URI',
+    f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Optional read replicas, comma separated; reads fall back to the primary when they lag
+app.config['SQLALCHEMY_REPLICA_URIS'] = [uri for uri in os.environ.get('SQLALCHEMY_REPLICA_URIS', '').split(',') if uri]
+app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 5))
+# Seconds between heartbeats each app process stamps for lag checks; 0 when `flask replication-heartbeat` runs instead
+app.config['REPLICA_HEARTBEAT_INTERVAL'] = float(os.environ.get('REPLICA_HEARTBEAT_INTERVAL', 1))
 db.init_app(app)
 
+# Document file storage: local (sharded directories under STORAGE_ROOT) or an S3-compatible bucket
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+app.config['STORAGE_ROOT'] = os.environ.get('STORAGE_ROOT', 'uploads')
+for setting in ('ENDPOINT', 'BUCKET', 'REGION', 'PREFIX', 'ACCESS_KEY', 'SECRET_KEY'):
+    app.config[f'STORAGE_S3_{setting}'] = os.environ.get(f'STORAGE_S3_{setting}')
+app.config['STORAGE_URL_EXPIRY'] = int(os.environ.get('STORAGE_URL_EXPIRY', 300))
+init_storage(app)
+
+# Send GET requests and report jobs to read replicas, writes to the primary
+init_db_routing(app, db, ReplicationHeartbeat.__table__)
+
+# Request latency and SQL instrumentation for /api/metrics; scrapers authenticate with this bearer token
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+init_metrics(app, db)
+
+# N+1 detection, slow-query log and query budgets (debug/testing only)
+init_query_debug(app)
+
+# Maintenance jobs, run with `flask --app src.main <command>`
+app.cli.add_command(accrue_interest_command)
+app.cli.add_command(aging_report_command)
+app.cli.add_command(archive_cases_command)
+app.cli.add_command(purge_cases_command)
+app.cli.add_command(cluster_debtors_command)
+app.cli.add_command(sla_scheduler_command)
+app.cli.add_command(replicate_sqlite_command)
+app.cli.add_command(replication_heartbeat_command)
+app.cli.add_command(purge_idempotency_keys_command)
+app.cli.add_command(reconcile_documents_command)
+app.cli.add_command(sync_storage_command)
+
 # Create tables and seed data
 with app.app_context():
     db.create_all()
+    add_missing_columns(db.engine, db.metadata)
+    rebuild_autoincrement_tables(db.engine, db.metadata, app.logger)
     
     # Create default admin user if it doesn't exist
     from src.models.user import User
@@ -0,0 +1,71 @@
+from datetime import datetime
+from src.models.user import db
+from src.models.case import Case
+from src.models.ticket import Ticket
+from src.models.document import Document
+
+def archive_table(name, source, *extra):
+    """Cold copy of a hot table: same columns, but no foreign keys, defaults or id generation.
+
+    Rows keep their original ids so archived records can be looked up by the
+    same id they had while hot.
+    """
+    columns = [
+        db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                  autoincrement=False,
+                  server_default=column.server_default.arg if column.server_default is not None else None)
+        for column in source.columns
+    ]
+    return db.Table(name, db.metadata, *columns,
+                    db.Column('archived_at', db.DateTime, default=datetime.utcnow, nullable=False, index=True),
+                    *extra)
+
+class ArchivedCase(db.Model):
+    """Read-only copy of a settled case moved out of the hot table by the archive-cases job"""
+    __table__ = archive_table('case_archive', Case.__table__)
+
+    client = db.relationship('User', primaryjoin='foreign(ArchivedCase.client_id) == User.id', viewonly=True)
+    assigned_staff = db.relationship('User', primaryjoin='foreign(ArchivedCase.assigned_staff_id) == User.id',
+                                     viewonly=True)
+    documents = db.relationship('ArchivedDocument', primaryjoin='foreign(ArchivedDocument.case_id) == ArchivedCase.id',
+                                viewonly=True, lazy=True)
+    tickets = db.relationship('ArchivedTicket', primaryjoin='foreign(ArchivedTicket.case_id) == ArchivedCase.id',
+                              viewonly=True, lazy=True)
+
+    def __repr__(self):
+        return f'<ArchivedCase {self.title}>'
+
+    def to_dict(self):
+        data = Case.to_dict(self)
+        data['archived_at'] = self.archived_at.isoformat() if self.archived_at else None
+        return data
+
+    def to_dict_client_view(self):
+        data = Case.to_dict_client_view(self)
+        data['archived_at'] = self.archived_at.isoformat() if self.archived_at else None
+        return data
+
+class ArchivedTicket(db.Model):
+    __table__ = archive_table('ticket_archive', Ticket.__table__, db.Index('ix_ticket_archive_case_id', 'case_id'))
+
+    created_by = db.relationship('User', primaryjoin='foreign(ArchivedTicket.created_by_id) == User.id', viewonly=True)
+    assigned_to = db.relationship('User', primaryjoin='foreign(ArchivedTicket.assigned_to_id) == User.id', viewonly=True)
+
+    def __repr__(self):
+        return f'<ArchivedTicket {self.ticket_id}>'
+
+    def to_dict(self):
+        return Ticket.to_dict(self)
+
+class ArchivedDocument(db.Model):
+    __table__ = archive_table('document_archive', Document.__table__, db.Index('ix_document_archive_case_id', 'case_id'),
+                              db.Index('ix_document_archive_file_path', 'file_path'))
+
+    uploaded_by = db.relationship('User', primaryjoin='foreign(ArchivedDocument.uploaded_by_id) == User.id',
+                                  viewonly=True)
+
+    def __repr__(self):
+        return f'<ArchivedDocument {self.original_filename}>'
+
+    def to_dict(self):
+        return Document.to_dict(self)
@@ -3,16 +3,27 @@ from datetime import datetime
 from src.models.user import db
 
 class Case(db.Model):
+    # Ids must never be reused once rows move to the archive tables
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
     amount_owed = db.Column(db.Float, nullable=False)
     debtor_company = db.Column(db.String(200), nullable=False)
     debtor_contact = db.Column(db.String(200), nullable=True)
-    status = db.Column(db.String(50), default='Open', nullable=False)  # Open, In Progress, Resolved, Closed
+    debtor_key = db.Column(db.String(200), nullable=True, index=True)  # normalized debtor_company, see services/debtors.py
+    status = db.Column(db.String(50), default='Open', nullable=False, index=True)  # Open, In Progress, Resolved, Closed
     priority = db.Column(db.String(20), default='Medium', nullable=False)  # Low, Medium, High, Critical
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Interest accrual, recomputed in bulk by the accrue-interest job
+    interest_rate = db.Column(db.Float, nullable=True)  # annual rate in percent
+    accrued_interest = db.Column(db.Float, default=0, server_default='0', nullable=False)
+    total_amount_due = db.Column(db.Float, nullable=True)  # amount_owed + accrued_interest
+    original_due_date = db.Column(db.Date, nullable=True)  # accrual starts here, else at created_at
+    interest_accrued_to = db.Column(db.Date, nullable=True)  # as-of date of the last recompute
     
     # Foreign keys
     client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -39,6 +50,11 @@ class Case(db.Model):
             'priority': self.priority,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'interest_rate': self.interest_rate,
+            'accrued_interest': self.accrued_interest,
+            'total_amount_due': self.total_amount_due,
+            'original_due_date': self.original_due_date.isoformat() if self.original_due_date else None,
+            'interest_accrued_to': self.interest_accrued_to.isoformat() if self.interest_accrued_to else None,
             'client_id': self.client_id,
             'assigned_staff_id': self.assigned_staff_id,
             'client': self.client.to_dict() if self.client else None,
@@ -54,6 +70,8 @@ class Case(db.Model):
             'title': self.title,
             'description': self.description,
             'amount_owed': self.amount_owed,
+            'accrued_interest': self.accrued_interest,
+            'total_amount_due': self.total_amount_due,
             'debtor_company': self.debtor_company,
             'status': self.status,
             'priority': self.priority,
@@ -0,0 +1,68 @@
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models.user import db
+
+class ChangeLog(db.Model):
+    """Append-only log of inserts, updates and deletes on synced entities.
+
+    The autoincrement id is the sync cursor: it only ever grows, so clients
+    can ask for everything after the last id they have seen.
+    """
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # case, ticket, document
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # insert, update, delete, archive
+    # Client who may see the entity (case client / ticket creator); None means staff only
+    owner_id = db.Column(db.Integer, nullable=True, index=True)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.id} {self.action} {self.entity_type}:{self.entity_id}>'
+
+    def to_dict(self):
+        return {
+            'cursor': self.id,
+            'entity_type': self.entity_type,
+            'entity_id': self.entity_id,
+            'action': self.action,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None
+        }
+
+# Models tracked by the change feed: class name -> (entity_type, owner attribute)
+TRACKED_ENTITIES = {
+    'Case': ('case', 'client_id'),
+    'Ticket': ('ticket', 'created_by_id'),
+    'Document': ('document', None),
+}
+
+def _change_row(obj, action, now):
+    entity_type, owner_attr = TRACKED_ENTITIES[type(obj).__name__]
+    return {
+        'entity_type': entity_type,
+        'entity_id': obj.id,
+        'action': action,
+        'owner_id': getattr(obj, owner_attr) if owner_attr else None,
+        'changed_at': now
+    }
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    """Write a change log row for every tracked object touched by the flush"""
+    now = datetime.utcnow()
+    rows = []
+    for obj in session.new:
+        if type(obj).__name__ in TRACKED_ENTITIES:
+            rows.append(_change_row(obj, 'insert', now))
+    for obj in session.dirty:
+        if type(obj).__name__ in TRACKED_ENTITIES and session.is_modified(obj, include_collections=False):
+            rows.append(_change_row(obj, 'update', now))
+    for obj in session.deleted:
+        if type(obj).__name__ in TRACKED_ENTITIES and inspect(obj).has_identity:
+            rows.append(_change_row(obj, 'delete', now))
+
+    if rows:
+        # Executed on the flush connection so the log commits or rolls back with the change
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
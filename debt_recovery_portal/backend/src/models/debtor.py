@@ -0,0 +1,17 @@
+from src.models.user import db
+
+class DebtorName(db.Model):
+    """A distinct normalized debtor company name; cases reference it through Case.debtor_key"""
+    key = db.Column(db.String(200), primary_key=True)
+    trigram_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<DebtorName {self.key}>'
+
+class DebtorTrigram(db.Model):
+    """Posting list of the trigram index: which debtor names contain each trigram"""
+    trigram = db.Column(db.String(3), primary_key=True)
+    debtor_key = db.Column(db.String(200), primary_key=True)
+
+    def __repr__(self):
+        return f'<DebtorTrigram {self.trigram!r} {self.debtor_key}>'
@@ -3,10 +3,13 @@ from datetime import datetime
 from src.models.user import db
 
 class Document(db.Model):
+    # Ids must never be reused once rows move to the archive tables
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False, index=True)
     file_size = db.Column(db.Integer, nullable=False)  # in bytes
     mime_type = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
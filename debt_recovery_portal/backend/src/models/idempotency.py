@@ -0,0 +1,21 @@
+from datetime import datetime
+from src.models.user import db
+
+class IdempotencyKey(db.Model):
+    """A client's Idempotency-Key, the request it was first sent with and the response to replay"""
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.status}>'
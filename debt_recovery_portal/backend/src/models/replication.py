@@ -0,0 +1,15 @@
+import time
+from src.models.user import db
+
+class ReplicationHeartbeat(db.Model):
+    """Single row stamped on the primary; how old it is on a replica is that replica's lag"""
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.Float, nullable=False)  # unix time
+
+    def __repr__(self):
+        return f'<ReplicationHeartbeat {self.beat_at}>'
+
+def write_heartbeat():
+    """Stamp the heartbeat on the primary; whatever replicates the database carries it over"""
+    db.session.merge(ReplicationHeartbeat(id=1, beat_at=time.time()))
+    db.session.commit()
@@ -0,0 +1,93 @@
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+def add_missing_columns(engine, metadata):
+    """Bring existing tables up to date with the models.
+
+    db.create_all() only creates missing tables, so columns and indexes added
+    to a model later never reach a database created before them. New columns
+    must be nullable or carry a server_default for this to work.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} ADD COLUMN {column_ddl}')
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def rebuild_autoincrement_tables(engine, metadata, logger=None):
+    """Rebuild SQLite tables created before their model asked for sqlite_autoincrement.
+
+    Without AUTOINCREMENT SQLite hands out max(id) + 1, so deleting or
+    archiving the newest row frees its id for reuse, and the flag only takes
+    effect when a table is created. The rebuild follows SQLite's documented
+    procedure: create the table afresh from the model, copy the rows, drop the
+    old table, rename, then restore its indexes; all in one transaction.
+    Tables carrying columns the model does not know are left alone.
+    """
+    if engine.dialect.name != 'sqlite':
+        return []
+    preparer = engine.dialect.identifier_preparer
+    rebuilt = []
+    for table in metadata.sorted_tables:
+        if not table.dialect_options['sqlite']['autoincrement']:
+            continue
+        raw = engine.raw_connection()
+        connection = raw.driver_connection
+        isolation_level = connection.isolation_level
+        try:
+            # Manual transaction control, so the whole rebuild commits or rolls back together
+            connection.isolation_level = None
+            connection.execute('PRAGMA foreign_keys=OFF')
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                done = rebuild_table(connection, table, engine.dialect, preparer, logger)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            if done:
+                rebuilt.append(table.name)
+        finally:
+            connection.isolation_level = isolation_level
+            raw.close()
+    return rebuilt
+
+def rebuild_table(connection, table, dialect, preparer, logger):
+    ddl = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (table.name,)).fetchone()
+    # Checked inside the write transaction, in case another process got here first
+    if ddl is None or 'AUTOINCREMENT' in ddl[0].upper():
+        return False
+    existing = [row[1] for row in connection.execute(f'PRAGMA table_info({preparer.quote(table.name)})')]
+    unknown = set(existing) - set(table.columns.keys())
+    if unknown:
+        if logger is not None:
+            logger.warning('Not rebuilding %s for AUTOINCREMENT: unknown columns %s', table.name, sorted(unknown))
+        return False
+
+    quoted = preparer.quote(table.name)
+    staging = preparer.quote(f'_rebuild_{table.name}')
+    indexes = [row[0] for row in connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table.name,))]
+    create = str(CreateTable(table).compile(dialect=dialect)).strip()
+    create = create.replace(f'CREATE TABLE {quoted}', f'CREATE TABLE {staging}', 1)
+    columns = ', '.join(preparer.quote(name) for name in existing)
+
+    connection.execute(f'DROP TABLE IF EXISTS {staging}')
+    connection.execute(create)
+    connection.execute(f'INSERT INTO {staging} ({columns}) SELECT {columns} FROM {quoted}')
+    connection.execute(f'DROP TABLE {quoted}')
+    connection.execute(f'ALTER TABLE {staging} RENAME TO {quoted}')
+    for index_ddl in indexes:
+        connection.execute(index_ddl)
+    if logger is not None:
+        logger.info('Rebuilt %s with AUTOINCREMENT', table.name)
+    return True
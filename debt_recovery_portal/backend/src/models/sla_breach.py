@@ -0,0 +1,34 @@
+from datetime import datetime
+from src.models.user import db
+
+class SlaBreach(db.Model):
+    """A missed response or resolution target and what the SLA scheduler did about it"""
+    __table_args__ = (db.Index('ix_sla_breach_entity', 'entity_type', 'entity_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # case, ticket
+    entity_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # response, resolution
+    priority = db.Column(db.String(20), nullable=False)  # priority the target was measured against
+    deadline = db.Column(db.DateTime, nullable=False)
+    breached_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # escalated, reassigned, none
+    new_priority = db.Column(db.String(20), nullable=True)
+    reassigned_to_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    def __repr__(self):
+        return f'<SlaBreach {self.entity_type}:{self.entity_id} {self.kind}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entity_type': self.entity_type,
+            'entity_id': self.entity_id,
+            'kind': self.kind,
+            'priority': self.priority,
+            'deadline': self.deadline.isoformat() if self.deadline else None,
+            'breached_at': self.breached_at.isoformat() if self.breached_at else None,
+            'action': self.action,
+            'new_priority': self.new_priority,
+            'reassigned_to_id': self.reassigned_to_id
+        }
@@ -4,11 +4,14 @@ from src.models.user import db
 import uuid
 
 class Ticket(db.Model):
+    # Ids must never be reused once rows move to the archive tables
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     ticket_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(50), default='Received', nullable=False)  # Received, In Review, Ongoing, Resolved
+    status = db.Column(db.String(50), default='Received', nullable=False, index=True)  # Received, In Review, Ongoing, Resolved
     priority = db.Column(db.String(20), default='Medium', nullable=False)  # Low, Medium, High, Critical
     category = db.Column(db.String(100), nullable=True)  # AI-powered categorization
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
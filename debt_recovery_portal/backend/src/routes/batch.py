@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, current_app, g, jsonify, request, session
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from src.models.user import User
+from src.services.db_routing import ROUTE_HEADER, choose_route
+
+batch_bp = Blueprint('batch', __name__)
+
+MAX_SUB_REQUESTS = 25
+MAX_PARALLEL = 4
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+# Sub-requests cannot change the caller's session, so these make no sense in a batch
+BLOCKED_ENDPOINTS = {'auth.login', 'auth.logout', 'auth.register', 'batch.batch'}
+
+def get_current_user():
+    """Helper function to get current user from session"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    return User.query.get(user_id)
+
+def build_environ(sub_request):
+    """WSGI environ for a sub-request, carrying the caller's cookies and database route override"""
+    headers = {'Cookie': request.headers.get('Cookie', '')}
+    if ROUTE_HEADER in request.headers:
+        headers[ROUTE_HEADER] = request.headers[ROUTE_HEADER]
+    builder = EnvironBuilder(
+        path=sub_request['path'],
+        base_url=request.host_url,
+        method=sub_request['method'],
+        json=sub_request.get('body'),
+        headers=headers,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+def response_entry(sub_request, response):
+    entry = {'id': sub_request.get('id'), 'status': response.status_code}
+    if response.is_json:
+        entry['body'] = response.get_json(silent=True)
+    elif response.mimetype and response.mimetype.startswith('text/'):
+        entry['body'] = response.get_data(as_text=True)
+    else:
+        entry['body'] = None
+        entry['error'] = 'Binary responses are not supported in a batch'
+    response.close()
+    return entry
+
+def dispatch(app, environ, sub_request):
+    """Run one sub-request through routing and its view inside the current app context.
+
+    before/after_request hooks are skipped on purpose: the batch request itself
+    is what gets timed and counted, and no sub-request may touch the session.
+    The read-replica route is the exception; it is chosen per sub-request from
+    its own method, since the batch itself is always a POST.
+    """
+    outer_route = g.get('db_route')
+    with app.request_context(environ):
+        if request.endpoint in BLOCKED_ENDPOINTS:
+            return {'id': sub_request.get('id'), 'status': 400,
+                    'body': {'error': 'Endpoint not allowed in a batch'}}
+        if 'db_router' in app.extensions:
+            choose_route()
+        try:
+            try:
+                response = app.make_response(app.dispatch_request())
+            except HTTPException as e:
+                response = e.get_response()
+            except Exception as e:
+                app.logger.exception('Batch sub-request %s %s failed', sub_request['method'], sub_request['path'])
+                return {'id': sub_request.get('id'), 'status': 500, 'body': {'error': 'Sub-request failed'}}
+            return response_entry(sub_request, response)
+        finally:
+            # Sequential sub-requests share the batch's app context, and so its g
+            g.db_route = outer_route
+
+def dispatch_isolated(app, environ, sub_request):
+    """Parallel variant: each worker thread needs its own app context and DB session"""
+    with app.app_context():
+        return dispatch(app, environ, sub_request)
+
+def validate(sub_requests):
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return 'requests must be a non-empty list'
+    if len(sub_requests) > MAX_SUB_REQUESTS:
+        return f'At most {MAX_SUB_REQUESTS} requests per batch'
+    for sub_request in sub_requests:
+        if not isinstance(sub_request, dict) or not isinstance(sub_request.get('path'), str):
+            return 'Each request needs a path'
+        sub_request['method'] = str(sub_request.get('method', 'GET')).upper()
+        if sub_request['method'] not in ALLOWED_METHODS:
+            return f"Method {sub_request['method']} not allowed in a batch"
+        if not sub_request['path'].startswith('/api/'):
+            return 'Only /api/ paths can be batched'
+    return None
+
+@batch_bp.route('/batch', methods=['POST'])
+def batch():
+    """Run several API calls in one round trip under a single authentication pass"""
+    current_user = get_current_user()
+    if not current_user or not current_user.is_active:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    data = request.json or {}
+    sub_requests = data.get('requests')
+    error = validate(sub_requests)
+    if error:
+        return jsonify({'error': error}), 400
+
+    app = current_app._get_current_object()
+    environs = [build_environ(sub_request) for sub_request in sub_requests]
+    read_only = all(sub_request['method'] == 'GET' for sub_request in sub_requests)
+
+    if data.get('parallel') and read_only and len(sub_requests) > 1:
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(sub_requests))) as executor:
+            responses = list(executor.map(
+                lambda pair: dispatch_isolated(app, *pair), zip(environs, sub_requests)))
+    else:
+        # Sequential sub-requests share this request's DB session: the session
+        # user is loaded once and later lookups hit the identity map
+        responses = [dispatch(app, environ, sub_request)
+                     for environ, sub_request in zip(environs, sub_requests)]
+
+    return jsonify({'responses': responses}), 200
@@ -1,12 +1,25 @@
 from flask import Blueprint, jsonify, request, session
+from sqlalchemy.orm import joinedload, subqueryload
 from src.models.user import User, db
 from src.models.case import Case
 from src.models.document import Document
+from src.models.archive import ArchivedCase, ArchivedDocument
+from src.services.debtors import DEFAULT_THRESHOLD, normalize_debtor, similar_names
+from src.services.idempotency import idempotent
+from src.services.query_debug import query_budget
 from datetime import datetime
+import math
 import random
 
 cases_bp = Blueprint('cases', __name__)
 
+MAX_RELATED_CASES = 200
+
+def with_case_relations(query):
+    """Load everything Case.to_dict touches up front, so a list costs a fixed number of queries"""
+    return query.options(joinedload(Case.client), joinedload(Case.assigned_staff),
+                         subqueryload(Case.documents), subqueryload(Case.tickets))
+
 def get_current_user():
     """Helper function to get current user from session"""
     user_id = session.get('user_id')
@@ -14,6 +27,21 @@ def get_current_user():
         return None
     return User.query.get(user_id)
 
+def parse_due_date(value):
+    """Parse an ISO date (YYYY-MM-DD); None and '' clear the due date"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def parse_interest_rate(value):
+    """Annual rate in percent; None clears it, negative or non-finite rates are rejected"""
+    if value is None:
+        return None
+    rate = float(value)
+    if not math.isfinite(rate) or rate < 0:
+        raise ValueError('interest_rate must be zero or more')
+    return rate
+
 def assign_case_to_staff(case):
     """Auto-assign case to available staff member"""
     # Get all active staff members
@@ -26,6 +54,7 @@ def assign_case_to_staff(case):
     return None
 
 @cases_bp.route('/cases', methods=['GET'])
+@query_budget(4)
 def get_cases():
     current_user = get_current_user()
     if not current_user:
@@ -35,11 +64,11 @@ def get_cases():
         # Filter cases based on user role
         if current_user.role == 'client':
             # Clients can only see their own cases
-            cases = Case.query.filter_by(client_id=current_user.id).all()
+            cases = Case.query.options(joinedload(Case.assigned_staff)).filter_by(client_id=current_user.id).all()
             return jsonify([case.to_dict_client_view() for case in cases]), 200
         elif current_user.role in ['staff', 'legal', 'admin']:
             # Staff, legal, and admin can see all cases
-            cases = Case.query.all()
+            cases = with_case_relations(Case.query).all()
             return jsonify([case.to_dict() for case in cases]), 200
         else:
             return jsonify({'error': 'Unauthorized'}), 403
@@ -48,6 +77,7 @@ def get_cases():
         return jsonify({'error': 'Failed to fetch cases'}), 500
 
 @cases_bp.route('/cases', methods=['POST'])
+@idempotent
 def create_case():
     current_user = get_current_user()
     if not current_user:
@@ -62,6 +92,11 @@ def create_case():
             if not data.get(field):
                 return jsonify({'error': f'{field} is required'}), 400
         
+        try:
+            original_due_date = parse_due_date(data.get('original_due_date'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'original_due_date must be YYYY-MM-DD'}), 400
+
         # Create new case
         case = Case(
             title=data['title'],
@@ -70,7 +105,10 @@ def create_case():
             debtor_company=data['debtor_company'],
             debtor_contact=data.get('debtor_contact'),
             client_id=current_user.id,
-            priority=data.get('priority', 'Medium')
+            priority=data.get('priority', 'Medium'),
+            interest_rate=parse_interest_rate(data.get('interest_rate')),
+            original_due_date=original_due_date,
+            total_amount_due=float(data['amount_owed'])
         )
         
         # Auto-assign to staff
@@ -88,7 +126,7 @@ def create_case():
         }), 201
         
     except ValueError:
-        return jsonify({'error': 'Invalid amount_owed value'}), 400
+        return jsonify({'error': 'Invalid amount_owed or interest_rate value; interest_rate must be zero or more'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create case'}), 500
@@ -100,7 +138,10 @@ def get_case(case_id):
         return jsonify({'error': 'Authentication required'}), 401
     
     try:
-        case = Case.query.get_or_404(case_id)
+        # Settled cases may have moved to the archive; serve them from there read-only
+        case = Case.query.get(case_id) or ArchivedCase.query.get(case_id)
+        if case is None:
+            return jsonify({'error': 'Case not found'}), 404
         
         # Check permissions
         if current_user.role == 'client' and case.client_id != current_user.id:
@@ -142,6 +183,10 @@ def update_case(case_id):
             case.assigned_staff_id = data['assigned_staff_id']
         if 'debtor_contact' in data:
             case.debtor_contact = data['debtor_contact']
+        if 'interest_rate' in data:
+            case.interest_rate = parse_interest_rate(data['interest_rate'])
+        if 'original_due_date' in data:
+            case.original_due_date = parse_due_date(data['original_due_date'])
         
         case.updated_at = datetime.utcnow()
         db.session.commit()
@@ -151,18 +196,25 @@ def update_case(case_id):
             'case': case.to_dict()
         }), 200
         
+    except (TypeError, ValueError):
+        db.session.rollback()
+        return jsonify({'error': 'Invalid interest_rate or original_due_date value; interest_rate must be zero or more'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update case'}), 500
 
 @cases_bp.route('/cases/<int:case_id>/documents', methods=['GET'])
+@query_budget(4)
 def get_case_documents(case_id):
     current_user = get_current_user()
     if not current_user:
         return jsonify({'error': 'Authentication required'}), 401
     
     try:
-        case = Case.query.get_or_404(case_id)
+        # Archived cases keep their documents in the archive table
+        case = Case.query.get(case_id) or ArchivedCase.query.get(case_id)
+        if case is None:
+            return jsonify({'error': 'Case not found'}), 404
         
         # Check permissions
         if current_user.role == 'client':
@@ -173,7 +225,8 @@ def get_case_documents(case_id):
         
         # Staff, legal, and admin can see documents
         if current_user.role in ['staff', 'legal', 'admin']:
-            documents = Document.query.filter_by(case_id=case_id).all()
+            model = ArchivedDocument if isinstance(case, ArchivedCase) else Document
+            documents = model.query.options(joinedload(model.uploaded_by)).filter_by(case_id=case_id).all()
             return jsonify([doc.to_dict() for doc in documents]), 200
         
         return jsonify({'error': 'Unauthorized'}), 403
@@ -181,7 +234,66 @@ def get_case_documents(case_id):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch documents'}), 500
 
+@cases_bp.route('/cases/<int:case_id>/related-debtors', methods=['GET'])
+def get_related_debtors(case_id):
+    """Other cases whose debtor looks like this case's debtor, grouped by spelling"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    if current_user.role not in ['staff', 'legal', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        threshold = float(request.args.get('threshold', DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({'error': 'threshold must be a number'}), 400
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'threshold must be between 0 and 1'}), 400
+    
+    # Looked up outside the try so an unknown case is a 404, not a failed search
+    case = Case.query.get_or_404(case_id)
+    
+    try:
+        debtor_key = case.debtor_key or normalize_debtor(case.debtor_company)
+        similarity = dict(similar_names(debtor_key, threshold))
+        similarity.setdefault(debtor_key, 1.0)
+        
+        related = Case.query.options(joinedload(Case.client)) \
+            .filter(Case.debtor_key.in_(list(similarity)), Case.id != case_id) \
+            .order_by(Case.id).limit(MAX_RELATED_CASES + 1).all()
+        
+        matches = {}
+        for other in related[:MAX_RELATED_CASES]:
+            match = matches.setdefault(other.debtor_key, {
+                'debtor_key': other.debtor_key,
+                'similarity': similarity[other.debtor_key],
+                'cases': []
+            })
+            match['cases'].append({
+                'id': other.id,
+                'title': other.title,
+                'debtor_company': other.debtor_company,
+                'status': other.status,
+                'amount_owed': other.amount_owed,
+                'client_id': other.client_id,
+                'client_company': other.client.company if other.client else None,
+                'assigned_staff_id': other.assigned_staff_id
+            })
+        
+        return jsonify({
+            'case_id': case.id,
+            'debtor_company': case.debtor_company,
+            'debtor_key': debtor_key,
+            'matches': sorted(matches.values(), key=lambda match: (-match['similarity'], match['debtor_key'])),
+            'has_more': len(related) > MAX_RELATED_CASES
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to find related debtors'}), 500
+
 @cases_bp.route('/my-cases', methods=['GET'])
+@query_budget(4)
 def get_my_cases():
     """Get cases assigned to current user (for staff)"""
     current_user = get_current_user()
@@ -192,7 +304,7 @@ def get_my_cases():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        cases = Case.query.filter_by(assigned_staff_id=current_user.id).all()
+        cases = with_case_relations(Case.query).filter_by(assigned_staff_id=current_user.id).all()
         return jsonify([case.to_dict() for case in cases]), 200
         
     except Exception as e:
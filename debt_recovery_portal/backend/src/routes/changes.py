@@ -0,0 +1,100 @@
+from flask import Blueprint, jsonify, request, session
+from src.models.user import User
+from src.models.case import Case
+from src.models.ticket import Ticket
+from src.models.document import Document
+from src.models.change_log import ChangeLog
+
+changes_bp = Blueprint('changes', __name__)
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+# Actions after which the record is no longer in the hot tables
+REMOVAL_ACTIONS = ('delete', 'archive')
+
+def get_current_user():
+    """Helper function to get current user from session"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    return User.query.get(user_id)
+
+def visible_changes(current_user):
+    """Change log query limited to what the user is allowed to see"""
+    query = ChangeLog.query
+    if current_user.role == 'client':
+        # Clients only sync their own cases and tickets, never documents
+        query = query.filter(
+            ChangeLog.owner_id == current_user.id,
+            ChangeLog.entity_type.in_(['case', 'ticket'])
+        )
+    return query
+
+def load_records(entity_type, ids):
+    """Bulk load the current state of changed records, keyed by id"""
+    model = {'case': Case, 'ticket': Ticket, 'document': Document}[entity_type]
+    if not ids:
+        return {}
+    return {record.id: record for record in model.query.filter(model.id.in_(ids)).all()}
+
+def serialize(record, entity_type, current_user):
+    if entity_type == 'case' and current_user.role == 'client':
+        return record.to_dict_client_view()
+    return record.to_dict()
+
+@changes_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Delta sync feed: records changed since ?since=<cursor>, oldest first"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    if current_user.role not in ['client', 'staff', 'legal', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'since and limit must be positive'}), 400
+
+    try:
+        # Fetch one extra row to know whether another page follows
+        entries = visible_changes(current_user).filter(ChangeLog.id > since) \
+            .order_by(ChangeLog.id).limit(limit + 1).all()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        # Collapse repeated changes to the same record, keeping the latest one
+        latest = {}
+        for entry in entries:
+            latest[(entry.entity_type, entry.entity_id)] = entry
+
+        records = {}
+        for entity_type in ('case', 'ticket', 'document'):
+            ids = [entity_id for (kind, entity_id), entry in latest.items()
+                   if kind == entity_type and entry.action not in REMOVAL_ACTIONS]
+            records[entity_type] = load_records(entity_type, ids)
+
+        changes = []
+        for (entity_type, entity_id), entry in sorted(latest.items(), key=lambda item: item[1].id):
+            change = entry.to_dict()
+            record = records.get(entity_type, {}).get(entity_id)
+            if record is None and entry.action not in REMOVAL_ACTIONS:
+                # Removed by a later change that is past this page
+                change['action'] = 'delete'
+            change['data'] = serialize(record, entity_type, current_user) if record is not None else None
+            changes.append(change)
+
+        next_cursor = entries[-1].id if entries else since
+
+        return jsonify({
+            'changes': changes,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch changes'}), 500
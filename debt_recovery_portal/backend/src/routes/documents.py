@@ -1,18 +1,27 @@
-from flask import Blueprint, jsonify, request, session, send_file
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from src.models.user import User, db
 from src.models.case import Case
 from src.models.document import Document
-import os
+from src.models.archive import ArchivedCase, ArchivedDocument
+from src.services.streaming import ZipEntry, iter_csv, iter_zip
+from src.services.idempotency import idempotent
+from src.services.query_debug import query_budget
+from src.services.storage import get_storage
+import io
 import uuid
 from datetime import datetime
 
 documents_bp = Blueprint('documents', __name__)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+# Formats that are already compressed; deflating them again only burns CPU
+STORED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'docx', 'xlsx', 'zip'}
+BUNDLE_MANIFEST_HEADER = ['document_id', 'bundle_filename', 'original_filename', 'description',
+                          'file_size', 'mime_type', 'uploaded_by', 'uploaded_at', 'status']
 
 def get_current_user():
     """Helper function to get current user from session"""
@@ -26,12 +35,8 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_upload_folder():
-    """Create upload folder if it doesn't exist"""
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-
 @documents_bp.route('/cases/<int:case_id>/documents', methods=['POST'])
+@idempotent
 def upload_document(case_id):
     current_user = get_current_user()
     if not current_user:
@@ -55,41 +60,36 @@ def upload_document(case_id):
         if not allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
         
-        # Create upload folder
-        create_upload_folder()
-        
         # Generate unique filename
         original_filename = secure_filename(file.filename)
         file_extension = original_filename.rsplit('.', 1)[1].lower()
         unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        
-        # Create case-specific folder
-        case_folder = os.path.join(UPLOAD_FOLDER, f"case_{case_id}")
-        if not os.path.exists(case_folder):
-            os.makedirs(case_folder)
-        
-        file_path = os.path.join(case_folder, unique_filename)
+        mime_type = file.content_type or 'application/octet-stream'
         
         # Save file
-        file.save(file_path)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
+        storage = get_storage()
+        file_key = storage.new_key(unique_filename)
+        file_size = storage.save(file_key, file.stream, mime_type)
         
         # Create document record
         document = Document(
             filename=unique_filename,
             original_filename=original_filename,
-            file_path=file_path,
+            file_path=file_key,
             file_size=file_size,
-            mime_type=file.content_type or 'application/octet-stream',
+            mime_type=mime_type,
             description=request.form.get('description', ''),
             case_id=case_id,
             uploaded_by_id=current_user.id
         )
         
         db.session.add(document)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            # Don't leave an orphaned file behind a row that never committed
+            storage.delete(file_key)
+            raise
         
         return jsonify({
             'message': 'Document uploaded successfully',
@@ -107,8 +107,11 @@ def get_document(document_id):
         return jsonify({'error': 'Authentication required'}), 401
     
     try:
-        document = Document.query.get_or_404(document_id)
-        case = Case.query.get(document.case_id)
+        # Documents of archived cases are read from the archive tables
+        document = Document.query.get(document_id) or ArchivedDocument.query.get(document_id)
+        if document is None:
+            return jsonify({'error': 'Document not found'}), 404
+        case = Case.query.get(document.case_id) or ArchivedCase.query.get(document.case_id)
         
         # Check permissions
         if current_user.role == 'client':
@@ -136,17 +139,18 @@ def download_document(document_id):
     if current_user.role not in ['staff', 'legal', 'admin']:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    # Outside the try, so an unknown document is a 404 rather than a download failure
+    document = Document.query.get(document_id) or ArchivedDocument.query.get(document_id)
+    if document is None:
+        return jsonify({'error': 'Document not found'}), 404
+    
     try:
-        document = Document.query.get_or_404(document_id)
-        
-        if not os.path.exists(document.file_path):
-            return jsonify({'error': 'File not found on disk'}), 404
+        # Local storage sends the file; object storage redirects to a pre-signed URL
+        response = get_storage().download(document.file_path, document.original_filename, document.mime_type)
+        if response is None:
+            return jsonify({'error': 'File not found in storage'}), 404
         
-        return send_file(
-            document.file_path,
-            as_attachment=True,
-            download_name=document.original_filename
-        )
+        return response
         
     except Exception as e:
         return jsonify({'error': 'Failed to download document'}), 500
@@ -163,18 +167,96 @@ def delete_document(document_id):
     
     try:
         document = Document.query.get_or_404(document_id)
-        
-        # Delete file from disk
-        if os.path.exists(document.file_path):
-            os.remove(document.file_path)
+        file_key = document.file_path
         
         # Delete database record
         db.session.delete(document)
         db.session.commit()
         
+        # Delete the file only once the row is gone for good
+        get_storage().delete(file_key)
+        
         return jsonify({'message': 'Document deleted successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to delete document'}), 500
 
+
+def bundle_entries(case, documents):
+    """Every document file still in storage, then a manifest of what made it in.
+
+    Whether a file exists is only found out when the archive opens it, so
+    remote storage costs one GET per document and no extra lookups; the
+    manifest therefore goes last.
+    """
+    storage = get_storage()
+    included = set()
+
+    def opener(document):
+        def open_file():
+            try:
+                stream = storage.open(document.file_path)
+            except FileNotFoundError:
+                return None
+            included.add(document.id)
+            return stream
+        return open_file
+
+    def manifest():
+        rows = []
+        for document in documents:
+            uploader = document.uploaded_by
+            present = document.id in included
+            rows.append([
+                document.id, f"{document.id}_{document.original_filename}" if present else '',
+                document.original_filename, document.description or '', document.file_size, document.mime_type,
+                f"{uploader.first_name} {uploader.last_name} ({uploader.username})" if uploader else '',
+                document.uploaded_at.isoformat() if document.uploaded_at else '',
+                'included' if present else 'missing'
+            ])
+        return io.BytesIO(b''.join(iter_csv(BUNDLE_MANIFEST_HEADER, rows)))
+
+    for document in documents:
+        extension = document.original_filename.rsplit('.', 1)[-1].lower()
+        yield ZipEntry(
+            f"case_{case.id}/{document.id}_{document.original_filename}",
+            opener(document),
+            size=document.file_size,
+            modified=document.uploaded_at,
+            compress=extension not in STORED_EXTENSIONS
+        )
+    yield ZipEntry(f"case_{case.id}/manifest.csv", manifest)
+
+@documents_bp.route('/cases/<int:case_id>/bundle.zip', methods=['GET'])
+@query_budget(4)
+def download_case_bundle(case_id):
+    """Stream every document on a case as one ZIP with a manifest"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    # Only staff, legal, and admin can download documents
+    if current_user.role not in ['staff', 'legal', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Outside the try, so an unknown case is a 404 rather than a build failure
+    case = Case.query.get(case_id) or ArchivedCase.query.get(case_id)
+    if case is None:
+        return jsonify({'error': 'Case not found'}), 404
+    try:
+        model = ArchivedDocument if isinstance(case, ArchivedCase) else Document
+        documents = model.query.options(joinedload(model.uploaded_by)) \
+            .filter_by(case_id=case_id).order_by(model.uploaded_at, model.id).all()
+        
+        # Metadata is fully loaded here; the stream only reads files, but keeps the request
+        # context so any statement it does issue still counts against the query budget
+        entries = list(bundle_entries(case, documents))
+        return Response(
+            stream_with_context(iter_zip(entries)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="case_{case_id}_bundle.zip"'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to build case bundle'}), 500
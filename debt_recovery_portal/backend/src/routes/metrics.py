@@ -0,0 +1,31 @@
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request, session
+from src.models.user import User
+from src.services.metrics import render_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+def get_current_user():
+    """Helper function to get current user from session"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    return User.query.get(user_id)
+
+def scraper_token_valid():
+    """Scrapers send METRICS_TOKEN as a bearer token"""
+    token = current_app.config.get('METRICS_TOKEN')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint; open to the scraper token and to admins"""
+    if not scraper_token_valid():
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Unauthorized'}), 401
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+    body = render_metrics(current_app.extensions.get('metrics_db'))
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,64 @@
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from src.models.user import User
+from src.services.aging import GROUP_BY_OPTIONS, aging_summary, render_report
+from src.services.query_debug import query_budget
+from datetime import date, datetime
+
+reports_bp = Blueprint('reports', __name__)
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+def get_current_user():
+    """Helper function to get current user from session"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    return User.query.get(user_id)
+
+@reports_bp.route('/reports/aging', methods=['GET'])
+@query_budget(2)
+def get_aging_report():
+    """Receivables aging by status, assigned staff or client company"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    if current_user.role not in ['staff', 'legal', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    group_by = request.args.get('group_by', 'status')
+    if group_by not in GROUP_BY_OPTIONS:
+        return jsonify({'error': f'group_by must be one of {", ".join(GROUP_BY_OPTIONS)}'}), 400
+
+    output_format = request.args.get('format', 'json')
+    if output_format not in ('json', 'csv', 'xlsx'):
+        return jsonify({'error': 'format must be json, csv or xlsx'}), 400
+
+    detail = request.args.get('detail', '').lower() in ('1', 'true', 'yes')
+    if detail and output_format == 'json':
+        return jsonify({'error': 'Drill-down rows are only available as csv or xlsx'}), 400
+
+    include_settled = request.args.get('include_settled', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        as_of = datetime.strptime(request.args['as_of'], '%Y-%m-%d').date() if request.args.get('as_of') else date.today()
+    except ValueError:
+        return jsonify({'error': 'as_of must be YYYY-MM-DD'}), 400
+
+    try:
+        if output_format == 'json':
+            return jsonify(aging_summary(as_of, group_by, include_settled)), 200
+
+        filename = f"aging_{'detail' if detail else group_by}_{as_of.isoformat()}.{output_format}"
+        chunks = render_report(as_of, group_by, output_format, detail, include_settled)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=EXPORT_MIMETYPES[output_format],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to generate aging report'}), 500
@@ -1,7 +1,10 @@
 from flask import Blueprint, jsonify, request, session
+from sqlalchemy.orm import joinedload
 from src.models.user import User, db
 from src.models.ticket import Ticket
 from src.models.case import Case
+from src.services.idempotency import idempotent
+from src.services.query_debug import query_budget
 from datetime import datetime
 import random
 
@@ -14,6 +17,10 @@ def get_current_user():
         return None
     return User.query.get(user_id)
 
+def with_ticket_users(query):
+    """Join the creator and assignee Ticket.to_dict serializes instead of loading them per row"""
+    return query.options(joinedload(Ticket.created_by), joinedload(Ticket.assigned_to))
+
 def auto_assign_ticket(ticket):
     """Auto-assign ticket to available staff member"""
     # Get all active staff members
@@ -42,6 +49,7 @@ def categorize_ticket(title, description):
         return 'General Inquiry'
 
 @tickets_bp.route('/tickets', methods=['GET'])
+@query_budget(2)
 def get_tickets():
     current_user = get_current_user()
     if not current_user:
@@ -50,10 +58,10 @@ def get_tickets():
     try:
         if current_user.role == 'client':
             # Clients can only see their own tickets
-            tickets = Ticket.query.filter_by(created_by_id=current_user.id).all()
+            tickets = with_ticket_users(Ticket.query).filter_by(created_by_id=current_user.id).all()
         elif current_user.role in ['staff', 'legal', 'admin']:
             # Staff, legal, and admin can see all tickets
-            tickets = Ticket.query.all()
+            tickets = with_ticket_users(Ticket.query).all()
         else:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -63,6 +71,7 @@ def get_tickets():
         return jsonify({'error': 'Failed to fetch tickets'}), 500
 
 @tickets_bp.route('/tickets', methods=['POST'])
+@idempotent
 def create_ticket():
     current_user = get_current_user()
     if not current_user:
@@ -171,6 +180,7 @@ def update_ticket(ticket_id):
         return jsonify({'error': 'Failed to update ticket'}), 500
 
 @tickets_bp.route('/tickets/by-status/<status>', methods=['GET'])
+@query_budget(2)
 def get_tickets_by_status(status):
     current_user = get_current_user()
     if not current_user:
@@ -180,13 +190,14 @@ def get_tickets_by_status(status):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        tickets = Ticket.query.filter_by(status=status).all()
+        tickets = with_ticket_users(Ticket.query).filter_by(status=status).all()
         return jsonify([ticket.to_dict() for ticket in tickets]), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch tickets'}), 500
 
 @tickets_bp.route('/my-tickets', methods=['GET'])
+@query_budget(2)
 def get_my_tickets():
     """Get tickets assigned to current user (for staff)"""
     current_user = get_current_user()
@@ -197,7 +208,7 @@ def get_my_tickets():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        tickets = Ticket.query.filter_by(assigned_to_id=current_user.id).all()
+        tickets = with_ticket_users(Ticket.query).filter_by(assigned_to_id=current_user.id).all()
         return jsonify([ticket.to_dict() for ticket in tickets]), 200
         
     except Exception as e:
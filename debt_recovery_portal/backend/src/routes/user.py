@@ -1,12 +1,73 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, session
 from src.models.user import User, db
+from src.services.user_directory import DEFAULT_LIMIT, MAX_LIMIT, directory
 
 user_bp = Blueprint('user', __name__)
 
+MAX_PAGE_SIZE = 200
+
+def get_current_user():
+    """Helper function to get current user from session"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    return User.query.get(user_id)
+
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    # Pagination is opt-in so existing callers keep getting the plain list
+    if 'page' not in request.args and 'per_page' not in request.args:
+        users = User.query.all()
+        return jsonify([user.to_dict() for user in users])
+
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', 50)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    if page < 1 or per_page < 1:
+        return jsonify({'error': 'page and per_page must be positive'}), 400
+
+    query = User.query.order_by(User.id)
+    if request.args.get('role'):
+        query = query.filter(User.role.in_(request.args['role'].split(',')))
+    total = query.count()
+    users = query.offset((page - 1) * per_page).limit(per_page).all()
+    return jsonify({
+        'users': [user.to_dict() for user in users],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'has_more': page * per_page < total
+    })
+
+@user_bp.route('/users/search', methods=['GET'])
+def search_users():
+    """Typeahead: best matches for ?q= over username, email, name and company"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    # Directory search is for staff pickers and the admin users page
+    if current_user.role not in ['staff', 'legal', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    roles = set(request.args['role'].split(',')) if request.args.get('role') else None
+    active = {'true': True, 'false': False}.get(request.args.get('active', 'true').lower())
+    
+    try:
+        directory.ensure_fresh()
+        user_ids = directory.search(request.args.get('q', ''), roles=roles, active=active, limit=max(limit, 1))
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+        serialize = User.to_dict if current_user.role == 'admin' else User.to_dict_safe
+        return jsonify([serialize(users[user_id]) for user_id in user_ids if user_id in users]), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to search users'}), 500
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
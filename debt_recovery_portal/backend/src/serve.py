@@ -0,0 +1,513 @@
+"""Production server: preforked worker processes sharing one listening socket.
+
+    python -m src.serve --bind 0.0.0.0:5001 --workers 4 --threads 8 --max-requests 10000
+
+The master process binds the socket, forks the workers and supervises them.
+Each worker imports the application itself, runs a health check against it
+and only then starts accepting connections on the shared socket. Requests
+are handled by a fixed thread pool with HTTP/1.1 keep-alive. A worker only
+accepts a connection once one of its threads is free, leaving the rest in
+the shared backlog for other workers; when a connection is waiting and every
+thread is taken, idle keep-alive connections are closed to make room.
+
+Signals sent to the master:
+    SIGHUP           graceful reload: start a new generation of workers, wait
+                     until they pass their health check, then retire the old ones
+    SIGTERM, SIGINT  graceful shutdown: stop accepting, finish in-flight requests
+    SIGQUIT          immediate shutdown
+
+Workers exit after --max-requests requests (plus random jitter) and are
+replaced, which bounds memory growth from fragmentation or slow leaks.
+
+Workers share /api/metrics counters through METRICS_MULTIPROC_DIR (a
+temporary directory unless set). The master empties it at startup and folds
+each exited worker's counts into it, so totals survive recycling and reloads.
+"""
+import argparse
+import importlib
+import os
+import random
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Same path setup as main.py so `python src/serve.py` works from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.wsgi import LimitedStream
+from wsgiref.handlers import SimpleHandler
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+from src.services.metrics import MULTIPROCESS_DIR_ENV, reset_directory, retire_process, shared
+
+HEALTH_CHECK_PATH = '/api/health'
+EXIT_HEALTH_CHECK_FAILED = 3
+MAX_REQUEST_LINE = 65536
+# How long a saturated worker waits for a free thread before checking for shutdown again
+ACCEPT_WAIT = 0.5
+
+def log(message):
+    print(f'[{os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+class KeepAliveServerHandler(SimpleHandler):
+    """wsgiref response writer speaking HTTP/1.1.
+
+    Responses without a Content-Length are delimited by closing the
+    connection, everything else leaves it open for the next request.
+    """
+    http_version = '1.1'
+    # Do not copy the process environment into every WSGI environ
+    os_environ = {}
+    keep_alive = True
+    request_handler = None
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        if not self.keep_alive or 'Content-Length' not in self.headers:
+            self.keep_alive = False
+            self.headers['Connection'] = 'close'
+
+    def close(self):
+        try:
+            if self.request_handler is not None and self.status:
+                self.request_handler.log_request(self.status.split(' ', 1)[0], self.bytes_sent)
+        finally:
+            super().close()
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Serves successive requests on one connection until either side closes it.
+
+    The request body is exposed through a LimitedStream and whatever the app
+    left unread is drained afterwards, so the next request line is found
+    reliably. Idle connections give their thread back after `timeout`, or
+    sooner when the server closes them for a waiting client.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+    access_log = False
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request(idle=True)
+
+    def handle_one_request(self, idle=False):
+        if idle:
+            self.server.idle_connections.add(self.connection)
+        try:
+            self.raw_requestline = self.rfile.readline(MAX_REQUEST_LINE + 1)
+        except (TimeoutError, ConnectionError):
+            self.raw_requestline = b''
+        if idle and not self.server.idle_connections.discard(self.connection):
+            # Closed under us to free this thread; whatever arrived meanwhile is the client's to retry
+            self.raw_requestline = b''
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > MAX_REQUEST_LINE:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            # Chunked request bodies are not supported; every client we serve sends a length
+            self.send_error(411)
+            self.close_connection = True
+            return
+
+        length = self.headers.get('Content-Length', '')
+        body = LimitedStream(self.rfile, int(length) if length.isdigit() else 0)
+        handler = KeepAliveServerHandler(body, self.wfile, self.get_stderr(), self.get_environ(),
+                                         multithread=True, multiprocess=True)
+        handler.keep_alive = not self.close_connection and not self.server.stopping
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+        if handler.keep_alive:
+            body.exhaust()
+        else:
+            self.close_connection = True
+
+    def log_request(self, code='-', size='-'):
+        if self.access_log:
+            super().log_request(code, size)
+
+class IdleConnections:
+    """Connections parked between keep-alive requests, which can be closed to free their threads"""
+
+    def __init__(self):
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def add(self, connection):
+        with self._lock:
+            self._connections.append(connection)
+
+    def discard(self, connection):
+        """Stop tracking the connection; False if it was already closed"""
+        with self._lock:
+            try:
+                self._connections.remove(connection)
+            except ValueError:
+                return False
+            return True
+
+    def close_oldest(self):
+        with self._lock:
+            if not self._connections:
+                return False
+            connection = self._connections.pop(0)
+        try:
+            # The handler's blocked readline sees end of stream and releases its thread
+            connection.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        return True
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI server on an inherited listening socket, handing connections to a fixed thread pool"""
+    stopping = False
+
+    def __init__(self, listen_socket, app, threads):
+        super().__init__(listen_socket.getsockname(), KeepAliveRequestHandler, bind_and_activate=False)
+        # TCPServer opened a socket of its own; serve on the shared one instead
+        self.socket.close()
+        self.socket = listen_socket
+        host, port = listen_socket.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        # One slot per pool thread; a connection is only accepted once it has a thread to run on
+        self.free_threads = threading.BoundedSemaphore(threads)
+        self.idle_connections = IdleConnections()
+
+    def get_request(self):
+        if not self.free_threads.acquire(blocking=False):
+            # Someone is waiting at the socket; a parked keep-alive connection gives up its thread
+            self.idle_connections.close_oldest()
+            if not self.free_threads.acquire(timeout=ACCEPT_WAIT):
+                # Still saturated: leave the connection to another worker and re-check for shutdown
+                raise BlockingIOError('no free request threads')
+        try:
+            return super().get_request()
+        except BaseException:
+            self.free_threads.release()
+            raise
+
+    def process_request(self, request, client_address):
+        try:
+            self.executor.submit(self.process_request_thread, request, client_address)
+        except BaseException:
+            self.free_threads.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free_threads.release()
+
+    def server_close(self):
+        self.executor.shutdown(wait=True)
+        super().server_close()
+
+def load_app(target):
+    """Import 'module:attribute' and return the WSGI application"""
+    module_name, _, attribute = target.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or 'app')
+
+def health_check(app):
+    """Serve one request through the full stack before joining the pool"""
+    try:
+        response = app.test_client().get(HEALTH_CHECK_PATH)
+        return response.status_code == 200
+    except Exception as e:
+        log(f'health check raised {e!r}')
+        return False
+
+def run_worker(listen_socket, ready_fd, options):
+    """Worker process body; never returns"""
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+
+    app = load_app(options.app)
+    if not health_check(app):
+        log('worker failed its startup health check')
+        os._exit(EXIT_HEALTH_CHECK_FAILED)
+
+    handled = [0]
+    lock = threading.Lock()
+    limit = options.max_requests + random.randint(0, options.max_requests_jitter) if options.max_requests else 0
+    stopping = threading.Event()
+
+    def stop(reason):
+        if not stopping.is_set():
+            stopping.set()
+            server.stopping = True
+            log(f'worker stopping: {reason}')
+            # shutdown() blocks until serve_forever returns, so it cannot run on the serving thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def counting_app(environ, start_response):
+        with lock:
+            handled[0] += 1
+            recycle = limit and handled[0] >= limit
+        if recycle:
+            stop(f'recycling after {handled[0]} requests')
+        return app(environ, start_response)
+
+    KeepAliveRequestHandler.access_log = options.access_log
+    KeepAliveRequestHandler.timeout = options.keep_alive
+    server = PooledWSGIServer(listen_socket, counting_app, options.threads)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop('SIGTERM'))
+    signal.signal(signal.SIGINT, lambda signum, frame: stop('SIGINT'))
+
+    os.write(ready_fd, f'{os.getpid()}\n'.encode())
+    os.close(ready_fd)
+
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        # Waits for in-flight requests; the master enforces --graceful-timeout
+        server.server_close()
+        # The master folds this into the totals once it reaps us
+        shared.flush(force=True)
+    os._exit(0)
+
+class Arbiter:
+    """Master process: keeps `workers` healthy workers of the current generation running"""
+
+    def __init__(self, options):
+        self.options = options
+        self.workers = {}  # pid -> {'generation', 'ready', 'started', 'stopping'}
+        self.generation = 0
+        self.reloading = False
+        self.shutting_down = False
+        self.startup_failures = 0
+        self.signals = []
+
+    def bind(self):
+        host, _, port = self.options.bind.rpartition(':')
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host.strip('[]') or '0.0.0.0', int(port)))
+        sock.listen(self.options.backlog)
+        # Non-blocking so a worker that loses the accept() race goes back to select()
+        sock.setblocking(False)
+        sock.set_inheritable(True)
+        return sock
+
+    def bootstrap(self):
+        """Import the app once in a throwaway child so table creation and seeding run exactly once"""
+        pid = os.fork()
+        if pid == 0:
+            try:
+                load_app(self.options.app)
+            except BaseException as e:
+                log(f'application failed to load: {e!r}')
+                os._exit(1)
+            os._exit(0)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status) == 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            os.close(self.ready_read)
+            try:
+                run_worker(self.sock, self.ready_write, self.options)
+            except BaseException as e:
+                log(f'worker crashed: {e!r}')
+            finally:
+                os._exit(1)
+        self.workers[pid] = {'generation': self.generation, 'ready': False,
+                             'started': time.monotonic(), 'stopping': None}
+        return pid
+
+    def stop_worker(self, pid, signum=signal.SIGTERM):
+        worker = self.workers.get(pid)
+        if worker is None:
+            return
+        if worker['stopping'] is None:
+            worker['stopping'] = time.monotonic()
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def current(self, ready=None):
+        return [pid for pid, worker in self.workers.items()
+                if worker['generation'] == self.generation and worker['stopping'] is None
+                and (ready is None or worker['ready'] == ready)]
+
+    def handle_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def process_signals(self):
+        while self.signals:
+            signum = self.signals.pop(0)
+            if signum == signal.SIGHUP and not self.shutting_down:
+                log('reloading: starting a new worker generation')
+                self.generation += 1
+                self.reloading = True
+            elif signum in (signal.SIGTERM, signal.SIGINT):
+                log('graceful shutdown requested')
+                self.shutting_down = True
+                for pid in list(self.workers):
+                    self.stop_worker(pid)
+            elif signum == signal.SIGQUIT:
+                log('immediate shutdown requested')
+                self.shutting_down = True
+                for pid in list(self.workers):
+                    self.stop_worker(pid, signal.SIGKILL)
+
+    def read_ready(self, timeout):
+        try:
+            readable, _, _ = select.select([self.ready_read], [], [], timeout)
+        except InterruptedError:
+            return
+        if not readable:
+            return
+        for line in os.read(self.ready_read, 4096).decode().split():
+            pid = int(line)
+            if pid in self.workers:
+                self.workers[pid]['ready'] = True
+                self.startup_failures = 0
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            try:
+                retire_process(self.metrics_dir, pid)
+            except OSError as e:
+                log(f'could not keep metrics of worker {pid}: {e!r}')
+            code = os.waitstatus_to_exitcode(status)
+            if not worker['ready'] and worker['stopping'] is None:
+                self.startup_failures += 1
+                log(f'worker {pid} exited with {code} before becoming ready')
+            elif worker['stopping'] is None and code != 0:
+                log(f'worker {pid} died with {code}')
+
+    def manage(self):
+        # Old generation retires only once the new one is fully healthy
+        if self.reloading and len(self.current(ready=True)) >= self.options.workers:
+            for pid, worker in list(self.workers.items()):
+                if worker['generation'] < self.generation:
+                    self.stop_worker(pid)
+            self.reloading = False
+            log(f'reload complete: generation {self.generation} serving')
+
+        if self.startup_failures >= 2 * self.options.workers:
+            if self.reloading:
+                log('new generation keeps failing its health check; keeping the old workers')
+                for pid in self.current():
+                    self.stop_worker(pid, signal.SIGKILL)
+                self.generation -= 1
+                self.reloading = False
+                self.startup_failures = 0
+            elif not self.current(ready=True):
+                log('workers keep failing their health check; giving up')
+                self.shutting_down = True
+                return
+
+        if not self.shutting_down:
+            missing = self.options.workers - len(self.current())
+            for _ in range(missing):
+                self.spawn()
+
+        now = time.monotonic()
+        for pid, worker in list(self.workers.items()):
+            if worker['stopping'] is not None and now - worker['stopping'] > self.options.graceful_timeout:
+                log(f'worker {pid} did not stop within {self.options.graceful_timeout}s; killing')
+                self.stop_worker(pid, signal.SIGKILL)
+
+    def shared_metrics_dir(self):
+        """Directory the workers share metrics through, and whether it is ours to remove"""
+        directory = os.environ.get(MULTIPROCESS_DIR_ENV)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            reset_directory(directory)
+            return directory, False
+        directory = tempfile.mkdtemp(prefix='portal-metrics-')
+        os.environ[MULTIPROCESS_DIR_ENV] = directory
+        return directory, True
+
+    def run(self):
+        self.sock = self.bind()
+        self.metrics_dir, owned = self.shared_metrics_dir()
+        try:
+            return self.serve()
+        finally:
+            if owned:
+                shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def serve(self):
+        log(f'listening on {self.options.bind} with {self.options.workers} workers '
+            f'x {self.options.threads} threads')
+        if not self.bootstrap():
+            return 1
+
+        self.ready_read, self.ready_write = os.pipe()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+            signal.signal(signum, self.handle_signal)
+        # Wake select() promptly when a worker exits
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+        while True:
+            self.process_signals()
+            self.reap()
+            if self.shutting_down and not self.workers:
+                break
+            self.manage()
+            self.read_ready(timeout=1.0)
+
+        self.sock.close()
+        log('master exiting')
+        return 0 if self.startup_failures < 2 * self.options.workers else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the API with preforked worker processes')
+    parser.add_argument('--app', default='src.main:app', help='module:attribute of the WSGI app')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5001'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=8, help='request threads per worker')
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--keep-alive', type=float, default=5.0, help='idle keep-alive timeout in seconds')
+    parser.add_argument('--max-requests', type=int, default=10000, help='recycle a worker after this many requests; 0 disables')
+    parser.add_argument('--max-requests-jitter', type=int, default=1000, help='random extra requests so workers do not recycle together')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0, help='seconds a stopping worker may finish in-flight requests')
+    parser.add_argument('--access-log', action='store_true')
+    options = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        parser.error('the preforking server needs a POSIX platform; use `flask run` elsewhere')
+    return Arbiter(options).run()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""Receivables aging: current / 0-30 / 31-60 / 61-90 / 90+ day buckets of amount_owed.
+
+Cases whose due date is still ahead of the as-of date are current rather
+than aged. The summary is one grouped SQL query that buckets and pivots in
+the database, so only one row per group comes back. The drill-down streams
+case rows in id order straight from a server-side cursor, so report size
+does not affect memory. Day arithmetic is compiled per dialect.
+"""
+import sys
+from datetime import date, datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Date, Integer, case as sql_case, func, literal, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.functions import FunctionElement
+from src.models.user import User, db
+from src.models.case import Case
+from src.services.db_routing import replica_reads
+from src.services.streaming import iter_csv, iter_xlsx
+
+BUCKETS = ('current', '0-30', '31-60', '61-90', '90+')
+GROUP_BY_OPTIONS = ('status', 'assigned_staff', 'client_company')
+# Settled cases are no longer receivables
+SETTLED_STATUSES = ('Resolved', 'Closed')
+STREAM_BATCH_SIZE = 1000
+
+DETAIL_HEADER = ['case_id', 'title', 'client_company', 'debtor_company', 'status', 'assigned_staff',
+                 'amount_owed', 'aging_from', 'age_days', 'bucket']
+
+class days_between(FunctionElement):
+    """Whole calendar days from start (a date or datetime) to end (a date); negative when start is later"""
+    type = Integer()
+    name = 'days_between'
+    inherit_cache = True
+
+@compiles(days_between)
+def compile_days_between(element, compiler, **kw):
+    # Standard SQL date subtraction, as PostgreSQL and Oracle evaluate it
+    end, start = (compiler.process(argument, **kw) for argument in element.clauses)
+    return f'(CAST({end} AS DATE) - CAST({start} AS DATE))'
+
+@compiles(days_between, 'sqlite')
+def compile_days_between_sqlite(element, compiler, **kw):
+    end, start = (compiler.process(argument, **kw) for argument in element.clauses)
+    return f'CAST(julianday({end}) - julianday(date({start})) AS INTEGER)'
+
+@compiles(days_between, 'mysql')
+@compiles(days_between, 'mariadb')
+def compile_days_between_mysql(element, compiler, **kw):
+    end, start = (compiler.process(argument, **kw) for argument in element.clauses)
+    return f'DATEDIFF({end}, {start})'
+
+@compiles(days_between, 'mssql')
+def compile_days_between_mssql(element, compiler, **kw):
+    end, start = (compiler.process(argument, **kw) for argument in element.clauses)
+    return f'DATEDIFF(day, {start}, {end})'
+
+def age_days_expression(as_of):
+    """Days since the due date, or since creation for cases without one; negative while not yet due"""
+    aging_from = func.coalesce(Case.original_due_date, Case.created_at)
+    return days_between(literal(as_of, Date), aging_from)
+
+def bucket_expression(age_days):
+    return sql_case(
+        (age_days < 0, BUCKETS[0]),
+        (age_days <= 30, BUCKETS[1]),
+        (age_days <= 60, BUCKETS[2]),
+        (age_days <= 90, BUCKETS[3]),
+        else_=BUCKETS[4]
+    )
+
+def grouping_columns(group_by, client, staff):
+    """(key, label) columns for the requested breakdown"""
+    if group_by == 'status':
+        return Case.status, Case.status
+    if group_by == 'assigned_staff':
+        label = func.coalesce(staff.first_name + ' ' + staff.last_name, 'Unassigned')
+        return Case.assigned_staff_id, label
+    if group_by == 'client_company':
+        company = func.coalesce(client.company, 'No company')
+        return company, company
+    raise ValueError(f'group_by must be one of {", ".join(GROUP_BY_OPTIONS)}')
+
+def outstanding(query, include_settled):
+    if include_settled:
+        return query
+    return query.where(Case.status.notin_(SETTLED_STATUSES))
+
+def aging_summary(as_of, group_by='status', include_settled=False):
+    """Count and amount per bucket for every group, pivoted in a single query"""
+    client = aliased(User)
+    staff = aliased(User)
+    key, label = grouping_columns(group_by, client, staff)
+    bucket = bucket_expression(age_days_expression(as_of))
+
+    pivot = []
+    for name in BUCKETS:
+        pivot.append(func.sum(sql_case((bucket == name, 1), else_=0)))
+        pivot.append(func.sum(sql_case((bucket == name, Case.amount_owed), else_=0)))
+
+    query = select(key, label, *pivot).select_from(Case) \
+        .join(client, Case.client_id == client.id) \
+        .outerjoin(staff, Case.assigned_staff_id == staff.id) \
+        .group_by(key, label).order_by(label)
+    query = outstanding(query, include_settled)
+
+    groups = []
+    totals = {name: {'count': 0, 'amount': 0.0} for name in BUCKETS}
+    for row in db.session.execute(query):
+        buckets = {}
+        for index, name in enumerate(BUCKETS):
+            count, amount = row[2 + 2 * index] or 0, round(row[3 + 2 * index] or 0.0, 2)
+            buckets[name] = {'count': count, 'amount': amount}
+            totals[name]['count'] += count
+            totals[name]['amount'] = round(totals[name]['amount'] + amount, 2)
+        groups.append({
+            'key': row[0],
+            'label': row[1],
+            'buckets': buckets,
+            'total': {'count': sum(b['count'] for b in buckets.values()),
+                      'amount': round(sum(b['amount'] for b in buckets.values()), 2)}
+        })
+
+    return {
+        'as_of': as_of.isoformat(),
+        'group_by': group_by,
+        'buckets': list(BUCKETS),
+        'groups': groups,
+        'totals': totals
+    }
+
+def summary_rows(summary):
+    """Flatten a summary into a header and rows for CSV/XLSX output"""
+    header = [summary['group_by']]
+    for name in BUCKETS:
+        header.extend([f'{name} count', f'{name} amount'])
+    header.extend(['total count', 'total amount'])
+
+    def rows():
+        for group in summary['groups']:
+            row = [group['label']]
+            for name in BUCKETS:
+                row.extend([group['buckets'][name]['count'], group['buckets'][name]['amount']])
+            row.extend([group['total']['count'], group['total']['amount']])
+            yield row
+    return header, rows()
+
+def iter_detail_rows(as_of, include_settled=False):
+    """Yield one row per case, streamed from the database in batches"""
+    client = aliased(User)
+    staff = aliased(User)
+    age_days = age_days_expression(as_of)
+    query = select(
+        Case.id, Case.title, client.company, Case.debtor_company, Case.status,
+        func.coalesce(staff.first_name + ' ' + staff.last_name, ''),
+        Case.amount_owed, Case.original_due_date, Case.created_at,
+        age_days, bucket_expression(age_days)
+    ).select_from(Case) \
+        .join(client, Case.client_id == client.id) \
+        .outerjoin(staff, Case.assigned_staff_id == staff.id) \
+        .order_by(Case.id) \
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    query = outstanding(query, include_settled)
+
+    result = db.session.execute(query)
+    try:
+        for row in result:
+            due_date, created_at = row[7], row[8]
+            yield list(row[:7]) + [due_date or created_at.date()] + list(row[9:])
+    finally:
+        result.close()
+
+def render_report(as_of, group_by, output_format, detail, include_settled=False):
+    """Return an iterator of bytes for a CSV or XLSX aging report"""
+    if detail:
+        header, rows = DETAIL_HEADER, iter_detail_rows(as_of, include_settled)
+    else:
+        header, rows = summary_rows(aging_summary(as_of, group_by, include_settled))
+    if output_format == 'xlsx':
+        return iter_xlsx(header, rows, sheet_name=f'Aging {as_of.isoformat()}')
+    return iter_csv(header, rows)
+
+@click.command('aging-report')
+@click.option('--as-of', 'as_of', default=None, help='Age balances as of this date (YYYY-MM-DD); defaults to today')
+@click.option('--group-by', type=click.Choice(GROUP_BY_OPTIONS), default='status', show_default=True)
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'xlsx']), default='csv', show_default=True)
+@click.option('--detail', is_flag=True, help='One row per case instead of the grouped summary')
+@click.option('--include-settled', is_flag=True, help='Include Resolved and Closed cases')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default='-', help='File to write; - for stdout')
+@with_appcontext
+def aging_report_command(as_of, group_by, output_format, detail, include_settled, output):
+    """Write the receivables aging report as CSV or XLSX."""
+    as_of_date = datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else date.today()
+    with replica_reads():
+        chunks = render_report(as_of_date, group_by, output_format, detail, include_settled)
+        if output == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(output, 'wb') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
@@ -0,0 +1,181 @@
+"""Hot/cold archival of settled cases.
+
+Cases that have been Resolved or Closed for longer than the retention
+window move, with their tickets and document metadata, into the
+*_archive tables. Each batch is a handful of set-based statements
+(INSERT ... SELECT into the archive, then DELETE from the hot tables)
+in one transaction, so no ORM objects are loaded and the relationship
+cascades never fire. Purging works the same way, on either set of tables.
+"""
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, literal, select, text
+from src.models.user import db
+from src.models.case import Case
+from src.models.ticket import Ticket
+from src.models.document import Document
+from src.models.archive import ArchivedCase, ArchivedTicket, ArchivedDocument
+from src.models.change_log import ChangeLog
+from src.services.storage import get_storage
+
+ARCHIVABLE_STATUSES = ('Resolved', 'Closed')
+DEFAULT_BATCH_SIZE = 500
+# (case, ticket, document) tables on each side of the archive
+HOT_TABLES = (Case.__table__, Ticket.__table__, Document.__table__)
+ARCHIVE_TABLES = (ArchivedCase.__table__, ArchivedTicket.__table__, ArchivedDocument.__table__)
+
+def copy_rows(source, target, where, now):
+    """INSERT INTO target SELECT ... FROM source WHERE ..., stamping archived_at"""
+    names = [column.name for column in source.columns]
+    rows = select(*[source.c[name] for name in names], literal(now, db.DateTime)).where(where)
+    return insert(target).from_select(names + ['archived_at'], rows)
+
+def log_changes(table, where, action, owner_column, now):
+    """Change feed rows for every row matched by where, written in the same statement"""
+    rows = select(
+        literal(table.name), table.c.id, literal(action),
+        table.c[owner_column] if owner_column else literal(None, db.Integer),
+        literal(now, db.DateTime)
+    ).where(where)
+    return insert(ChangeLog.__table__).from_select(
+        ['entity_type', 'entity_id', 'action', 'owner_id', 'changed_at'], rows)
+
+def id_reuse_guard(session):
+    """Cases that have to stay hot because archiving them would free an id for reuse.
+
+    Tables created before sqlite_autoincrement was set hand out max(id) + 1,
+    so the newest case, ticket and document must never leave them. Startup
+    rebuilds such tables (models/schema.py); this covers any it had to skip.
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        return set()
+    keep = set()
+    cases, tickets, documents = HOT_TABLES
+    for table, case_column in ((cases, cases.c.id), (tickets, tickets.c.case_id), (documents, documents.c.case_id)):
+        ddl = session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': table.name}).scalar() or ''
+        if 'AUTOINCREMENT' not in ddl.upper():
+            newest = session.execute(select(case_column).order_by(table.c.id.desc()).limit(1)).scalar()
+            if newest is not None:
+                keep.add(newest)
+    return keep
+
+def archive_closed_cases(older_than_days, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Move settled cases untouched for older_than_days into the archive tables.
+
+    Returns the number of cases, tickets and documents moved (or that would move).
+    """
+    cases, tickets, documents = HOT_TABLES
+    archived_cases, archived_tickets, archived_documents = ARCHIVE_TABLES
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    keep = id_reuse_guard(db.session)
+    candidates = select(cases.c.id).where(
+        cases.c.status.in_(ARCHIVABLE_STATUSES),
+        cases.c.updated_at < cutoff
+    ).order_by(cases.c.id).limit(batch_size)
+    if keep:
+        candidates = candidates.where(cases.c.id.notin_(keep))
+
+    moved = {'cases': 0, 'tickets': 0, 'documents': 0}
+    last_id = 0
+    while True:
+        ids = db.session.execute(candidates.where(cases.c.id > last_id)).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+        case_filter = cases.c.id.in_(ids)
+        ticket_filter = tickets.c.case_id.in_(ids)
+        document_filter = documents.c.case_id.in_(ids)
+
+        if dry_run:
+            moved['cases'] += len(ids)
+            moved['tickets'] += db.session.execute(select(func.count()).where(ticket_filter)).scalar()
+            moved['documents'] += db.session.execute(select(func.count()).where(document_filter)).scalar()
+            continue
+
+        now = datetime.utcnow()
+        db.session.execute(copy_rows(cases, archived_cases, case_filter, now))
+        db.session.execute(copy_rows(tickets, archived_tickets, ticket_filter, now))
+        db.session.execute(copy_rows(documents, archived_documents, document_filter, now))
+        # Core statements skip the ORM flush hook, so feed the change log directly
+        db.session.execute(log_changes(cases, case_filter, 'archive', 'client_id', now))
+        db.session.execute(log_changes(tickets, ticket_filter, 'archive', 'created_by_id', now))
+        db.session.execute(log_changes(documents, document_filter, 'archive', None, now))
+        moved['documents'] += db.session.execute(delete(documents).where(document_filter)).rowcount
+        moved['tickets'] += db.session.execute(delete(tickets).where(ticket_filter)).rowcount
+        moved['cases'] += db.session.execute(delete(cases).where(case_filter)).rowcount
+        db.session.commit()
+
+    return moved
+
+def purge_cases(case_ids, archived=False):
+    """Permanently delete cases with their tickets, documents and stored files.
+
+    Works on the hot tables (logging deletes to the change feed) or on the
+    archive tables. Rows are removed with plain DELETEs, never loaded.
+    """
+    cases, tickets, documents = ARCHIVE_TABLES if archived else HOT_TABLES
+    case_ids = list(case_ids)
+    purged = {'cases': 0, 'tickets': 0, 'documents': 0}
+    file_keys = []
+    for start in range(0, len(case_ids), DEFAULT_BATCH_SIZE):
+        ids = case_ids[start:start + DEFAULT_BATCH_SIZE]
+        case_filter = cases.c.id.in_(ids)
+        ticket_filter = tickets.c.case_id.in_(ids)
+        document_filter = documents.c.case_id.in_(ids)
+
+        file_keys.extend(db.session.execute(select(documents.c.file_path).where(document_filter)).scalars())
+        if not archived:
+            now = datetime.utcnow()
+            db.session.execute(log_changes(cases, case_filter, 'delete', 'client_id', now))
+            db.session.execute(log_changes(tickets, ticket_filter, 'delete', 'created_by_id', now))
+            db.session.execute(log_changes(documents, document_filter, 'delete', None, now))
+        purged['documents'] += db.session.execute(delete(documents).where(document_filter)).rowcount
+        purged['tickets'] += db.session.execute(delete(tickets).where(ticket_filter)).rowcount
+        purged['cases'] += db.session.execute(delete(cases).where(case_filter)).rowcount
+        db.session.commit()
+
+    # Files go only once the rows are gone for good
+    storage = get_storage()
+    for key in file_keys:
+        storage.delete(key)
+    return purged
+
+def expired_archive_ids(older_than_days):
+    """Archived cases past the archive retention window"""
+    archived_cases = ArchivedCase.__table__
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    return db.session.execute(
+        select(archived_cases.c.id).where(archived_cases.c.archived_at < cutoff).order_by(archived_cases.c.id)
+    ).scalars().all()
+
+@click.command('archive-cases')
+@click.option('--older-than', 'older_than', type=int, default=180, show_default=True,
+              help='Archive Resolved/Closed cases not updated for this many days')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Only count what would be archived')
+@with_appcontext
+def archive_cases_command(older_than, batch_size, dry_run):
+    """Move settled cases and their tickets and documents to the archive tables."""
+    started = datetime.utcnow()
+    moved = archive_closed_cases(older_than, batch_size, dry_run)
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    verb = 'Would archive' if dry_run else 'Archived'
+    click.echo(f"{verb} {moved['cases']} cases, {moved['tickets']} tickets and "
+               f"{moved['documents']} documents in {elapsed:.1f}s")
+
+@click.command('purge-cases')
+@click.option('--case-id', 'case_ids', type=int, multiple=True, help='Hot case to delete; repeat for several')
+@click.option('--archived-older-than', 'archived_older_than', type=int, default=None,
+              help='Delete archived cases that were archived more than this many days ago')
+@with_appcontext
+def purge_cases_command(case_ids, archived_older_than):
+    """Permanently delete cases, their tickets, documents and files without ORM cascades."""
+    if bool(case_ids) == (archived_older_than is not None):
+        raise click.UsageError('Give either --case-id or --archived-older-than')
+    if case_ids:
+        purged = purge_cases(case_ids)
+    else:
+        purged = purge_cases(expired_archive_ids(archived_older_than), archived=True)
+    click.echo(f"Purged {purged['cases']} cases, {purged['tickets']} tickets and {purged['documents']} documents")
@@ -0,0 +1,287 @@
+"""Read/write routing between the primary database and read replicas.
+
+Replicas are listed in SQLALCHEMY_REPLICA_URIS. The route for each request
+is decided once, up front:
+
+- GET/HEAD requests read from a replica.
+- Every other method, and any request within REPLICA_MAX_LAG seconds of
+  the same client's last write, uses the primary (read-your-writes).
+- An X-DB-Route: primary|replica header overrides the choice.
+
+CLI report and export jobs opt in with replica_reads(). Even on the replica
+route, only plain SELECTs leave the primary. Flushes, DML and textual SQL
+always use the primary, and so does every statement after a session has
+written.
+
+A replica serves reads only while its copy of the heartbeat row stamped
+on the primary is fresher than REPLICA_MAX_LAG. Lagging or unreachable
+replicas are skipped until they catch up, and a warning is logged while
+every replica is rejected.
+
+The heartbeat is stamped independently of whatever replicates the data
+(streaming replication, litestream, ...). Each app process stamps it every
+REPLICA_HEARTBEAT_INTERVAL seconds from a background thread. Deployments
+that set that to 0 run `flask replication-heartbeat` under cron or a
+process supervisor instead. Locally, replicate-sqlite keeps SQLite replica
+files in sync with the backup API and stamps the heartbeat itself.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import click
+from flask import current_app, g, has_app_context, request, session
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from src.services.metrics import Counter, gauge_lines, register_collector
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+DEFAULT_MAX_LAG = 5.0
+DEFAULT_HEARTBEAT_INTERVAL = 1.0
+LAG_CHECK_INTERVAL = 1.0
+STALE_WARNING_INTERVAL = 60.0
+ROUTE_HEADER = 'X-DB-Route'
+
+ROUTED_STATEMENTS = Counter('db_routed_statements_total', 'SQL statements by the database they were sent to',
+                            ('target',))
+
+class Replica:
+    """A replica engine plus its last measured lag, re-measured at most once a second"""
+
+    def __init__(self, name, uri):
+        self.name = name
+        self.engine = create_engine(uri)
+        self.lag = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current_lag(self, heartbeat_table):
+        now = time.time()
+        if now - self.checked_at < LAG_CHECK_INTERVAL:
+            return self.lag
+        with self._lock:
+            if now - self.checked_at >= LAG_CHECK_INTERVAL:
+                try:
+                    # Housekeeping, not the request's own work, so kept out of its query budget
+                    with self.engine.connect().execution_options(skip_query_log=True) as connection:
+                        beat_at = connection.execute(
+                            select(heartbeat_table.c.beat_at).where(heartbeat_table.c.id == 1)).scalar()
+                    self.lag = now - beat_at if beat_at is not None else None
+                except Exception:
+                    current_app.logger.warning('Replica %s unreachable', self.name, exc_info=True)
+                    self.lag = None
+                self.checked_at = now
+        return self.lag
+
+class ReplicaRouter:
+    def __init__(self, uris, max_lag, heartbeat_table):
+        self.replicas = [Replica(f'replica{index}', uri) for index, uri in enumerate(uris)]
+        self.max_lag = max_lag
+        self.heartbeat_table = heartbeat_table
+        self.warned_at = 0.0
+
+    def healthy_replica(self):
+        """A random replica within the lag limit, or None to fall back to the primary"""
+        healthy = []
+        for replica in self.replicas:
+            lag = replica.current_lag(self.heartbeat_table)
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(replica)
+        if not healthy:
+            self.warn_all_stale()
+            return None
+        return random.choice(healthy).engine
+
+    def warn_all_stale(self):
+        # Once a minute at most; every read request would otherwise log it
+        now = time.time()
+        if now - self.warned_at < STALE_WARNING_INTERVAL:
+            return
+        self.warned_at = now
+        lags = ', '.join(f'{replica.name}={"unknown" if replica.lag is None else f"{replica.lag:.1f}s"}'
+                         for replica in self.replicas)
+        current_app.logger.warning('No replica within REPLICA_MAX_LAG=%ss (%s); reads use the primary. '
+                                   'Is the replication heartbeat being written?', self.max_lag, lags)
+
+class HeartbeatWriter:
+    """Background thread stamping the heartbeat on the primary every `interval` seconds.
+
+    Started by the first request a process serves, so every worker forked by
+    serve.py runs its own; they all stamp the same row.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name='replica-heartbeat',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self, app):
+        # Imported here because the models import this module for RoutingSession
+        from src.models.user import db
+        from src.models.replication import write_heartbeat
+        while True:
+            with app.app_context():
+                try:
+                    write_heartbeat()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.warning('Failed to write the replication heartbeat', exc_info=True)
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval)
+
+class RoutingSession(FlaskSession):
+    """Flask-SQLAlchemy session that sends plain reads to a replica when the route allows"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return bind
+        # Autoflush runs before every query, so any pending change has already been flushed here
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['db_wrote'] = True
+            ROUTED_STATEMENTS.inc(('primary',))
+            return primary
+
+        is_select = clause is not None and getattr(clause, 'is_select', False) and not getattr(clause, 'is_text', False)
+        if is_select and not self.info.get('db_wrote') and has_app_context() and g.get('db_route') == 'replica':
+            router = current_app.extensions.get('db_router')
+            if router is not None:
+                # One replica per session keeps a request's reads consistent with each other
+                if 'db_replica' not in self.info:
+                    self.info['db_replica'] = router.healthy_replica()
+                if self.info['db_replica'] is not None:
+                    ROUTED_STATEMENTS.inc(('replica',))
+                    return self.info['db_replica']
+        ROUTED_STATEMENTS.inc(('primary',))
+        return primary
+
+@contextmanager
+def replica_reads():
+    """Let SELECTs inside the block use a replica, e.g. for report and export jobs"""
+    previous = g.get('db_route')
+    g.db_route = 'replica'
+    try:
+        yield
+    finally:
+        g.db_route = previous
+
+def choose_route():
+    override = request.headers.get(ROUTE_HEADER, '').lower()
+    if override in ('primary', 'replica'):
+        g.db_route = override
+    elif request.method not in READ_METHODS:
+        g.db_route = 'primary'
+    elif session.get('db_primary_until', 0) > time.time():
+        # This client wrote recently; a replica might not have its write yet
+        g.db_route = 'primary'
+    else:
+        g.db_route = 'replica'
+
+def remember_write(db):
+    def after_request(response):
+        if db.session.info.get('db_wrote') and response.status_code < 400:
+            session['db_primary_until'] = time.time() + current_app.extensions['db_router'].max_lag
+        return response
+    return after_request
+
+def init_db_routing(app, db, heartbeat_table):
+    """Install the replica router when replicas are configured; otherwise everything uses the primary"""
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    if not uris:
+        return
+    app.extensions['db_router'] = ReplicaRouter(uris, app.config.get('REPLICA_MAX_LAG', DEFAULT_MAX_LAG),
+                                                heartbeat_table)
+    app.before_request(choose_route)
+    app.after_request(remember_write(db))
+
+    interval = app.config.get('REPLICA_HEARTBEAT_INTERVAL', DEFAULT_HEARTBEAT_INTERVAL)
+    if interval > 0:
+        writer = HeartbeatWriter(interval)
+        app.before_request(lambda: writer.ensure_running(app))
+
+@register_collector
+def replica_metrics():
+    router = current_app.extensions.get('db_router') if has_app_context() else None
+    if router is None:
+        return []
+    return gauge_lines(
+        'db_replica_lag_seconds', 'Age of the primary heartbeat as seen on each replica; -1 when unknown',
+        [(('replica',), (replica.name,), replica.lag if replica.lag is not None else -1.0)
+         for replica in router.replicas])
+
+def sqlite_path(uri):
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or not url.database:
+        raise click.UsageError(f'replicate-sqlite only handles file-based SQLite databases, not {uri}')
+    return url.database
+
+@click.command('replication-heartbeat')
+@click.option('--interval', type=float, default=DEFAULT_HEARTBEAT_INTERVAL, show_default=True,
+              help='Seconds between heartbeats')
+@click.option('--once', is_flag=True, help='Write one heartbeat and exit')
+@with_appcontext
+def replication_heartbeat_command(interval, once):
+    """Stamp the replica lag heartbeat on the primary, for when REPLICA_HEARTBEAT_INTERVAL is 0."""
+    from src.models.user import db
+    from src.models.replication import write_heartbeat
+
+    try:
+        while True:
+            write_heartbeat()
+            db.session.close()
+            if once:
+                return
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+@click.command('replicate-sqlite')
+@click.option('--interval', type=float, default=1.0, show_default=True, help='Seconds between copies')
+@click.option('--once', is_flag=True, help='Copy once and exit')
+@with_appcontext
+def replicate_sqlite_command(interval, once):
+    """Local replication stand-in: copy the primary SQLite file onto each replica file."""
+    # Imported here because the models import this module for RoutingSession
+    from src.models.user import db
+    from src.models.replication import write_heartbeat
+
+    primary = sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    replicas = [sqlite_path(uri) for uri in current_app.config.get('SQLALCHEMY_REPLICA_URIS') or []]
+    if not replicas:
+        raise click.UsageError('Set SQLALCHEMY_REPLICA_URIS to the replica files to keep in sync')
+    click.echo(f'Replicating {primary} to {", ".join(replicas)} every {interval}s')
+    try:
+        while True:
+            write_heartbeat()
+            db.session.close()
+            source = sqlite3.connect(primary)
+            try:
+                for path in replicas:
+                    target = sqlite3.connect(path, timeout=interval * 5)
+                    try:
+                        source.backup(target)
+                    except sqlite3.OperationalError as e:
+                        # Replica busy with long reads; it just lags until the next round
+                        click.echo(f'Skipped {path}: {e}', err=True)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            if once:
+                return
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
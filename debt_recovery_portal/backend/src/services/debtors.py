@@ -0,0 +1,272 @@
+"""Duplicate-debtor detection over a normalized trigram index.
+
+debtor_company is normalized (case, accents, punctuation and legal forms
+such as Ltd/Limited removed) into Case.debtor_key. Every distinct key is
+registered once in debtor_name, and its trigrams go into the
+debtor_trigram posting table. Finding similar names probes only the
+posting lists of the query name's rarest trigrams (prefix filtering) for
+names of a compatible length, whatever the number of cases, and only those
+candidates are scored (Jaccard similarity).
+
+Keys and postings are maintained from the ORM before_flush hook, so a new
+case is matchable as soon as it commits. cluster-debtors backfills rows
+written before this existed and groups the whole portfolio.
+"""
+import math
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, attributes
+from src.models.user import db
+from src.models.case import Case
+from src.models.debtor import DebtorName, DebtorTrigram
+from src.services.streaming import iter_csv
+
+DEFAULT_THRESHOLD = 0.6
+BATCH_SIZE = 500
+# Posting lists are counted only up to this length when ranking trigrams by rarity
+FREQUENCY_CAP = 1000
+LEGAL_FORMS = {
+    'ltd', 'limited', 'llc', 'llp', 'lbg', 'inc', 'incorporated', 'plc', 'co', 'company',
+    'corp', 'corporation', 'gmbh', 'sa', 'pty', 'the'
+}
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+def normalize_debtor(name):
+    """Canonical form of a company name: 'The Gold-Coast Co. Ltd' -> 'gold coast'"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    text = text.replace('&', ' and ').replace("'", '')
+    words = _NON_WORD.sub(' ', text).split()
+    # A name made only of legal forms keeps them rather than becoming empty
+    return ' '.join(word for word in words if word not in LEGAL_FORMS) or ' '.join(words)
+
+def trigrams(key):
+    """Word trigrams padded like pg_trgm, so short words and word starts still match"""
+    grams = set()
+    for word in key.split():
+        padded = f'  {word} '
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+def insert_ignoring_duplicates(dialect, table):
+    """INSERT that skips rows whose key already exists, or None where the dialect has no such form"""
+    if dialect.name == 'sqlite':
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect.name == 'postgresql':
+        return postgresql_insert(table).on_conflict_do_nothing()
+    if dialect.name in ('mysql', 'mariadb'):
+        return mysql_insert(table).prefix_with('IGNORE')
+    return None
+
+def register_names(connection, keys):
+    """Add any keys not in the index yet, with their trigram postings"""
+    names, postings = DebtorName.__table__, DebtorTrigram.__table__
+    keys = sorted(key for key in keys if key)
+    insert_names = insert_ignoring_duplicates(connection.dialect, names)
+    insert_postings = insert_ignoring_duplicates(connection.dialect, postings)
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        while True:
+            existing = set(connection.execute(select(names.c.key).where(names.c.key.in_(chunk))).scalars())
+            missing = [key for key in chunk if key not in existing]
+            if not missing:
+                break
+            grams = {key: trigrams(key) for key in missing}
+            name_rows = [{'key': key, 'trigram_count': len(grams[key])} for key in missing]
+            posting_rows = [{'trigram': gram, 'debtor_key': key} for key in missing for gram in grams[key]]
+            # Another worker may register the same name concurrently; either insert wins
+            if insert_names is not None:
+                connection.execute(insert_names, name_rows)
+                connection.execute(insert_postings, posting_rows)
+                break
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(names), name_rows)
+                    connection.execute(insert(postings), posting_rows)
+                break
+            except IntegrityError:
+                # Lost the race for some of these names; look again and insert the rest
+                continue
+
+@event.listens_for(Session, 'before_flush')
+def index_debtor_names(session, flush_context, instances):
+    """Keep Case.debtor_key and the trigram index current for new or renamed debtors"""
+    keys = set()
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Case) or obj.debtor_company is None:
+            continue
+        if obj in session.new or attributes.get_history(obj, 'debtor_company').has_changes():
+            obj.debtor_key = normalize_debtor(obj.debtor_company)
+            keys.add(obj.debtor_key)
+    if keys:
+        register_names(session.connection(), keys)
+
+def trigram_frequencies(grams):
+    """{trigram: posting list length}, counted no further than FREQUENCY_CAP"""
+    postings = DebtorTrigram.__table__
+    counts = [
+        select(literal(gram).label('trigram'),
+               select(func.count()).select_from(
+                   select(postings.c.debtor_key).where(postings.c.trigram == gram).limit(FREQUENCY_CAP).subquery()
+               ).scalar_subquery().label('postings'))
+        for gram in sorted(grams)
+    ]
+    return dict(db.session.execute(union_all(*counts)).all())
+
+def similar_names(key, threshold=DEFAULT_THRESHOLD):
+    """[(debtor_key, similarity)] for indexed names within the Jaccard threshold, best first.
+
+    Same prefix filter as cluster_names: a name reaching the overlap bound
+    must share one of the query's rarest len - min_overlap + 1 trigrams, so
+    only those posting lists are read, and only names whose size fits the
+    Jaccard length bound are kept as candidates and scored exactly.
+    """
+    grams = trigrams(key)
+    if not grams:
+        return []
+    names, postings = DebtorName.__table__, DebtorTrigram.__table__
+    # Jaccard >= threshold bounds both the shared trigram count and the other name's size
+    min_overlap = math.ceil(threshold * len(grams))
+    frequencies = trigram_frequencies(grams)
+    rarest = sorted(grams, key=lambda gram: (frequencies.get(gram, 0), gram))[:len(grams) - min_overlap + 1]
+    candidates = select(postings.c.debtor_key, names.c.trigram_count).distinct() \
+        .join(names, names.c.key == postings.c.debtor_key) \
+        .where(postings.c.trigram.in_(rarest),
+               names.c.trigram_count.between(min_overlap, math.floor(len(grams) / threshold)))
+    sizes = dict(db.session.execute(candidates).all())
+
+    matches = []
+    keys = sorted(sizes)
+    for start in range(0, len(keys), BATCH_SIZE):
+        overlap = func.count().label('overlap')
+        shared_counts = select(postings.c.debtor_key, overlap) \
+            .where(postings.c.debtor_key.in_(keys[start:start + BATCH_SIZE]), postings.c.trigram.in_(grams)) \
+            .group_by(postings.c.debtor_key) \
+            .having(overlap >= min_overlap)
+        for other, shared in db.session.execute(shared_counts):
+            similarity = shared / (len(grams) + sizes[other] - shared)
+            if similarity >= threshold:
+                matches.append((other, round(similarity, 3)))
+    matches.sort(key=lambda match: (-match[1], match[0]))
+    return matches
+
+def backfill_debtor_keys():
+    """Fill debtor_key and register names for cases written before the index existed"""
+    cases = Case.__table__
+    pending = select(cases.c.id, cases.c.debtor_company).where(cases.c.debtor_key.is_(None)) \
+        .order_by(cases.c.id).limit(BATCH_SIZE * 20)
+    write_back = update(cases).where(cases.c.id == bindparam('case_id')).values(debtor_key=bindparam('key'))
+    filled = 0
+    while True:
+        rows = db.session.execute(pending).all()
+        if not rows:
+            break
+        keyed = [{'case_id': case_id, 'key': normalize_debtor(company)} for case_id, company in rows]
+        register_names(db.session.connection(), {row['key'] for row in keyed})
+        db.session.execute(write_back, keyed)
+        db.session.commit()
+        filled += len(rows)
+    return filled
+
+def cluster_names(threshold=DEFAULT_THRESHOLD):
+    """Union-find over every indexed name; returns {key: cluster root}.
+
+    Candidates come from prefix filtering: two names reaching the overlap
+    bound must share one of the rarest len - min_overlap + 1 trigrams of
+    either, so only those posting lists are probed and each pair found is
+    verified exactly.
+    """
+    grams = defaultdict(set)
+    for gram, key in db.session.execute(select(DebtorTrigram.trigram, DebtorTrigram.debtor_key)):
+        grams[key].add(gram)
+    postings = defaultdict(list)
+    for key, key_grams in grams.items():
+        for gram in key_grams:
+            postings[gram].append(key)
+
+    parent = {key: key for key in grams}
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for key, key_grams in grams.items():
+        min_overlap = math.ceil(threshold * len(key_grams))
+        rarest = sorted(key_grams, key=lambda gram: (len(postings[gram]), gram))
+        candidates = set()
+        for gram in rarest[:len(key_grams) - min_overlap + 1]:
+            candidates.update(postings[gram])
+        for other in candidates:
+            if other <= key:
+                continue
+            shared = len(key_grams & grams[other])
+            if shared / (len(key_grams) + len(grams[other]) - shared) >= threshold:
+                parent[find(other)] = find(key)
+    return {key: find(key) for key in grams}
+
+CLUSTER_HEADER = ['cluster', 'debtor_key', 'spellings', 'cases', 'clients', 'amount_owed']
+
+def debtor_clusters(threshold=DEFAULT_THRESHOLD):
+    """Groups of cases that look like the same debtor under different spellings or clients"""
+    roots = cluster_names(threshold)
+    cases = Case.__table__
+    stats = defaultdict(lambda: {'spellings': set(), 'cases': 0, 'clients': set(), 'amount_owed': 0.0})
+    rows = db.session.execute(
+        select(cases.c.debtor_key, cases.c.debtor_company, cases.c.client_id, cases.c.amount_owed)
+        .execution_options(yield_per=10000))
+    for key, company, client_id, amount in rows:
+        entry = stats[key]
+        entry['spellings'].add(company)
+        entry['cases'] += 1
+        entry['clients'].add(client_id)
+        entry['amount_owed'] += amount or 0
+
+    members = defaultdict(list)
+    for key in stats:
+        members[roots.get(key, key)].append(key)
+    clusters = []
+    for keys in members.values():
+        spellings = set().union(*(stats[key]['spellings'] for key in keys))
+        clients = set().union(*(stats[key]['clients'] for key in keys))
+        if len(spellings) > 1 or len(clients) > 1:
+            clusters.append(sorted(keys, key=lambda key: -stats[key]['cases']))
+    clusters.sort(key=lambda keys: -sum(stats[key]['amount_owed'] for key in keys))
+    return clusters, stats
+
+@click.command('cluster-debtors')
+@click.option('--threshold', type=click.FloatRange(0.1, 1.0), default=DEFAULT_THRESHOLD, show_default=True,
+              help='Minimum trigram Jaccard similarity for two names to be the same debtor')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default='-', help='CSV file to write; - for stdout')
+@with_appcontext
+def cluster_debtors_command(threshold, output):
+    """Backfill the debtor index and write likely duplicate debtors as CSV."""
+    filled = backfill_debtor_keys()
+    clusters, stats = debtor_clusters(threshold)
+
+    def rows():
+        for number, keys in enumerate(clusters, start=1):
+            for key in keys:
+                entry = stats[key]
+                yield [number, key, '; '.join(sorted(entry['spellings'])), entry['cases'],
+                       len(entry['clients']), round(entry['amount_owed'], 2)]
+
+    chunks = iter_csv(CLUSTER_HEADER, rows())
+    if output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+    else:
+        with open(output, 'wb') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+    click.echo(f'Indexed {filled} cases; found {len(clusters)} debtor clusters', err=True)
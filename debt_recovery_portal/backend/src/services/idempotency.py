@@ -0,0 +1,268 @@
+"""Idempotency-Key support for endpoints that create records.
+
+A client sends the same Idempotency-Key header on every retry of one
+logical request. The first request claims the key (a row in
+idempotency_key, unique per user) and runs the view. Its response is stored
+on the row, and retries inside IDEMPOTENCY_KEY_TTL seconds get that stored
+response back without running anything. A duplicate that arrives while the
+first one is still running waits for it to finish. Reusing a key for a
+different request (method, path or body) is rejected.
+
+Server errors release the key so the retry really runs again. While the
+view runs, the owning process keeps refreshing the claim's locked_at, so a
+slow request is never run twice: a duplicate gets 409 until it finishes.
+Only a claim whose locked_at has not moved for IDEMPOTENCY_LOCK_TIMEOUT
+seconds, because its worker died or hung, is taken over.
+purge-idempotency-keys deletes expired rows.
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+import click
+from flask import current_app, jsonify, make_response, request, session
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.idempotency import IdempotencyKey
+from src.services.metrics import Counter
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_LOCK_TIMEOUT = 60
+DEFAULT_WAIT = 10
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+PURGE_BATCH_SIZE = 5000
+HASH_CHUNK_SIZE = 64 * 1024
+
+IDEMPOTENT_REQUESTS = Counter('idempotent_requests_total', 'Requests carrying an Idempotency-Key, by outcome',
+                              ('endpoint', 'outcome'))
+
+# Set when a request in this process finishes with a key, so local waiters wake without polling
+_finished = {}
+_finished_lock = threading.Lock()
+
+class ClaimRenewer:
+    """Background thread refreshing locked_at on every key this process is still running.
+
+    The thread starts with the first claim and stops once none are held, so
+    it never outlives a fork into a worker that has nothing to renew.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._held = {}  # row id -> monotonic time its claim is next renewed
+        self._thread = None
+
+    def hold(self, app, row_id):
+        # Three renewals per timeout, so one slow write never lets a live claim lapse
+        interval = app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT) / 3
+        with self._condition:
+            self._held[row_id] = time.monotonic() + interval
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name='idempotency-renewer',
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def release(self, row_id):
+        with self._condition:
+            self._held.pop(row_id, None)
+
+    def _due(self, app):
+        """Wait for the next renewal; the claims to renew now, or None once nothing is held"""
+        with self._condition:
+            while self._held:
+                now = time.monotonic()
+                wait = min(self._held.values()) - now
+                if wait <= 0:
+                    interval = app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT) / 3
+                    due = [row_id for row_id, renew_at in self._held.items() if renew_at <= now]
+                    for row_id in due:
+                        self._held[row_id] = now + interval
+                    return due
+                self._condition.wait(wait)
+            self._thread = None
+            return None
+
+    def _run(self, app):
+        while True:
+            due = self._due(app)
+            if due is None:
+                return
+            try:
+                with app.app_context(), db.engine.begin() as connection:
+                    connection.execute(update(IdempotencyKey)
+                                       .where(IdempotencyKey.id.in_(due), IdempotencyKey.status == 'in_progress')
+                                       .values(locked_at=datetime.utcnow()))
+            except Exception:
+                app.logger.exception('Failed to renew idempotency key claims')
+
+renewer = ClaimRenewer()
+
+def request_fingerprint():
+    """sha256 over the method, path, query string and body.
+
+    Form fields and uploaded files are hashed after parsing, since clients
+    pick a fresh multipart boundary on every retry; JSON is hashed in
+    canonical form so a re-serialized retry still matches.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}?{request.query_string.decode()}\n'.encode())
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(json.dumps(['field', name, value]).encode())
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: (item[0], item[1].filename)):
+            digest.update(json.dumps(['file', name, upload.filename]).encode())
+            for chunk in iter(lambda: upload.stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    else:
+        body = request.get_data(cache=True)
+        payload = request.get_json(silent=True) if request.is_json else None
+        if payload is not None:
+            body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+        digest.update(body)
+    return digest.hexdigest()
+
+def claim(user_id, key, fingerprint, now):
+    """Insert an in-progress row for the key; None if another request already holds it"""
+    ttl = current_app.config.get('IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+    try:
+        row_id = db.session.execute(insert(IdempotencyKey).values(
+            user_id=user_id, key=key, fingerprint=fingerprint, status='in_progress',
+            locked_at=now, expires_at=now + timedelta(seconds=ttl))).inserted_primary_key[0]
+        db.session.commit()
+        return row_id
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+def take_over(row, now):
+    """Re-claim a key whose owner stopped renewing it; only one waiter wins"""
+    taken = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == row.id, IdempotencyKey.status == 'in_progress',
+               IdempotencyKey.locked_at == row.locked_at)
+        .values(locked_at=now)).rowcount
+    db.session.commit()
+    return row.id if taken else None
+
+def replay(row):
+    response = current_app.response_class(row.response_body, status=row.response_status,
+                                          mimetype=row.response_mimetype)
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+def finish(row_id, response):
+    """Store the response to replay, or release the key when the request has to be retried for real"""
+    if response is not None and response.status_code < 500 and not response.is_streamed:
+        db.session.execute(update(IdempotencyKey).where(IdempotencyKey.id == row_id).values(
+            status='completed', response_status=response.status_code,
+            response_body=response.get_data(as_text=True), response_mimetype=response.mimetype))
+    else:
+        # The view may have raised mid-transaction
+        db.session.rollback()
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == row_id))
+    db.session.commit()
+
+def idempotent(view):
+    """Replay the stored response for a repeated Idempotency-Key instead of running the view again"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        user_id = session.get('user_id')
+        if key is None or not user_id:
+            # Keys are per user, so anonymous requests just get the view's 401
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        endpoint = request.endpoint
+        fingerprint = request_fingerprint()
+        lock_timeout = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+        give_up = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT', DEFAULT_WAIT)
+        interval = POLL_INTERVAL
+        while True:
+            now = datetime.utcnow()
+            row_id = claim(user_id, key, fingerprint, now)
+            if row_id is not None:
+                break
+            keys = IdempotencyKey.__table__
+            row = db.session.execute(select(keys).where(keys.c.user_id == user_id, keys.c.key == key)).first()
+            # End the read so the owner's write is never held up, and the next poll sees it
+            db.session.commit()
+            if row is None:
+                continue
+            if row.expires_at <= now:
+                db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == row.id,
+                                                                IdempotencyKey.expires_at <= now))
+                db.session.commit()
+                continue
+            if row.fingerprint != fingerprint:
+                IDEMPOTENT_REQUESTS.inc((endpoint, 'mismatch'))
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if row.status == 'completed':
+                IDEMPOTENT_REQUESTS.inc((endpoint, 'replayed'))
+                return replay(row)
+            # A live owner renews locked_at; one that has gone quiet died or hung mid-request
+            if now - row.locked_at > lock_timeout:
+                row_id = take_over(row, now)
+                if row_id is not None:
+                    break
+                continue
+            if time.monotonic() >= give_up:
+                IDEMPOTENT_REQUESTS.inc((endpoint, 'in_progress'))
+                response = jsonify({'error': f'A request with this {HEADER} is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            with _finished_lock:
+                event = _finished.get((user_id, key))
+            if event is not None:
+                event.wait(interval)
+            else:
+                time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        event = threading.Event()
+        with _finished_lock:
+            _finished[(user_id, key)] = event
+        renewer.hold(current_app._get_current_object(), row_id)
+        response = None
+        try:
+            response = make_response(view(*args, **kwargs))
+            return response
+        finally:
+            try:
+                renewer.release(row_id)
+                finish(row_id, response)
+            finally:
+                with _finished_lock:
+                    _finished.pop((user_id, key), None)
+                event.set()
+            IDEMPOTENT_REQUESTS.inc((endpoint, 'executed' if response is not None else 'failed'))
+    return wrapper
+
+def purge_expired_keys(now=None):
+    """Delete expired keys in batches; returns how many went"""
+    now = now or datetime.utcnow()
+    expired = select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= now).limit(PURGE_BATCH_SIZE)
+    purged = 0
+    while True:
+        deleted = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired))).rowcount
+        db.session.commit()
+        purged += deleted
+        if deleted < PURGE_BATCH_SIZE:
+            return purged
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete Idempotency-Key records past their retention window."""
+    click.echo(f'Purged {purge_expired_keys()} expired idempotency keys')
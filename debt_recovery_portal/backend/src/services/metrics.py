@@ -0,0 +1,385 @@
+"""In-process Prometheus metrics for the Flask API.
+
+Request latency and per-request SQL activity are recorded with a handful of
+dict lookups and a lock per request, so the instrumentation is cheap enough
+to leave on in production. Everything is rendered in the Prometheus text
+exposition format and served from /api/metrics.
+
+Under the preforking server (src/serve.py) a scrape reaches whichever
+worker accepts it, so counters and histograms are aggregated across
+workers. Each process writes a snapshot of its series to
+METRICS_MULTIPROC_DIR at most once a second (always before answering a
+scrape, and on exit), and /api/metrics sums every snapshot in the directory. When a
+worker exits, the master folds its snapshot into retired.json, so totals
+keep counting up across recycling and reloads. Process and pool gauges
+describe only the worker that answered and carry its pid as a label.
+Without METRICS_MULTIPROC_DIR (flask run, tests) everything stays in process.
+"""
+import glob
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+MULTIPROCESS_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+RETIRED_FILE = 'retired.json'
+FLUSH_INTERVAL = 1.0
+
+# Every Counter and Histogram, in creation order; rendered and shared across workers together
+_registry = []
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def state(self):
+        """Series as JSON-ready [labels, bucket counts, sum, count] rows"""
+        with self._lock:
+            return self.rows(self._series)
+
+    @staticmethod
+    def rows(series):
+        return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in series.items()]
+
+    @staticmethod
+    def merge(series, rows):
+        for labels, counts, total, count in rows:
+            merged = series.setdefault(tuple(labels), [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    def render(self, others=()):
+        """Exposition lines for this process's series plus any snapshot rows from other processes"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        series = {}
+        self.merge(series, self.state())
+        for rows in others:
+            self.merge(series, rows)
+        snapshot = [(labels, counts, total, count) for labels, (counts, total, count) in sorted(series.items())]
+        for labels, counts, total, count in snapshot:
+            base = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names + ("le",), labels + (format_value(bound),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(self.label_names + ("le",), labels + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{base} {format_value(total)}')
+            lines.append(f'{self.name}_count{base} {count}')
+        return lines
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def state(self):
+        """Series as JSON-ready [labels, value] rows"""
+        with self._lock:
+            return self.rows(self._values)
+
+    @staticmethod
+    def rows(series):
+        return [[list(labels), value] for labels, value in series.items()]
+
+    @staticmethod
+    def merge(series, rows):
+        for labels, value in rows:
+            series[tuple(labels)] = series.get(tuple(labels), 0) + value
+
+    def render(self, others=()):
+        """Exposition lines for this process's series plus any snapshot rows from other processes"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        series = {}
+        self.merge(series, self.state())
+        for rows in others:
+            self.merge(series, rows)
+        snapshot = sorted(series.items())
+        for labels, value in snapshot:
+            lines.append(f'{self.name}{format_labels(self.label_names, labels)} {format_value(value)}')
+        return lines
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+def gauge_lines(name, help_text, samples, kind='gauge'):
+    """Render a sampled value from a list of (label_names, label_values, value)"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for label_names, label_values, value in samples:
+        lines.append(f'{name}{format_labels(label_names, label_values)} {format_value(value)}')
+    return lines
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint, method and status',
+    ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed per request',
+    ('endpoint', 'method'), QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request',
+    ('endpoint', 'method'), LATENCY_BUCKETS)
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed, in and out of requests', ('context',))
+
+# Extra callables returning exposition lines, for subsystems that keep their own counts
+_collectors = []
+
+def register_collector(collector):
+    """Add a callable returning a list of exposition lines to /api/metrics"""
+    _collectors.append(collector)
+    return collector
+
+METRIC_KINDS = {'counter': Counter, 'histogram': Histogram}
+
+def read_snapshot(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        # Gone (a retired worker) or unreadable; it simply does not count this time
+        return None
+
+def write_snapshot(path, snapshot):
+    """Write via a temporary file and rename, so readers never see half a snapshot"""
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump(snapshot, handle, separators=(',', ':'))
+    os.replace(temporary, path)
+
+def merge_snapshot(into, metrics):
+    """Add one snapshot's {name: {'kind', 'series'}} into another, in place"""
+    for name, entry in metrics.items():
+        kind = METRIC_KINDS[entry['kind']]
+        target = into.setdefault(name, {'kind': entry['kind'], 'series': []})
+        series = {}
+        kind.merge(series, target['series'])
+        kind.merge(series, entry['series'])
+        target['series'] = kind.rows(series)
+
+class SharedSnapshots:
+    """This process's snapshot file in METRICS_MULTIPROC_DIR, and reading everyone else's"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._flushed_at = 0.0
+        self._timer = None
+
+    def _own_path(self, directory):
+        # A forked child gets a file of its own; the suffix keeps a reused pid from clashing
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = os.path.join(directory, f'{self._pid}-{uuid.uuid4().hex[:8]}.json')
+            self._flushed_at = 0.0
+            self._timer = None
+        return self._path
+
+    def flush(self, force=False):
+        directory = os.environ.get(MULTIPROCESS_DIR_ENV)
+        if not directory:
+            return
+        with self._lock:
+            now = time.monotonic()
+            path = self._own_path(directory)
+            if not force and now - self._flushed_at < FLUSH_INTERVAL:
+                # Write this later, so a worker that goes quiet still publishes its last requests
+                if self._timer is None:
+                    self._timer = threading.Timer(self._flushed_at + FLUSH_INTERVAL - now, self.flush,
+                                                  kwargs={'force': True})
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._flushed_at = now
+            self._timer = None
+            write_snapshot(path, {'metrics': {metric.name: {'kind': metric.kind, 'series': metric.state()}
+                                              for metric in _registry}})
+
+    def others(self):
+        """{metric name: [rows, ...]} from every other live process and from retired ones"""
+        directory = os.environ.get(MULTIPROCESS_DIR_ENV)
+        if not directory:
+            return {}
+        with self._lock:
+            own = self._own_path(directory)
+        retired = read_snapshot(os.path.join(directory, RETIRED_FILE)) or {'merged': [], 'metrics': {}}
+        # Folded into retired.json but not yet deleted
+        merged = set(retired['merged'])
+        snapshots = [retired['metrics']]
+        for path in sorted(glob.glob(os.path.join(directory, '*-*.json'))):
+            if path != own and os.path.basename(path) not in merged:
+                snapshot = read_snapshot(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot['metrics'])
+        rows = {}
+        for metrics in snapshots:
+            for name, entry in metrics.items():
+                rows.setdefault(name, []).append(entry['series'])
+        return rows
+
+shared = SharedSnapshots()
+
+def retire_process(directory, pid):
+    """Fold an exited process's snapshot into retired.json, so its counts outlive it.
+
+    Called by the serve.py master after reaping a worker, which is the only
+    writer of retired.json.
+    """
+    paths = glob.glob(os.path.join(directory, f'{pid}-*.json'))
+    if not paths:
+        return
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    retired = read_snapshot(retired_path) or {'merged': [], 'metrics': {}}
+    for path in paths:
+        snapshot = read_snapshot(path)
+        if snapshot is not None:
+            merge_snapshot(retired['metrics'], snapshot['metrics'])
+    names = {os.path.basename(path) for path in paths}
+    present = {os.path.basename(path) for path in glob.glob(os.path.join(directory, '*-*.json'))}
+    retired['merged'] = sorted((set(retired['merged']) & present) | names)
+    write_snapshot(retired_path, retired)
+    for path in paths:
+        os.unlink(path)
+
+def reset_directory(directory):
+    """Drop snapshots left by an earlier server run, so its totals start from zero"""
+    for path in glob.glob(os.path.join(directory, '*.json')) + glob.glob(os.path.join(directory, '*.tmp')):
+        os.unlink(path)
+
+def endpoint_label():
+    """Route template rather than concrete path, so label cardinality stays bounded"""
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+def current_rss_bytes():
+    """Resident set size; falls back to peak RSS where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, so a statement that fails leaves nothing behind
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_query_start', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    if has_request_context() and 'metrics_started' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+        DB_QUERIES.inc(('request',))
+    else:
+        DB_QUERIES.inc(('background',))
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = endpoint_label()
+    REQUEST_LATENCY.observe((endpoint, request.method, str(response.status_code)), time.perf_counter() - started)
+    REQUEST_QUERIES.observe((endpoint, request.method), g.db_queries)
+    REQUEST_DB_TIME.observe((endpoint, request.method), g.db_time)
+    shared.flush()
+    return response
+
+def init_metrics(app, db):
+    """Install request hooks and remember the database for pool gauges"""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.extensions['metrics_db'] = db
+
+def render_metrics(db=None):
+    """Collect every metric into Prometheus text exposition format"""
+    # Whatever this scrape reports is on disk first, so a later scrape on another worker never sees less
+    shared.flush(force=True)
+    others = shared.others()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(others.get(metric.name, ())))
+
+    pid = str(os.getpid())
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    lines.extend(gauge_lines('process_resident_memory_bytes', 'Resident memory size in bytes of the answering process',
+                             [(('pid',), (pid,), current_rss_bytes())]))
+    lines.extend(gauge_lines('process_cpu_seconds_total', 'User and system CPU time in seconds of the answering process',
+                             [(('pid',), (pid,), usage.ru_utime + usage.ru_stime)], kind='counter'))
+    lines.extend(gauge_lines('process_threads', 'Live Python threads in the answering process',
+                             [(('pid',), (pid,), threading.active_count())]))
+
+    if db is not None:
+        samples = []
+        for bind_key, engine in db.engines.items():
+            pool = engine.pool
+            checked_out = getattr(pool, 'checkedout', None)
+            size = getattr(pool, 'size', None)
+            if callable(checked_out):
+                samples.append((('pid', 'bind', 'state'), (pid, bind_key or 'default', 'checked_out'), checked_out()))
+            if callable(size):
+                samples.append((('pid', 'bind', 'state'), (pid, bind_key or 'default', 'size'), size()))
+        lines.extend(gauge_lines('db_pool_connections', 'SQLAlchemy connection pool state of the answering process',
+                                 samples))
+
+    for collector in _collectors:
+        lines.extend(collector())
+
+    return '\n'.join(lines) + '\n'
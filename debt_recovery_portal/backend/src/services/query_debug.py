@@ -0,0 +1,163 @@
+"""Development-mode SQL diagnostics: N+1 detection, slow-query log and query budgets.
+
+Enabled when the app runs with debug or testing on, or when QUERY_DEBUG is
+set explicitly. Every statement executed during a request is recorded with
+its normalized shape; statements repeated QUERY_DEBUG_N_PLUS_ONE times or
+more are reported with the application stack that first issued them.
+For streamed responses the check runs when the response is closed, so
+statements issued while the body is generated count too.
+Statements run with the skip_query_log execution option (housekeeping such
+as replica lag probes) are left out of budgets and reports.
+"""
+import logging
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('src.query_debug')
+slow_query_logger = logging.getLogger('src.slow_query')
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_POSTCOMPILE = re.compile(r'\(?\[POSTCOMPILE_\w+\]\)?')
+_WHITESPACE = re.compile(r'\s+')
+
+# Per-thread query counters for assert_max_queries()
+_local = threading.local()
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or block runs more SQL statements than declared"""
+
+def normalize_statement(statement):
+    """Reduce a SQL statement to its shape so repeated queries group together"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _POSTCOMPILE.sub('(?)', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+def application_stack():
+    """Stack frames from our own code, innermost last, without library noise"""
+    frames = [frame for frame in traceback.extract_stack()[:-2]
+              if '/src/' in frame.filename and 'query_debug' not in frame.filename]
+    return ''.join(traceback.format_list(frames[-8:]))
+
+def debug_enabled():
+    if not has_app_context():
+        return False
+    config = current_app.config
+    return config.get('QUERY_DEBUG', current_app.debug or current_app.testing)
+
+def query_budget(max_queries):
+    """Declare the most SQL statements a view may run per request"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """Fail when the block runs more than max_queries statements in this thread"""
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counter = [0]
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+    if counter[0] > max_queries:
+        raise QueryBudgetExceeded(f'{counter[0]} queries executed, budget is {max_queries}')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, so a failed statement leaves no stale start time behind
+    if context is not None:
+        context.debug_query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and context.execution_options.get('skip_query_log'):
+        return
+    started = getattr(context, 'debug_query_start', None)
+    elapsed_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    for counter in getattr(_local, 'counters', ()):
+        counter[0] += 1
+
+    if not debug_enabled():
+        return
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    if elapsed_ms >= threshold:
+        where = f'{request.method} {request.path}' if has_request_context() else 'background'
+        slow_query_logger.warning('%.1f ms [%s] %s', elapsed_ms, where, _WHITESPACE.sub(' ', statement))
+
+    if has_request_context() and 'query_log' in g:
+        shape = normalize_statement(statement)
+        entry = g.query_log.get(shape)
+        if entry is None:
+            g.query_log[shape] = [1, elapsed_ms, application_stack()]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed_ms
+
+def _start_query_log():
+    if debug_enabled():
+        g.query_log = {}
+
+def check_query_log(query_log, method, path, budget):
+    """Warn about repeated statement shapes and enforce the view's query budget"""
+    total = sum(entry[0] for entry in query_log.values())
+    threshold = current_app.config.get('QUERY_DEBUG_N_PLUS_ONE', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    for shape, (count, elapsed_ms, stack) in query_log.items():
+        if count >= threshold:
+            logger.warning('Possible N+1 in %s %s: %d x %.1f ms total\n  %s\nFirst issued from:\n%s',
+                           method, path, count, elapsed_ms, shape, stack)
+
+    if budget is not None and total > budget:
+        message = f'{method} {path} ran {total} queries, budget is {budget}'
+        if current_app.testing or current_app.config.get('QUERY_BUDGET_STRICT'):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+def _analyze_query_log(response):
+    if response.is_streamed and 'query_log' in g:
+        # Queries made while the body streams (under stream_with_context) land in the same log,
+        # so the check waits until the server closes the response
+        query_log = g.query_log
+        app = current_app._get_current_object()
+        method, path = request.method, request.path
+        budget = getattr(current_app.view_functions.get(request.endpoint), 'query_budget', None)
+
+        def check_when_closed():
+            with app.app_context():
+                check_query_log(query_log, method, path, budget)
+        response.call_on_close(check_when_closed)
+        return response
+
+    query_log = g.pop('query_log', None)
+    if query_log is None:
+        return response
+    view = current_app.view_functions.get(request.endpoint)
+    check_query_log(query_log, request.method, request.path, getattr(view, 'query_budget', None))
+    return response
+
+def init_query_debug(app):
+    """Install the per-request query recorder; inert unless debug tooling is enabled"""
+    app.before_request(_start_query_log)
+    app.after_request(_analyze_query_log)
@@ -0,0 +1,151 @@
+"""Reconciliation of stored document files against document rows.
+
+Files and rows drift apart: cascade deletes drop Document rows but leave
+their files, and a lost file only shows up when someone downloads it. The
+reconciler compares the two without loading either side into memory.
+It merge-joins two streams that are both sorted by storage key:
+
+- the configured storage backend's listing. Local storage is walked by a
+  pool of os.scandir threads, with directory listings fetched a bounded
+  number at a time ahead of the walk and consumed in name order. S3
+  listings already come back in key order.
+- hot and archived document rows, read in file_path order (indexed) and
+  interleaved with heapq.merge.
+
+A file with no row is an orphan. A row with no file is missing, and a row
+whose file_size disagrees with the file is a size mismatch. Memory use is
+bounded by the largest single directory listing plus the prefetch window.
+"""
+import heapq
+import sys
+import time
+from collections import namedtuple
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import literal, select
+from src.models.user import db
+from src.models.document import Document
+from src.models.archive import ArchivedDocument
+from src.services.storage import DEFAULT_SCAN_WORKERS, LEGACY_PREFIX, StoredFile, get_storage
+from src.services.streaming import iter_csv
+
+ROW_BATCH_SIZE = 10000
+DEFAULT_GRACE_MINUTES = 60
+DOCUMENT_TABLES = (Document.__table__, ArchivedDocument.__table__)
+# Storage keys start with a hex shard or 'case_'; anything sorting below this is a path, not a key
+KEY_START = '0'
+REPORT_HEADER = ['issue', 'key', 'document_id', 'table', 'recorded_size', 'file_size']
+
+DocumentRow = namedtuple('DocumentRow', 'key table document_id size')
+Issue = namedtuple('Issue', 'issue key document_id table recorded_size file_size mtime')
+
+def keyed_rows(rows, strip):
+    for path, table_name, document_id, size in rows:
+        yield DocumentRow(path[strip:], table_name, document_id, size)
+
+def document_rows(storage):
+    """Hot and archived rows in storage key order, plus {key: [row]} for paths that are not plain keys.
+
+    Keys sort the same as file_path except for legacy 'uploads/...' paths,
+    which lose their prefix; each table is read as three indexed ranges
+    around that prefix and the streams merged. Paths sorting before any key
+    (absolute, './...') are normally absent and are matched out of order.
+    """
+    legacy_end = LEGACY_PREFIX[:-1] + chr(ord(LEGACY_PREFIX[-1]) + 1)
+    ranges = ((KEY_START, LEGACY_PREFIX, 0), (LEGACY_PREFIX, legacy_end, len(LEGACY_PREFIX)), (legacy_end, None, 0))
+    streams, foreign = [], {}
+    for table in DOCUMENT_TABLES:
+        for low, high, strip in ranges:
+            query = select(table.c.file_path, literal(table.name), table.c.id, table.c.file_size) \
+                .where(table.c.file_path >= low).order_by(table.c.file_path, table.c.id) \
+                .execution_options(yield_per=ROW_BATCH_SIZE)
+            if high is not None:
+                query = query.where(table.c.file_path < high)
+            streams.append(keyed_rows(db.session.execute(query), strip))
+        for path, document_id, size in db.session.execute(
+                select(table.c.file_path, table.c.id, table.c.file_size).where(table.c.file_path < KEY_START)):
+            key = storage.normalize(path)
+            foreign.setdefault(key, []).append(DocumentRow(key, table.name, document_id, size))
+    return heapq.merge(*streams), foreign
+
+def compare(stored, row):
+    if row.size != stored.size:
+        return Issue('size_mismatch', stored.key, row.document_id, row.table, row.size, stored.size, stored.mtime)
+    return None
+
+def reconcile(storage, workers=DEFAULT_SCAN_WORKERS):
+    """Yield an Issue for every orphaned file, missing file and size mismatch in storage"""
+    rows, foreign = document_rows(storage)
+    files = storage.iter_files(workers)
+    stored, row = next(files, None), next(rows, None)
+    while stored is not None or row is not None:
+        if row is None or (stored is not None and stored.key < row.key):
+            matches = foreign.pop(stored.key, None)
+            if matches is None:
+                yield Issue('orphan', stored.key, None, None, None, stored.size, stored.mtime)
+            for match in matches or ():
+                issue = compare(stored, match)
+                if issue:
+                    yield issue
+            stored = next(files, None)
+        elif stored is None or row.key < stored.key:
+            yield Issue('missing', row.key, row.document_id, row.table, row.size, None, None)
+            row = next(rows, None)
+        else:
+            # Several rows may point at the same file
+            for match in foreign.pop(stored.key, []) + [row]:
+                issue = compare(stored, match)
+                if issue:
+                    yield issue
+            row = next(rows, None)
+            while row is not None and row.key == stored.key:
+                issue = compare(stored, row)
+                if issue:
+                    yield issue
+                row = next(rows, None)
+            stored = next(files, None)
+
+    # Whatever is left lives outside the listing (e.g. an absolute path elsewhere); look each one up
+    for key, matches in foreign.items():
+        size = storage.size(key)
+        for match in matches:
+            if size is None:
+                yield Issue('missing', key, match.document_id, match.table, match.size, None, None)
+            else:
+                issue = compare(StoredFile(key, size, None), match)
+                if issue:
+                    yield issue
+
+@click.command('reconcile-documents')
+@click.option('--workers', type=click.IntRange(1, 256), default=DEFAULT_SCAN_WORKERS, show_default=True,
+              help='Threads listing directories in parallel (local storage)')
+@click.option('--delete-orphans', is_flag=True, help='Delete files that no document row refers to')
+@click.option('--grace-minutes', type=int, default=DEFAULT_GRACE_MINUTES, show_default=True,
+              help='Leave orphans younger than this alone; uploads store the file before the row commits')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default='-', help='CSV file to write; - for stdout')
+@with_appcontext
+def reconcile_documents_command(workers, delete_orphans, grace_minutes, output):
+    """Report stored files without document rows, rows without files and size mismatches."""
+    storage = get_storage()
+    started = time.monotonic()
+    cutoff = time.time() - grace_minutes * 60
+    counts = {'orphan': 0, 'missing': 0, 'size_mismatch': 0, 'deleted': 0}
+
+    def rows():
+        for issue in reconcile(storage, workers):
+            counts[issue.issue] += 1
+            if issue.issue == 'orphan' and delete_orphans and issue.mtime < cutoff and storage.delete(issue.key):
+                counts['deleted'] += 1
+            yield [issue.issue, issue.key, issue.document_id, issue.table, issue.recorded_size, issue.file_size]
+
+    chunks = iter_csv(REPORT_HEADER, rows())
+    if output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+    else:
+        with open(output, 'wb') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+    click.echo(f"{counts['orphan']} orphaned files ({counts['deleted']} deleted), {counts['missing']} missing files, "
+               f"{counts['size_mismatch']} size mismatches in {time.monotonic() - started:.1f}s", err=True)
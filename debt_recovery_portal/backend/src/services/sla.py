@@ -0,0 +1,239 @@
+"""SLA escalation for tickets and cases, driven by a timer heap.
+
+Every open record has a response deadline (while it is still in its
+initial status) and a resolution deadline, both set by priority. The
+scheduler loads open records once through the status indexes and keeps
+their deadlines in a min-heap. After that it only follows the change feed:
+a status or priority change pushes fresh deadlines, and the entries they
+replace are dropped lazily when they surface. Finding the next breach is a
+heap peek, and each event costs O(log n), with no periodic table scans.
+
+On a breach the record's priority goes up one level; records already at
+Critical are reassigned to the least loaded active staff member instead.
+Each breach is stored in sla_breach and exported on /api/metrics. It
+restarts both of the record's clocks, so the new priority gets full windows
+and one late record climbs a single level per breach rather than cascading
+through its other, already overdue target.
+"""
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.ticket import Ticket
+from src.models.change_log import ChangeLog
+from src.models.sla_breach import SlaBreach
+from src.services.metrics import gauge_lines, register_collector
+
+PRIORITIES = ('Low', 'Medium', 'High', 'Critical')
+KINDS = ('response', 'resolution')
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+# (response, resolution) targets by priority
+SLA_TARGETS = {
+    'ticket': {'Critical': (HOUR, DAY), 'High': (4 * HOUR, 3 * DAY),
+               'Medium': (DAY, 7 * DAY), 'Low': (3 * DAY, 14 * DAY)},
+    'case': {'Critical': (DAY, 30 * DAY), 'High': (3 * DAY, 60 * DAY),
+             'Medium': (7 * DAY, 90 * DAY), 'Low': (14 * DAY, 180 * DAY)},
+}
+# The response clock runs while a record is still in its initial status
+TRACKED = {
+    'ticket': {'model': Ticket, 'initial': 'Received', 'closed': ('Resolved',), 'assignee': 'assigned_to_id'},
+    'case': {'model': Case, 'initial': 'Open', 'closed': ('Resolved', 'Closed'), 'assignee': 'assigned_staff_id'},
+}
+CHANGE_BATCH_SIZE = 5000
+BREACH_COMMIT_SIZE = 500
+
+def deadline_for(entity_type, record, kind, last_breach=None):
+    """When record misses its kind target, or None if that target no longer applies"""
+    spec = TRACKED[entity_type]
+    if record.status in spec['closed'] or (kind == 'response' and record.status != spec['initial']):
+        return None
+    targets = SLA_TARGETS[entity_type].get(record.priority, SLA_TARGETS[entity_type]['Medium'])
+    # A breach restarts both clocks, so an escalated record gets full windows at its new priority
+    started = max(record.created_at, last_breach) if last_breach else record.created_at
+    return started + targets[KINDS.index(kind)]
+
+class SlaScheduler:
+    def __init__(self):
+        self.heap = []  # (deadline, generation, entity_type, entity_id, kind)
+        self.generations = {}  # (entity_type, entity_id) -> generation of its live heap entries
+        self.last_breach = {}  # (entity_type, entity_id) -> latest breached_at of either kind
+        self.cursor = 0
+        self._generation = itertools.count()
+
+    def load(self):
+        """Build the heap from open records; later changes come from the change feed"""
+        # Read the cursor first so changes racing with the load are replayed, not lost
+        self.cursor = db.session.execute(select(func.max(ChangeLog.id))).scalar() or 0
+        breaches = select(SlaBreach.entity_type, SlaBreach.entity_id, func.max(SlaBreach.breached_at)) \
+            .group_by(SlaBreach.entity_type, SlaBreach.entity_id)
+        for entity_type, entity_id, breached_at in db.session.execute(breaches):
+            self.last_breach[(entity_type, entity_id)] = breached_at
+        for entity_type, spec in TRACKED.items():
+            model = spec['model']
+            rows = db.session.execute(
+                select(model.id, model.priority, model.status, model.created_at)
+                .where(model.status.notin_(spec['closed']))
+                .execution_options(yield_per=10000))
+            for row in rows:
+                self.schedule(entity_type, row)
+
+    def schedule(self, entity_type, record):
+        """Replace a record's deadlines; any older heap entries become stale"""
+        key = (entity_type, record.id)
+        generation = next(self._generation)
+        self.generations[key] = generation
+        pushed = False
+        for kind in KINDS:
+            deadline = deadline_for(entity_type, record, kind, self.last_breach.get(key))
+            if deadline is not None:
+                heapq.heappush(self.heap, (deadline, generation, entity_type, record.id, kind))
+                pushed = True
+        if not pushed:
+            del self.generations[key]
+
+    def forget(self, entity_type, entity_id):
+        self.generations.pop((entity_type, entity_id), None)
+
+    def poll_changes(self):
+        """Reschedule every case and ticket touched since the last poll"""
+        applied = 0
+        while True:
+            entries = db.session.execute(
+                select(ChangeLog.id, ChangeLog.entity_type, ChangeLog.entity_id, ChangeLog.action)
+                .where(ChangeLog.id > self.cursor, ChangeLog.entity_type.in_(list(TRACKED)))
+                .order_by(ChangeLog.id).limit(CHANGE_BATCH_SIZE)).all()
+            if not entries:
+                return applied
+            self.cursor = entries[-1].id
+            changed = {entity_type: set() for entity_type in TRACKED}
+            for entry in entries:
+                changed[entry.entity_type].add(entry.entity_id)
+            for entity_type, ids in changed.items():
+                if not ids:
+                    continue
+                model = TRACKED[entity_type]['model']
+                rows = db.session.execute(
+                    select(model.id, model.priority, model.status, model.created_at).where(model.id.in_(ids))).all()
+                for row in rows:
+                    self.schedule(entity_type, row)
+                # Deleted or archived
+                for entity_id in ids - {row.id for row in rows}:
+                    self.forget(entity_type, entity_id)
+            applied += len(entries)
+
+    def next_deadline(self):
+        """Earliest live deadline, discarding stale entries on the way"""
+        while self.heap and self.generations.get(self.heap[0][2:4]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def fire_due(self, now):
+        """Handle every deadline at or before now; returns the breaches recorded, as dicts"""
+        breaches = []
+        workloads = {}
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                break
+            _, _, entity_type, entity_id, kind = heapq.heappop(self.heap)
+            breach = self.breach(entity_type, entity_id, kind, now, workloads)
+            if breach is not None:
+                # Snapshot before the commit expires it
+                breaches.append({'entity_type': entity_type, 'entity_id': entity_id, 'kind': kind,
+                                 'priority': breach.priority, 'action': breach.action,
+                                 'new_priority': breach.new_priority, 'reassigned_to_id': breach.reassigned_to_id})
+                if len(breaches) % BREACH_COMMIT_SIZE == 0:
+                    db.session.commit()
+        db.session.commit()
+        return breaches
+
+    def breach(self, entity_type, entity_id, kind, now, workloads):
+        """Escalate or reassign a record whose deadline passed, re-checked against the database"""
+        spec = TRACKED[entity_type]
+        record = db.session.get(spec['model'], entity_id)
+        if record is None:
+            self.forget(entity_type, entity_id)
+            return None
+        key = (entity_type, entity_id)
+        deadline = deadline_for(entity_type, record, kind, self.last_breach.get(key))
+        if deadline is None or deadline > now:
+            # Changed since it was scheduled and the change feed has not caught up yet
+            self.schedule(entity_type, record)
+            return None
+
+        breach = SlaBreach(entity_type=entity_type, entity_id=entity_id, kind=kind,
+                           priority=record.priority, deadline=deadline, breached_at=now, action='none')
+        level = PRIORITIES.index(record.priority) if record.priority in PRIORITIES else 1
+        if level < len(PRIORITIES) - 1:
+            record.priority = breach.new_priority = PRIORITIES[level + 1]
+            breach.action = 'escalated'
+        else:
+            if entity_type not in workloads:
+                workloads[entity_type] = staff_workload(spec)
+            workload = workloads[entity_type]
+            current = getattr(record, spec['assignee'])
+            candidates = [user_id for user_id in workload if user_id != current]
+            if candidates:
+                assignee = min(candidates, key=lambda user_id: (workload[user_id], user_id))
+                workload[assignee] += 1
+                if current in workload:
+                    workload[current] -= 1
+                setattr(record, spec['assignee'], assignee)
+                breach.reassigned_to_id = assignee
+                breach.action = 'reassigned'
+        db.session.add(breach)
+        self.last_breach[key] = now
+        self.schedule(entity_type, record)
+        return breach
+
+def staff_workload(spec):
+    """{staff id: open records of this kind assigned to them} for every active staff member"""
+    model = spec['model']
+    assignee = getattr(model, spec['assignee'])
+    load = dict(db.session.execute(
+        select(assignee, func.count()).where(model.status.notin_(spec['closed']), assignee.isnot(None))
+        .group_by(assignee)).all())
+    staff = db.session.execute(select(User.id).where(User.role == 'staff', User.is_active.is_(True))).scalars()
+    return {user_id: load.get(user_id, 0) for user_id in staff}
+
+@register_collector
+def sla_breach_metrics():
+    """Breach totals come from the table, so every worker reports what the scheduler recorded"""
+    rows = db.session.execute(
+        select(SlaBreach.entity_type, SlaBreach.kind, SlaBreach.priority, SlaBreach.action, func.count())
+        .group_by(SlaBreach.entity_type, SlaBreach.kind, SlaBreach.priority, SlaBreach.action)).all()
+    return gauge_lines(
+        'sla_breaches_total', 'Missed SLA targets by record type, target, priority at breach and action taken',
+        [(('entity_type', 'kind', 'priority', 'action'), tuple(row[:4]), row[4]) for row in rows], kind='counter')
+
+@click.command('sla-scheduler')
+@click.option('--once', is_flag=True, help='Handle deadlines already due and exit, for running from cron')
+@click.option('--poll-interval', type=float, default=5.0, show_default=True,
+              help='Longest sleep between change feed polls, in seconds')
+@with_appcontext
+def sla_scheduler_command(once, poll_interval):
+    """Escalate or reassign tickets and cases that miss their SLA targets."""
+    scheduler = SlaScheduler()
+    scheduler.load()
+    click.echo(f'Tracking {len(scheduler.generations)} open records with {len(scheduler.heap)} deadlines')
+    try:
+        while True:
+            scheduler.poll_changes()
+            for breach in scheduler.fire_due(datetime.utcnow()):
+                click.echo(f"{breach['entity_type']} {breach['entity_id']} missed its {breach['kind']} target "
+                           f"({breach['priority']}): {breach['action']}")
+            if once:
+                return
+            # Release the read snapshot so the web workers' writes are never held up
+            db.session.close()
+            wake = scheduler.next_deadline()
+            delay = poll_interval if wake is None else (wake - datetime.utcnow()).total_seconds()
+            time.sleep(min(max(delay, 0), poll_interval))
+    except KeyboardInterrupt:
+        pass
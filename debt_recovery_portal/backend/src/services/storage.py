@@ -0,0 +1,473 @@
+"""Pluggable storage for document files.
+
+Document.file_path holds a storage key: a '/'-separated path relative to
+the store. New files get hash-sharded keys (ab/cd/<uuid>.pdf), so no
+directory or listing prefix grows with a single case. Keys written by the
+old flat layout ('uploads/case_12/<uuid>.pdf') are still read: the
+'uploads/' prefix is dropped, which leaves 'case_12/<uuid>.pdf' under the
+same root.
+
+STORAGE_BACKEND picks the driver:
+
+- local: files under STORAGE_ROOT on this host's disk.
+- s3: any S3-compatible object store. The signing (SigV4), multipart
+  uploads and pre-signed download URLs use only the stdlib. Every app node
+  can then share one bucket, and downloads redirect to the store instead
+  of streaming through a worker. bench/s3_server.py is a local stand-in.
+
+Both drivers list keys in byte order, which is what the
+reconcile-documents merge join relies on.
+"""
+import abc
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import quote, urlsplit
+import click
+from flask import current_app, redirect, send_file
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from src.models.user import db
+from src.models.document import Document
+from src.models.archive import ArchivedDocument
+
+DEFAULT_ROOT = 'uploads'
+# Prefix of file_path values written before storage keys existed
+LEGACY_PREFIX = 'uploads/'
+COPY_BUFFER_SIZE = 1024 * 1024
+DEFAULT_SCAN_WORKERS = 16
+DEFAULT_URL_EXPIRY = 300
+# S3 parts must be at least 5 MiB, except the last one
+PART_SIZE = 8 * 1024 * 1024
+LIST_PAGE_SIZE = 1000
+SYNC_BATCH_SIZE = 1000
+
+StoredFile = namedtuple('StoredFile', 'key size mtime')
+ScanEntry = namedtuple('ScanEntry', 'sort_name name is_dir size mtime')
+
+class StorageError(Exception):
+    """The object store rejected a request"""
+
+def sharded_key(filename):
+    """ab/cd/<filename>, from a hash of the (already unique) filename"""
+    digest = hashlib.sha256(filename.encode()).hexdigest()
+    return f'{digest[:2]}/{digest[2:4]}/{filename}'
+
+def read_full(stream, size):
+    """Read up to size bytes, looping over short reads"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+class StorageBackend(abc.ABC):
+    """Where document files live. Every method takes a key as stored in Document.file_path."""
+
+    def new_key(self, filename):
+        return sharded_key(filename)
+
+    def normalize(self, key):
+        return key[len(LEGACY_PREFIX):] if key.startswith(LEGACY_PREFIX) else key
+
+    @abc.abstractmethod
+    def save(self, key, stream, content_type=None):
+        """Store everything readable from stream under key; returns the size in bytes"""
+
+    @abc.abstractmethod
+    def open(self, key):
+        """Readable binary stream for key, usable as a context manager; FileNotFoundError if absent"""
+
+    @abc.abstractmethod
+    def size(self, key):
+        """Size in bytes, or None if nothing is stored under key"""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Remove the file under key; returns whether there was one"""
+
+    @abc.abstractmethod
+    def download(self, key, download_name, mimetype):
+        """Flask response sending the file as an attachment, or None if it is missing"""
+
+    @abc.abstractmethod
+    def iter_files(self, workers=DEFAULT_SCAN_WORKERS):
+        """Every stored file as a StoredFile, in key order"""
+
+def list_directory(path):
+    """One directory's entries in path order; directories sort as name + '/' like the full paths do"""
+    entries = []
+    try:
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append(ScanEntry(entry.name + '/', entry.name, True, None, None))
+                else:
+                    stat = entry.stat()
+                    entries.append(ScanEntry(entry.name, entry.name, False, stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        # Removed while the scan was running
+        return []
+    entries.sort()
+    return entries
+
+class TreeScanner:
+    """Walks a directory tree with parallel scandir calls, yielding files in sorted key order"""
+
+    def __init__(self, root, workers=DEFAULT_SCAN_WORKERS):
+        self.root = root
+        self.workers = workers
+        # Listings requested ahead of the walk, per directory level being consumed
+        self.window = workers * 4
+
+    def files(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='storage-scan') as pool:
+            yield from self._walk(pool, '', pool.submit(list_directory, self.root))
+
+    def _walk(self, pool, prefix, listing):
+        entries = listing.result()
+        directories = (index for index, entry in enumerate(entries) if entry.is_dir)
+        pending = {}
+        for index, entry in enumerate(entries):
+            # Keep the next few subdirectory listings in flight while this level is consumed
+            while len(pending) < self.window:
+                next_index = next(directories, None)
+                if next_index is None:
+                    break
+                pending[next_index] = pool.submit(
+                    list_directory, os.path.join(self.root, prefix + entries[next_index].name))
+            if entry.is_dir:
+                yield from self._walk(pool, prefix + entry.sort_name, pending.pop(index))
+            else:
+                yield StoredFile(prefix + entry.name, entry.size, entry.mtime)
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def normalize(self, key):
+        if os.path.isabs(key):
+            # Absolute paths inside the root become keys; anything else is read where it is
+            if os.path.commonpath([key, self.root]) == self.root:
+                return os.path.relpath(key, self.root).replace(os.sep, '/')
+            return key
+        return super().normalize(key)
+
+    def path(self, key):
+        key = self.normalize(key)
+        return key if os.path.isabs(key) else os.path.join(self.root, *key.split('/'))
+
+    def save(self, key, stream, content_type=None):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write next to the target and rename, so a half-written file is never visible under its key
+        handle = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+        try:
+            with handle:
+                shutil.copyfileobj(stream, handle, COPY_BUFFER_SIZE)
+            # mkstemp creates files owner-only; match what a plain open() would have left
+            os.chmod(handle.name, 0o644)
+            os.replace(handle.name, path)
+        except BaseException:
+            os.unlink(handle.name)
+            raise
+        return os.path.getsize(path)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def size(self, key):
+        try:
+            return os.stat(self.path(key)).st_size
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def download(self, key, download_name, mimetype):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+    def iter_files(self, workers=DEFAULT_SCAN_WORKERS):
+        if not os.path.isdir(self.root):
+            return iter(())
+        return TreeScanner(self.root, workers).files()
+
+def uri_encode(value, safe=''):
+    """RFC 3986 encoding as SigV4 wants it: everything but unreserved characters"""
+    return quote(value, safe='-_.~' + safe)
+
+def canonical_query(params):
+    return '&'.join(sorted(f'{uri_encode(name)}={uri_encode(value)}' for name, value in params))
+
+def signing_key(secret_key, date, region, service='s3'):
+    key = f'AWS4{secret_key}'.encode()
+    for part in (date, region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+def sigv4_signature(secret_key, region, amz_date, method, path, params, headers, payload_hash):
+    """(signed header names, hex signature) for one request; headers must include host"""
+    names = sorted(name.lower() for name in headers)
+    values = {name.lower(): ' '.join(str(value).split()) for name, value in headers.items()}
+    signed_headers = ';'.join(names)
+    canonical_request = '\n'.join([
+        method, uri_encode(path, safe='/'), canonical_query(params),
+        ''.join(f'{name}:{values[name]}\n' for name in names), signed_headers, payload_hash
+    ])
+    scope = f'{amz_date[:8]}/{region}/s3/aws4_request'
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+    signature = hmac.new(signing_key(secret_key, amz_date[:8], region), string_to_sign.encode(),
+                         hashlib.sha256).hexdigest()
+    return signed_headers, signature
+
+def xml_text(element, name):
+    # S3 responses are namespaced; match the local name only
+    found = element.find(f'{{*}}{name}')
+    return found.text if found is not None else None
+
+class ObjectStream:
+    """Body of a GET, closing the connection along with the response"""
+
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.response = response
+
+    def read(self, size=-1):
+        # HTTPResponse.read(-1) reads to EOF, which on a kept-alive connection never comes
+        if size is None or size < 0:
+            return self.response.read()
+        return self.response.read(size)
+
+    def close(self):
+        self.response.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class S3Storage(StorageBackend):
+    """S3-compatible object store addressed path-style: <endpoint>/<bucket>/<prefix><key>"""
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1', prefix='',
+                 url_expiry=DEFAULT_URL_EXPIRY, timeout=30):
+        parts = urlsplit(endpoint)
+        self.endpoint = endpoint.rstrip('/')
+        self.connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        self.host = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url_expiry = url_expiry
+        self.timeout = timeout
+
+    def _path(self, key=None):
+        bucket_path = f'{self.base_path}/{self.bucket}'
+        return bucket_path if key is None else f'{bucket_path}/{self.prefix}{self.normalize(key)}'
+
+    def _request(self, method, path, params=(), headers=None, body=b'', stream=False):
+        """Send a signed request; returns (response, body bytes) or an ObjectStream when stream is set"""
+        params = list(params)
+        payload_hash = hashlib.sha256(body).hexdigest()
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        headers = dict(headers or {}, host=self.host)
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed_headers, signature = sigv4_signature(self.secret_key, self.region, amz_date, method, path,
+                                                    params, headers, payload_hash)
+        headers['Authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, '
+            f'SignedHeaders={signed_headers}, Signature={signature}')
+        url = uri_encode(path, safe='/') + (f'?{canonical_query(params)}' if params else '')
+
+        connection = self.connection_class(self.host, timeout=self.timeout)
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            if stream and response.status == 200:
+                # The stream owns the connection from here and closes it with the body
+                return ObjectStream(connection, response)
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        # Every non-streamed outcome, including error statuses on a streamed GET
+        connection.close()
+        if response.status == 404:
+            raise FileNotFoundError(path)
+        # CompleteMultipartUpload can fail with a 200 and an <Error> body
+        if response.status >= 300 or (method == 'POST' and b'<Error>' in data[:200]):
+            code = None
+            if data:
+                try:
+                    code = xml_text(ElementTree.fromstring(data), 'Code')
+                except ElementTree.ParseError:
+                    pass
+            raise StorageError(f'{method} {path} failed: HTTP {response.status} {code or ""}'.strip())
+        return response, data
+
+    def save(self, key, stream, content_type=None):
+        path = self._path(key)
+        headers = {'content-type': content_type or 'application/octet-stream'}
+        part = read_full(stream, PART_SIZE)
+        if len(part) < PART_SIZE:
+            self._request('PUT', path, headers=headers, body=part)
+            return len(part)
+
+        _, data = self._request('POST', path, [('uploads', '')], headers=headers)
+        upload_id = xml_text(ElementTree.fromstring(data), 'UploadId')
+        parts = []
+        total = 0
+        try:
+            while part:
+                number = len(parts) + 1
+                response, _ = self._request('PUT', path, [('partNumber', str(number)), ('uploadId', upload_id)],
+                                            body=part)
+                parts.append((number, response.getheader('ETag')))
+                total += len(part)
+                part = read_full(stream, PART_SIZE)
+            manifest = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                               for number, etag in parts)
+            self._request('POST', path, [('uploadId', upload_id)], headers={'content-type': 'application/xml'},
+                          body=f'<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>'.encode())
+        except BaseException:
+            try:
+                self._request('DELETE', path, [('uploadId', upload_id)])
+            except (OSError, StorageError):
+                pass
+            raise
+        return total
+
+    def open(self, key):
+        return self._request('GET', self._path(key), stream=True)
+
+    def size(self, key):
+        try:
+            response, _ = self._request('HEAD', self._path(key))
+        except FileNotFoundError:
+            return None
+        return int(response.getheader('Content-Length'))
+
+    def delete(self, key):
+        self._request('DELETE', self._path(key))
+        return True
+
+    def presigned_url(self, key, download_name=None, mimetype=None, expires=None):
+        """GET URL for key that works without credentials for `expires` seconds"""
+        path = self._path(key)
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        params = [
+            ('X-Amz-Algorithm', 'AWS4-HMAC-SHA256'),
+            ('X-Amz-Credential', f'{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request'),
+            ('X-Amz-Date', amz_date),
+            ('X-Amz-Expires', str(expires or self.url_expiry)),
+            ('X-Amz-SignedHeaders', 'host'),
+        ]
+        if download_name:
+            params.append(('response-content-disposition',
+                           f"attachment; filename*=UTF-8''{uri_encode(download_name)}"))
+        if mimetype:
+            params.append(('response-content-type', mimetype))
+        _, signature = sigv4_signature(self.secret_key, self.region, amz_date, 'GET', path, params,
+                                       {'host': self.host}, 'UNSIGNED-PAYLOAD')
+        params.append(('X-Amz-Signature', signature))
+        return f'{urlsplit(self.endpoint).scheme}://{self.host}{uri_encode(path, safe="/")}?{canonical_query(params)}'
+
+    def download(self, key, download_name, mimetype):
+        # The store answers 404 itself, so no HEAD round trip before redirecting
+        return redirect(self.presigned_url(key, download_name, mimetype), code=302)
+
+    def iter_files(self, workers=DEFAULT_SCAN_WORKERS):
+        token = None
+        while True:
+            params = [('list-type', '2'), ('max-keys', str(LIST_PAGE_SIZE)), ('prefix', self.prefix)]
+            if token:
+                params.append(('continuation-token', token))
+            _, data = self._request('GET', self._path(), params)
+            page = ElementTree.fromstring(data)
+            for item in page.findall('{*}Contents'):
+                modified = datetime.strptime(xml_text(item, 'LastModified')[:19], '%Y-%m-%dT%H:%M:%S')
+                yield StoredFile(xml_text(item, 'Key')[len(self.prefix):], int(xml_text(item, 'Size')),
+                                 modified.replace(tzinfo=timezone.utc).timestamp())
+            token = xml_text(page, 'NextContinuationToken')
+            if xml_text(page, 'IsTruncated') != 'true' or not token:
+                return
+
+def create_storage(config):
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(config.get('STORAGE_ROOT') or DEFAULT_ROOT)
+    if backend == 's3':
+        return S3Storage(
+            config['STORAGE_S3_ENDPOINT'], config['STORAGE_S3_BUCKET'],
+            config['STORAGE_S3_ACCESS_KEY'], config['STORAGE_S3_SECRET_KEY'],
+            region=config.get('STORAGE_S3_REGION') or 'us-east-1',
+            prefix=config.get('STORAGE_S3_PREFIX') or '',
+            url_expiry=config.get('STORAGE_URL_EXPIRY', DEFAULT_URL_EXPIRY)
+        )
+    raise ValueError(f'Unknown STORAGE_BACKEND {backend!r}; use local or s3')
+
+def init_storage(app):
+    app.extensions['storage'] = create_storage(app.config)
+
+def get_storage():
+    return current_app.extensions['storage']
+
+@click.command('sync-storage')
+@click.option('--source', default=DEFAULT_ROOT, show_default=True,
+              help='Local upload directory holding the files to copy')
+@with_appcontext
+def sync_storage_command(source):
+    """Copy document files from a local directory into the configured storage where they are missing."""
+    storage = get_storage()
+    origin = LocalStorage(source)
+    started = time.monotonic()
+    copied = present = missing = 0
+    for table in (Document.__table__, ArchivedDocument.__table__):
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, table.c.file_path, table.c.mime_type)
+                .where(table.c.id > last_id).order_by(table.c.id).limit(SYNC_BATCH_SIZE)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            for _, file_path, mime_type in rows:
+                if storage.size(file_path) is not None:
+                    present += 1
+                    continue
+                try:
+                    with origin.open(file_path) as handle:
+                        storage.save(file_path, handle, mime_type)
+                    copied += 1
+                except FileNotFoundError:
+                    missing += 1
+    click.echo(f'Copied {copied} files ({present} already stored, {missing} missing from {source}) '
+               f'in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,158 @@
+"""Constant-memory writers for streamed downloads.
+
+Each generator yields bytes as soon as they are produced, so a Flask
+response (or a file) can be fed row by row without ever holding the
+whole document. ZIP and XLSX output are written to a non-seekable buffer,
+which zipfile supports through data descriptors.
+"""
+import csv
+import io
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+CSV_FLUSH_SIZE = 64 * 1024
+ZIP_READ_SIZE = 1024 * 1024
+# Entries at least this large get zip64 headers up front; sizes are unknown until written
+ZIP64_THRESHOLD = 1 << 31
+
+class ChunkBuffer(io.RawIOBase):
+    """Write-only sink that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class ZipEntry:
+    """One archive member: a name, a timestamp and a callable returning a readable binary stream.
+
+    The callable may return None to leave the member out.
+    """
+
+    def __init__(self, name, opener, size=0, modified=None, compress=True):
+        self.name = name
+        self.opener = opener
+        self.size = size
+        self.modified = modified or datetime.utcnow()
+        self.compress = compress
+
+def iter_zip(entries):
+    """Yield a ZIP archive built on the fly, one read-sized chunk at a time"""
+    sink = ChunkBuffer()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for entry in entries:
+            source = entry.opener()
+            if source is None:
+                continue
+            info = zipfile.ZipInfo(entry.name, date_time=max(entry.modified, datetime(1980, 1, 1)).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if entry.compress else zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            with source, archive.open(info, 'w', force_zip64=entry.size >= ZIP64_THRESHOLD) as target:
+                while True:
+                    data = source.read(ZIP_READ_SIZE)
+                    if not data:
+                        break
+                    target.write(data)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            yield sink.drain()
+    yield sink.drain()
+
+def iter_csv(header, rows):
+    """Yield a CSV document one row at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_FLUSH_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+def xlsx_workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+def iter_xlsx(header, rows, sheet_name='Sheet1'):
+    """Yield a single-sheet XLSX workbook, writing the sheet XML incrementally"""
+    sink = ChunkBuffer()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        workbook.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        workbook.writestr('xl/workbook.xml', xlsx_workbook(sheet_name))
+        workbook.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(xlsx_row(header).encode('utf-8'))
+            for row in rows:
+                sheet.write(xlsx_row(row).encode('utf-8'))
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
@@ -0,0 +1,187 @@
+"""In-memory prefix index over the user directory for typeahead pickers.
+
+Every user contributes normalized tokens (username, email, first and last
+name, company words) to one sorted list of (token, user id, weight)
+entries, so a prefix lookup is two bisects and a slice. Committed ORM
+changes to users are applied to the index incrementally; a periodic
+rebuild (USER_DIRECTORY_TTL seconds) picks up writes made by other worker
+processes or outside the ORM. Only one thread rebuilds at a time; changes
+committed while it reads the table are replayed onto the new index.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from src.models.user import User, db
+
+DEFAULT_TTL = 300
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Lower weight ranks higher when a query term matches a token from that field
+FIELD_WEIGHTS = {'username': 0, 'name': 1, 'email': 2, 'company': 3}
+INDEXED_COLUMNS = ('id', 'username', 'email', 'first_name', 'last_name', 'company', 'role', 'is_active')
+
+_WORD = re.compile(r'[^\W_]+')
+
+def normalize(value):
+    """Case- and accent-insensitive form used for both tokens and queries"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+def user_tokens(user):
+    """{token: weight} for one user; whole field values plus their separate words"""
+    tokens = {}
+    def add(text, field, whole=False):
+        text = normalize(text)
+        words = _WORD.findall(text)
+        if whole and text:
+            words.append(text)
+        for word in words:
+            tokens[word] = min(tokens.get(word, FIELD_WEIGHTS[field]), FIELD_WEIGHTS[field])
+    add(user['username'], 'username', whole=True)
+    add(user['first_name'], 'name', whole=True)
+    add(user['last_name'], 'name', whole=True)
+    add(user['email'], 'email', whole=True)
+    add(user['company'], 'company')
+    return tokens
+
+class UserDirectory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = None  # changes committed during a rebuild, replayed after the swap
+        self._entries = []  # sorted (token, user_id, weight)
+        self._users = {}  # user_id -> {'role', 'is_active', 'sort_key', 'tokens'}
+        self._built_at = None
+
+    def _record(self, user):
+        return {
+            'role': user['role'],
+            'is_active': user['is_active'],
+            'sort_key': (normalize(user['last_name']), normalize(user['first_name']), user['id']),
+            'tokens': user_tokens(user)
+        }
+
+    def rebuild(self):
+        """Reload every user's indexed columns in one query and swap the index in"""
+        with self._lock:
+            self._rebuilding = {}
+        try:
+            rows = db.session.execute(select(*[User.__table__.c[name] for name in INDEXED_COLUMNS])).mappings()
+            users = {}
+            entries = []
+            for row in rows:
+                record = self._record(row)
+                users[row['id']] = record
+                entries.extend((token, row['id'], weight) for token, weight in record['tokens'].items())
+            entries.sort()
+        except BaseException:
+            with self._lock:
+                self._rebuilding = None
+            raise
+        with self._lock:
+            self._entries, self._users, self._built_at = entries, users, time.monotonic()
+            # The read may predate these commits; applying them again is harmless
+            replay, self._rebuilding = self._rebuilding, None
+            self._apply(replay)
+
+    def _stale(self, ttl):
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at > ttl
+
+    def ensure_fresh(self):
+        ttl = current_app.config.get('USER_DIRECTORY_TTL', DEFAULT_TTL)
+        if not self._stale(ttl):
+            return
+        with self._rebuild_lock:
+            # Requests that queued behind another rebuild find the index fresh
+            if self._stale(ttl):
+                self.rebuild()
+
+    def apply(self, changes):
+        """Apply committed changes: {user_id: column dict, or None when deleted}"""
+        with self._lock:
+            if self._rebuilding is not None:
+                self._rebuilding.update(changes)
+            if self._built_at is not None:
+                self._apply(changes)
+
+    def _apply(self, changes):
+        # Caller holds self._lock
+        for user_id, user in changes.items():
+            old = self._users.pop(user_id, None)
+            if old:
+                for token, weight in old['tokens'].items():
+                    index = bisect_left(self._entries, (token, user_id))
+                    if index < len(self._entries) and self._entries[index] == (token, user_id, weight):
+                        del self._entries[index]
+            if user is not None:
+                record = self._record(user)
+                self._users[user_id] = record
+                for token, weight in record['tokens'].items():
+                    insort(self._entries, (token, user_id, weight))
+
+    def _prefix_matches(self, prefix):
+        """{user_id: best weight} for users with a token starting with prefix"""
+        matches = {}
+        start = bisect_left(self._entries, (prefix,))
+        # Every token with this prefix sorts before prefix + the highest code point
+        end = bisect_left(self._entries, (prefix + '\U0010ffff',), start)
+        for token, user_id, weight in self._entries[start:end]:
+            if token == prefix:
+                weight -= 0.5
+            if weight < matches.get(user_id, weight + 1):
+                matches[user_id] = weight
+        return matches
+
+    def search(self, query, roles=None, active=None, limit=DEFAULT_LIMIT):
+        """Ids of the best `limit` users whose tokens prefix-match every query term"""
+        terms = normalize(query).split()
+        with self._lock:
+            def allowed(user_id):
+                record = self._users[user_id]
+                return (roles is None or record['role'] in roles) and \
+                    (active is None or record['is_active'] == active)
+
+            if not terms:
+                ranked = ((self._users[user_id]['sort_key'], user_id) for user_id in self._users if allowed(user_id))
+                return [user_id for _, user_id in heapq.nsmallest(limit, ranked)]
+
+            # Scan the most selective term's range first, then intersect the rest
+            per_term = sorted((self._prefix_matches(term) for term in terms), key=len)
+            scores = {user_id: weight for user_id, weight in per_term[0].items() if allowed(user_id)}
+            for matches in per_term[1:]:
+                scores = {user_id: score + matches[user_id] for user_id, score in scores.items() if user_id in matches}
+            ranked = ((score, self._users[user_id]['sort_key'], user_id) for user_id, score in scores.items())
+            return [user_id for _, _, user_id in heapq.nsmallest(limit, ranked)]
+
+directory = UserDirectory()
+
+def user_columns(user):
+    return {name: getattr(user, name) for name in INDEXED_COLUMNS}
+
+@event.listens_for(Session, 'after_flush')
+def collect_user_changes(session, flush_context):
+    """Snapshot flushed users now; attributes are expired by the time the commit lands"""
+    pending = session.info.setdefault('user_directory_changes', {})
+    for user in session.new | session.dirty:
+        if isinstance(user, User):
+            pending[user.id] = user_columns(user)
+    for user in session.deleted:
+        if isinstance(user, User):
+            pending[user.id] = None
+
+@event.listens_for(Session, 'after_commit')
+def apply_user_changes(session):
+    changes = session.info.pop('user_directory_changes', None)
+    if changes:
+        directory.apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_user_changes(session):
+    session.info.pop('user_directory_changes', None)
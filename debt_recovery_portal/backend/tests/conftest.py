@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import pytest
+
+# src.main builds the app and its database at import time, so point it at scratch space first
+_scratch = tempfile.mkdtemp(prefix='portal-tests-')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(_scratch, 'app.db')}"
+os.environ['STORAGE_ROOT'] = os.path.join(_scratch, 'uploads')
+# A replica that only serves reads once a test copies the primary onto it; tests stamp heartbeats themselves
+os.environ['SQLALCHEMY_REPLICA_URIS'] = f"sqlite:///{os.path.join(_scratch, 'replica.db')}"
+os.environ['REPLICA_HEARTBEAT_INTERVAL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app as portal_app
+from src.models.user import db
+from src.models.replication import ReplicationHeartbeat
+from src.services.db_routing import sqlite_path
+
+@pytest.fixture(scope='session')
+def app():
+    portal_app.config['TESTING'] = True
+    return portal_app
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+def login(app, username, password):
+    """A test client holding a session for the given user"""
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+@pytest.fixture
+def admin_client(app):
+    return login(app, 'admin', 'admin123')
+
+@pytest.fixture
+def login_as(app):
+    """login() for tests that need several sessions"""
+    return lambda username, password: login(app, username, password)
+
+@pytest.fixture
+def router(app):
+    return app.extensions['db_router']
+
+@pytest.fixture
+def sync_replica(app, router):
+    """Copy the primary onto the replica the way external replication would: data only, no heartbeat"""
+    replica = router.replicas[0]
+
+    def sync():
+        source = sqlite3.connect(sqlite_path(app.config['SQLALCHEMY_DATABASE_URI']))
+        target = sqlite3.connect(replica.engine.url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        replica.checked_at = 0.0
+
+    yield sync
+    # Leave the replica unusable so other tests read from the primary
+    with replica.engine.begin() as connection:
+        connection.execute(ReplicationHeartbeat.__table__.delete())
+    replica.checked_at = 0.0
+    replica.lag = None
+
+@pytest.fixture
+def reader(app, login_as):
+    """Admin client without the read-your-writes window its login opened"""
+    client = login_as('admin', 'admin123')
+    with client.session_transaction() as session:
+        session.pop('db_primary_until', None)
+    return client
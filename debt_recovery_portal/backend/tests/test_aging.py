@@ -0,0 +1,73 @@
+import csv
+import io
+from datetime import date, datetime, timedelta
+import pytest
+from src.models.user import User, db
+from src.models.case import Case
+
+AS_OF = date(2025, 6, 30)
+COMPANY = 'Aging Boundaries plc'
+# Days overdue on the as-of date, and the bucket each must land in
+BOUNDARIES = [(-1, 'current'), (0, '0-30'), (30, '0-30'), (31, '31-60'), (60, '31-60'),
+              (61, '61-90'), (90, '61-90'), (91, '90+')]
+
+@pytest.fixture(scope='module')
+def aging_cases(app):
+    """One case per boundary for a client of its own, so its group holds nothing else"""
+    with app.app_context():
+        client = User(username='aging-client', email='aging-client@example.com', first_name='Aging',
+                      last_name='Client', company=COMPANY, role='client')
+        client.set_password('aging123')
+        db.session.add(client)
+        db.session.flush()
+        cases = {}
+        for days, bucket in BOUNDARIES:
+            cases[days] = Case(title=f'Aged {days}', amount_owed=100 + days, debtor_company='Aging Debtor',
+                               client_id=client.id, original_due_date=AS_OF - timedelta(days=days))
+        # No due date: ages from the calendar day it was created, whatever the time of day
+        cases['created'] = Case(title='Aged from creation', amount_owed=1000, debtor_company='Aging Debtor',
+                                client_id=client.id, created_at=datetime(2025, 5, 31, 23, 59))
+        cases['settled'] = Case(title='Settled', amount_owed=5000, debtor_company='Aging Debtor', status='Resolved',
+                                client_id=client.id, original_due_date=AS_OF - timedelta(days=200))
+        db.session.add_all(cases.values())
+        db.session.commit()
+        return {key: case.id for key, case in cases.items()}
+
+def company_group(client, **params):
+    response = client.get('/api/reports/aging', query_string=dict(
+        {'as_of': AS_OF.isoformat(), 'group_by': 'client_company'}, **params))
+    assert response.status_code == 200, response.get_json()
+    summary = response.get_json()
+    assert summary['buckets'] == ['current', '0-30', '31-60', '61-90', '90+']
+    return next(group for group in summary['groups'] if group['key'] == COMPANY)
+
+def test_summary_buckets_boundaries(admin_client, aging_cases):
+    group = company_group(admin_client)
+    assert {name: bucket['count'] for name, bucket in group['buckets'].items()} == \
+        {'current': 1, '0-30': 3, '31-60': 2, '61-90': 2, '90+': 1}
+    assert group['buckets']['current']['amount'] == 99.0
+    assert group['buckets']['0-30']['amount'] == 100.0 + 130.0 + 1000.0
+    assert group['buckets']['90+']['amount'] == 191.0
+    assert group['total'] == {'count': 9, 'amount': sum(100.0 + days for days, _ in BOUNDARIES) + 1000.0}
+
+def test_settled_cases_only_with_include_settled(admin_client, aging_cases):
+    assert company_group(admin_client)['buckets']['90+']['count'] == 1
+    group = company_group(admin_client, include_settled='1')
+    assert group['buckets']['90+'] == {'count': 2, 'amount': 5191.0}
+
+def test_detail_rows_carry_age_and_bucket(admin_client, aging_cases):
+    response = admin_client.get('/api/reports/aging', query_string={'as_of': AS_OF.isoformat(), 'format': 'csv',
+                                                                    'detail': '1'})
+    assert response.status_code == 200
+    rows = {int(row['case_id']): row for row in csv.DictReader(io.StringIO(response.get_data(as_text=True)))}
+    for days, bucket in BOUNDARIES:
+        row = rows[aging_cases[days]]
+        assert (int(row['age_days']), row['bucket']) == (days, bucket)
+    created = rows[aging_cases['created']]
+    assert (created['aging_from'], created['age_days'], created['bucket']) == ('2025-05-31', '30', '0-30')
+    assert aging_cases['settled'] not in rows
+
+def test_invalid_parameters(admin_client):
+    assert admin_client.get('/api/reports/aging?group_by=staff').status_code == 400
+    assert admin_client.get('/api/reports/aging?as_of=30/06/2025').status_code == 400
+    assert admin_client.get('/api/reports/aging?format=pdf').status_code == 400
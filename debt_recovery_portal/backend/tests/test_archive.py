@@ -0,0 +1,65 @@
+import io
+import zipfile
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.archive import ArchivedCase, ArchivedDocument
+from src.services.archive import archive_closed_cases
+
+@pytest.fixture(scope='module')
+def archived_case(app):
+    """A closed case with one uploaded document, moved to the archive tables"""
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        case = Case(title='Settled invoice', amount_owed=250, debtor_company='Archive Test Ltd', client_id=admin.id)
+        db.session.add(case)
+        db.session.commit()
+        case_id = case.id
+
+    client = app.test_client()
+    client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    response = client.post(f'/api/cases/{case_id}/documents',
+                           data={'file': (io.BytesIO(b'paid in full'), 'receipt.txt'), 'description': 'Receipt'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_json()
+    document_id = response.get_json()['document']['id']
+
+    with app.app_context():
+        db.session.execute(db.update(Case).where(Case.id == case_id)
+                           .values(status='Closed', updated_at=datetime.utcnow() - timedelta(days=400)))
+        db.session.commit()
+        archive_closed_cases(older_than_days=365)
+        assert db.session.get(ArchivedCase, case_id) is not None
+        assert db.session.get(ArchivedDocument, document_id) is not None
+    return case_id, document_id
+
+def test_archived_case_lists_its_documents(admin_client, archived_case):
+    case_id, document_id = archived_case
+    response = admin_client.get(f'/api/cases/{case_id}/documents')
+    assert response.status_code == 200
+    assert [document['id'] for document in response.get_json()] == [document_id]
+
+def test_archived_document_metadata(admin_client, archived_case):
+    case_id, document_id = archived_case
+    response = admin_client.get(f'/api/documents/{document_id}')
+    assert response.status_code == 200
+    assert response.get_json()['case_id'] == case_id
+
+def test_archived_document_download(admin_client, archived_case):
+    _, document_id = archived_case
+    response = admin_client.get(f'/api/documents/{document_id}/download')
+    assert response.status_code == 200
+    assert response.data == b'paid in full'
+
+def test_archived_case_bundle(admin_client, archived_case):
+    case_id, document_id = archived_case
+    response = admin_client.get(f'/api/cases/{case_id}/bundle.zip')
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.data)).namelist()
+    assert names == [f'case_{case_id}/{document_id}_receipt.txt', f'case_{case_id}/manifest.csv']
+
+def test_unknown_document_is_404(admin_client):
+    assert admin_client.get('/api/documents/999999').status_code == 404
+    assert admin_client.get('/api/documents/999999/download').status_code == 404
+    assert admin_client.get('/api/cases/999999/bundle.zip').status_code == 404
@@ -0,0 +1,109 @@
+from src.models.user import User, db
+from src.models.case import Case
+
+def batch(client, requests, parallel=False, **kwargs):
+    response = client.post('/api/batch', json={'requests': requests, 'parallel': parallel}, **kwargs)
+    assert response.status_code == 200, response.get_json()
+    return {entry['id']: entry for entry in response.get_json()['responses']}
+
+def add_case(app, title):
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        case = Case(title=title, amount_owed=10, debtor_company='Batch Ltd', client_id=admin.id)
+        db.session.add(case)
+        db.session.commit()
+        return case.id
+
+def titles(entry):
+    assert entry['status'] == 200, entry
+    return {case['title'] for case in entry['body']}
+
+def refresh_replica(app, sync_replica):
+    """Stamp a heartbeat on the primary and copy it, with all data so far, onto the replica"""
+    result = app.test_cli_runner().invoke(args=['replication-heartbeat', '--once'])
+    assert result.exit_code == 0, result.output
+    sync_replica()
+
+def test_blocked_endpoints_fail_alone(admin_client):
+    responses = batch(admin_client, [
+        {'id': 'login', 'method': 'POST', 'path': '/api/auth/login', 'body': {'username': 'admin', 'password': 'admin123'}},
+        {'id': 'nested', 'method': 'POST', 'path': '/api/batch', 'body': {'requests': []}},
+        {'id': 'me', 'path': '/api/auth/me'}
+    ])
+    for blocked in ('login', 'nested'):
+        assert responses[blocked]['status'] == 400
+        assert responses[blocked]['body'] == {'error': 'Endpoint not allowed in a batch'}
+    assert responses['me']['status'] == 200
+
+def test_invalid_batches_are_rejected(admin_client):
+    assert admin_client.post('/api/batch', json={'requests': []}).status_code == 400
+    assert admin_client.post('/api/batch', json={'requests': [{'path': '/health'}]}).status_code == 400
+    assert admin_client.post('/api/batch', json={'requests': [{'method': 'PATCH', 'path': '/api/cases'}]}).status_code == 400
+    too_many = [{'path': '/api/auth/me'}] * 26
+    assert admin_client.post('/api/batch', json={'requests': too_many}).status_code == 400
+    assert admin_client.application.test_client().post('/api/batch', json={'requests': [{'path': '/api/auth/me'}]}).status_code == 401
+
+def test_sequential_mix_runs_in_order(admin_client):
+    responses = batch(admin_client, [
+        {'id': 'before', 'path': '/api/cases'},
+        {'id': 'create', 'method': 'POST', 'path': '/api/cases',
+         'body': {'title': 'Batched case', 'amount_owed': 250, 'debtor_company': 'Batch Ltd'}},
+        {'id': 'after', 'path': '/api/cases'},
+        {'id': 'invalid', 'method': 'POST', 'path': '/api/cases', 'body': {'title': 'No amount'}}
+    ])
+    assert 'Batched case' not in titles(responses['before'])
+    assert responses['create']['status'] == 201
+    assert 'Batched case' in titles(responses['after'])
+    assert responses['invalid']['status'] == 400
+    assert responses['invalid']['body'] == {'error': 'amount_owed is required'}
+
+def test_parallel_reads_match_sequential_reads(app, admin_client):
+    case_id = add_case(app, 'Parallel case')
+    requests = [
+        {'id': 'me', 'path': '/api/auth/me'},
+        {'id': 'cases', 'path': '/api/cases'},
+        {'id': 'case', 'path': f'/api/cases/{case_id}'},
+        {'id': 'missing', 'path': '/api/does-not-exist'},
+        {'id': 'tickets', 'path': '/api/my-tickets'}
+    ]
+    sequential = batch(admin_client, requests)
+    parallel = batch(admin_client, requests, parallel=True)
+    assert parallel == sequential
+    assert parallel['case']['body']['title'] == 'Parallel case'
+    assert parallel['missing']['status'] == 404
+
+def test_parallel_is_ignored_when_the_batch_writes(admin_client):
+    responses = batch(admin_client, [
+        {'id': 'create', 'method': 'POST', 'path': '/api/cases',
+         'body': {'title': 'Written in a parallel batch', 'amount_owed': 5, 'debtor_company': 'Batch Ltd'}},
+        {'id': 'after', 'path': '/api/cases'}
+    ], parallel=True)
+    assert responses['create']['status'] == 201
+    assert 'Written in a parallel batch' in titles(responses['after'])
+
+def test_batched_reads_use_a_fresh_replica(app, sync_replica, reader):
+    add_case(app, 'Replicated for batch')
+    refresh_replica(app, sync_replica)
+    add_case(app, 'Primary-only for batch')
+
+    for parallel in (False, True):
+        responses = batch(reader, [{'id': 'cases', 'path': '/api/cases'},
+                                   {'id': 'me', 'path': '/api/auth/me'}], parallel=parallel)
+        assert 'Replicated for batch' in titles(responses['cases'])
+        assert 'Primary-only for batch' not in titles(responses['cases'])
+
+    # The route override reaches the sub-requests
+    responses = batch(reader, [{'id': 'cases', 'path': '/api/cases'}], headers={'X-DB-Route': 'primary'})
+    assert 'Primary-only for batch' in titles(responses['cases'])
+
+def test_reads_after_a_batched_write_see_it(app, sync_replica, reader):
+    refresh_replica(app, sync_replica)
+    responses = batch(reader, [
+        {'id': 'create', 'method': 'POST', 'path': '/api/cases',
+         'body': {'title': 'Read your batched write', 'amount_owed': 5, 'debtor_company': 'Batch Ltd'}},
+        {'id': 'after', 'path': '/api/cases'}
+    ])
+    assert 'Read your batched write' in titles(responses['after'])
+    # The write opens the caller's read-your-writes window for the next request too
+    responses = batch(reader, [{'id': 'cases', 'path': '/api/cases'}])
+    assert 'Read your batched write' in titles(responses['cases'])
@@ -0,0 +1,59 @@
+import logging
+import time
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.replication import ReplicationHeartbeat
+from src.services.db_routing import HeartbeatWriter
+
+def add_case(app, title):
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        db.session.add(Case(title=title, amount_owed=10, debtor_company='Routing Ltd', client_id=admin.id))
+        db.session.commit()
+
+def titles(response):
+    assert response.status_code == 200
+    return {case['title'] for case in response.get_json()}
+
+def test_replica_with_fresh_heartbeat_serves_reads(app, sync_replica, reader):
+    result = app.test_cli_runner().invoke(args=['replication-heartbeat', '--once'])
+    assert result.exit_code == 0, result.output
+    add_case(app, 'Replicated case')
+    sync_replica()
+    # Written after the copy, so only the primary has it
+    add_case(app, 'Primary-only case')
+
+    replica_view = titles(reader.get('/api/cases'))
+    assert 'Replicated case' in replica_view
+    assert 'Primary-only case' not in replica_view
+    assert 'Primary-only case' in titles(reader.get('/api/cases', headers={'X-DB-Route': 'primary'}))
+
+def test_stale_replicas_fall_back_to_the_primary(app, router, sync_replica, reader, caplog, monkeypatch):
+    with app.app_context():
+        db.session.merge(ReplicationHeartbeat(id=1, beat_at=time.time() - 60))
+        db.session.commit()
+    sync_replica()
+    add_case(app, 'Written while lagging')
+    monkeypatch.setattr(router, 'warned_at', 0.0)
+
+    with caplog.at_level(logging.WARNING):
+        assert 'Written while lagging' in titles(reader.get('/api/cases'))
+    assert 'No replica within REPLICA_MAX_LAG' in caplog.text
+
+def test_heartbeat_writer_stamps_the_primary(app):
+    writer = HeartbeatWriter(interval=3600)
+    started = time.time()
+    writer.ensure_running(app)
+    thread = writer._thread
+    writer.ensure_running(app)
+    assert writer._thread is thread
+
+    deadline = time.monotonic() + 5
+    with app.app_context():
+        while True:
+            beat = db.session.get(ReplicationHeartbeat, 1, populate_existing=True)
+            db.session.rollback()
+            if beat is not None and beat.beat_at >= started:
+                break
+            assert time.monotonic() < deadline, 'no heartbeat written'
+            time.sleep(0.05)
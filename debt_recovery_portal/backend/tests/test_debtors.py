@@ -0,0 +1,23 @@
+from src.models.user import User, db
+from src.models.case import Case
+
+def test_related_debtors_of_unknown_case_is_404(admin_client):
+    response = admin_client.get('/api/cases/999999/related-debtors')
+    assert response.status_code == 404
+
+def test_related_debtors_groups_spellings(app, admin_client):
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        cases = [Case(title='Unpaid invoices', amount_owed=500, debtor_company=name, client_id=admin.id)
+                 for name in ['Northwind Traders Ltd', 'Northwind Traders Limited', 'NorthWind Trader']]
+        db.session.add_all(cases)
+        db.session.commit()
+        ids = [case.id for case in cases]
+
+    response = admin_client.get(f'/api/cases/{ids[0]}/related-debtors?threshold=0.5')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['debtor_key'] == 'northwind traders'
+    related = {case['id'] for match in body['matches'] for case in match['cases']}
+    assert {ids[1], ids[2]} <= related
+    assert ids[0] not in related
@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.idempotency import IdempotencyKey
+from src.routes import cases
+from src.services.idempotency import request_fingerprint
+
+def new_case(title):
+    return {'title': title, 'amount_owed': 1200, 'debtor_company': 'Idempotent Traders Ltd'}
+
+def case_count(app, title):
+    with app.app_context():
+        return Case.query.filter_by(title=title).count()
+
+def test_retry_replays_the_first_response(app, admin_client):
+    headers = {'Idempotency-Key': 'replay-1'}
+    first = admin_client.post('/api/cases', json=new_case('Replayed case'), headers=headers)
+    assert first.status_code == 201
+    # Same payload, serialized differently
+    retry = admin_client.post('/api/cases', json=dict(reversed(list(new_case('Replayed case').items()))),
+                              headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert case_count(app, 'Replayed case') == 1
+
+def test_key_reused_for_another_payload_is_422(app, admin_client):
+    headers = {'Idempotency-Key': 'mismatch-1'}
+    assert admin_client.post('/api/cases', json=new_case('First payload'), headers=headers).status_code == 201
+    response = admin_client.post('/api/cases', json=new_case('Second payload'), headers=headers)
+    assert response.status_code == 422
+    assert case_count(app, 'Second payload') == 0
+
+def test_keys_are_per_user(app, admin_client, login_as):
+    with app.app_context():
+        if not User.query.filter_by(username='idem-staff').first():
+            user = User(username='idem-staff', email='idem-staff@example.com', first_name='Idem', last_name='Staff',
+                        role='staff')
+            user.set_password('idem123')
+            db.session.add(user)
+            db.session.commit()
+    other = login_as('idem-staff', 'idem123')
+    headers = {'Idempotency-Key': 'shared-1'}
+    assert admin_client.post('/api/cases', json=new_case('Per user'), headers=headers).status_code == 201
+    response = other.post('/api/cases', json=new_case('Per user'), headers=headers)
+    assert response.status_code == 201 and 'Idempotent-Replayed' not in response.headers
+    assert case_count(app, 'Per user') == 2
+
+def test_slow_request_is_not_run_twice(app, login_as, monkeypatch):
+    # The claim would lapse three times over if only elapsed time counted
+    monkeypatch.setitem(app.config, 'IDEMPOTENCY_LOCK_TIMEOUT', 0.3)
+    monkeypatch.setitem(app.config, 'IDEMPOTENCY_WAIT', 1.0)
+    started = threading.Event()
+    assign = cases.assign_case_to_staff
+    def slow_assign(case):
+        started.set()
+        time.sleep(1.5)
+        return assign(case)
+    monkeypatch.setattr(cases, 'assign_case_to_staff', slow_assign)
+
+    headers = {'Idempotency-Key': 'slow-1'}
+    results = {}
+    first_client, second_client = login_as('admin', 'admin123'), login_as('admin', 'admin123')
+    first = threading.Thread(target=lambda: results.setdefault(
+        'first', first_client.post('/api/cases', json=new_case('Slow case'), headers=headers)))
+    first.start()
+    assert started.wait(5)
+    duplicate = second_client.post('/api/cases', json=new_case('Slow case'), headers=headers)
+    first.join()
+
+    assert duplicate.status_code == 409
+    assert results['first'].status_code == 201
+    assert case_count(app, 'Slow case') == 1
+    replayed = second_client.post('/api/cases', json=new_case('Slow case'), headers=headers)
+    assert replayed.headers['Idempotent-Replayed'] == 'true'
+
+def test_abandoned_claim_is_taken_over(app, admin_client):
+    payload = new_case('Abandoned case')
+    with app.test_request_context('/api/cases', method='POST', json=payload):
+        fingerprint = request_fingerprint()
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        stale = datetime.utcnow() - timedelta(seconds=app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60) + 60)
+        # What a worker that died mid-request leaves behind: a claim nobody renews
+        db.session.add(IdempotencyKey(user_id=admin.id, key='abandoned-1', fingerprint=fingerprint, status='in_progress',
+                                      locked_at=stale, expires_at=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+
+    response = admin_client.post('/api/cases', json=payload, headers={'Idempotency-Key': 'abandoned-1'})
+    assert response.status_code == 201
+    assert case_count(app, 'Abandoned case') == 1
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+import pytest
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.change_log import ChangeLog
+from src.services.interest import recompute_interest
+
+AS_OF = date(2025, 3, 15)
+
+@pytest.fixture
+def cases(app_context):
+    """Cases keyed by name, removed again afterwards"""
+    admin = User.query.filter_by(username='admin').first()
+    created = {
+        'simple': Case(amount_owed=1000, interest_rate=10, original_due_date=date(2025, 1, 1)),
+        'year': Case(amount_owed=2500, interest_rate=8, original_due_date=date(2024, 3, 15)),
+        'no_rate': Case(amount_owed=400, interest_rate=None, original_due_date=date(2024, 1, 1)),
+        'not_due': Case(amount_owed=300, interest_rate=12, original_due_date=date(2025, 6, 1)),
+        'from_created': Case(amount_owed=1000, interest_rate=10, created_at=datetime(2025, 1, 1, 18, 30)),
+        'settled': Case(amount_owed=700, interest_rate=20, original_due_date=date(2020, 1, 1), status='Closed',
+                        accrued_interest=0, total_amount_due=700),
+        'negative': Case(amount_owed=900, interest_rate=-5, original_due_date=date(2024, 1, 1))
+    }
+    for name, case in created.items():
+        case.title = f'Interest {name}'
+        case.debtor_company = 'Interest Ltd'
+        case.client_id = admin.id
+    db.session.add_all(created.values())
+    db.session.commit()
+    yield created
+    for case in created.values():
+        db.session.delete(case)
+    db.session.commit()
+
+def balances(cases):
+    db.session.expire_all()
+    return {name: (case.accrued_interest, case.total_amount_due) for name, case in cases.items()}
+
+def test_simple_accrual(cases):
+    result = recompute_interest(AS_OF)
+    assert balances(cases) == {
+        'simple': (20.0, 1020.0),  # 73 days at 10%
+        'year': (200.0, 2700.0),
+        'no_rate': (0.0, 400.0),
+        'not_due': (0.0, 300.0),
+        'from_created': (20.0, 1020.0),  # accrues from the creation date
+        'settled': (0.0, 700.0),
+        'negative': (0.0, None)
+    }
+    assert cases['simple'].interest_accrued_to == AS_OF
+    assert cases['settled'].interest_accrued_to is None
+    assert cases['negative'].id in result['skipped_ids']
+
+def test_compound_accrual(cases):
+    recompute_interest(AS_OF, method='compound', batch_size=2)
+    accrued = balances(cases)
+    assert accrued['simple'] == (20.2, 1020.2)
+    assert accrued['year'] == (208.19, 2708.19)
+    assert accrued['no_rate'] == (0.0, 400.0)
+
+def test_unchanged_cases_are_not_rewritten(cases):
+    recompute_interest(AS_OF)
+    cursor = db.session.query(db.func.max(ChangeLog.id)).scalar()
+    assert recompute_interest(AS_OF)['updated'] == 0
+    assert db.session.query(db.func.max(ChangeLog.id)).scalar() == cursor
+
+    result = recompute_interest(date(2025, 3, 16))
+    assert result['updated'] >= 3
+    logged = {row.entity_id for row in ChangeLog.query.filter(ChangeLog.id > cursor)}
+    assert {cases['simple'].id, cases['year'].id, cases['from_created'].id} <= logged
+    assert cases['no_rate'].id not in logged
+
+def test_negative_rates_are_rejected(admin_client):
+    body = {'title': 'Negative rate', 'amount_owed': 100, 'debtor_company': 'Interest Ltd'}
+    for rate in (-1, '-0.5', 'nan', 'inf', 'ten'):
+        response = admin_client.post('/api/cases', json=dict(body, interest_rate=rate))
+        assert response.status_code == 400, rate
+
+    response = admin_client.post('/api/cases', json=dict(body, interest_rate=0))
+    assert response.status_code == 201
+    case_id = response.get_json()['case']['id']
+    assert admin_client.put(f'/api/cases/{case_id}', json={'interest_rate': -3}).status_code == 400
+    assert admin_client.get(f'/api/cases/{case_id}').get_json()['interest_rate'] == 0
+    assert admin_client.put(f'/api/cases/{case_id}', json={'interest_rate': 4.5}).status_code == 200
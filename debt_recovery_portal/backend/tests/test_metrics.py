@@ -0,0 +1,65 @@
+import json
+import os
+import re
+import pytest
+from src.services import metrics
+from src.services.metrics import MULTIPROCESS_DIR_ENV, retire_process
+
+def sample(body, name, **labels):
+    """Value of one exposition line, or None"""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{re.escape(name)}{{{re.escape(wanted)}}} (\S+)$', body, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(MULTIPROCESS_DIR_ENV, str(tmp_path))
+    return tmp_path
+
+@pytest.fixture
+def scraper(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-secret')
+    client = app.test_client()
+    return lambda: client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+
+def other_worker(directory, pid, health_requests):
+    """Snapshot file as another worker process would leave it"""
+    snapshot = {'metrics': {
+        'http_request_duration_seconds': {'kind': 'histogram', 'series': [
+            [['/api/health', 'GET', '200'], [health_requests] + [0] * 11, 0.001 * health_requests, health_requests]]},
+        'db_queries_total': {'kind': 'counter', 'series': [[['request'], 7]]},
+    }}
+    (directory / f'{pid}-deadbeef.json').write_text(json.dumps(snapshot))
+
+def test_scrape_sums_every_worker(app, metrics_dir, scraper):
+    client = app.test_client()
+    before = sample(scraper(), 'http_request_duration_seconds_count', endpoint='/api/health', method='GET', status='200') or 0
+    client.get('/api/health')
+    other_worker(metrics_dir, 424242, 5)
+
+    body = scraper()
+    assert sample(body, 'http_request_duration_seconds_count', endpoint='/api/health', method='GET', status='200') \
+        == before + 1 + 5
+    assert sample(body, 'process_threads', pid=str(os.getpid())) is not None
+    # The scrape left this process's own snapshot behind for the other workers to read
+    assert any(path.name.endswith('.json') and not path.name.startswith('424242-') for path in metrics_dir.iterdir())
+
+def test_retired_worker_keeps_counting(app, metrics_dir, scraper):
+    other_worker(metrics_dir, 434343, 3)
+    before = sample(scraper(), 'db_queries_total', context='request')
+
+    retire_process(str(metrics_dir), 434343)
+    assert not list(metrics_dir.glob('434343-*.json'))
+    assert sample(scraper(), 'db_queries_total', context='request') >= before
+
+    # A second retirement adds to the first instead of replacing it
+    other_worker(metrics_dir, 444444, 2)
+    retire_process(str(metrics_dir), 444444)
+    retired = json.loads((metrics_dir / 'retired.json').read_text())['metrics']
+    assert retired['db_queries_total']['series'] == [[['request'], 14]]
+    assert retired['http_request_duration_seconds']['series'][0][3] == 5
+
+def test_single_process_without_a_directory(app, scraper, monkeypatch):
+    monkeypatch.delenv(MULTIPROCESS_DIR_ENV, raising=False)
+    assert metrics.shared.others() == {}
+    assert 'http_request_duration_seconds_count' in scraper()
@@ -0,0 +1,66 @@
+import pytest
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.document import Document
+from src.models.ticket import Ticket
+from src.services.query_debug import QueryBudgetExceeded
+
+LIST_ENDPOINTS = ['/api/cases', '/api/tickets', '/api/tickets/by-status/Received',
+                  '/api/cases/{case_id}/documents', '/api/cases/{case_id}/bundle.zip', '/api/reports/aging',
+                  '/api/reports/aging?format=csv&detail=1', '/api/reports/aging?format=xlsx']
+
+@pytest.fixture(scope='module')
+def case_id(app):
+    """Cases, tickets and documents spread over many users, so lazy loading would show up as extra queries"""
+    with app.app_context():
+        users = []
+        for index in range(8):
+            user = User(username=f'budget{index}', email=f'budget{index}@example.com', first_name='Budget',
+                        last_name=str(index), role='client' if index % 2 else 'staff')
+            user.set_password('budget123')
+            users.append(user)
+        db.session.add_all(users)
+        db.session.flush()
+        cases = [Case(title=f'Budget case {index}', amount_owed=1000 + index, debtor_company=f'Debtor {index} Ltd',
+                      client_id=users[index % 8].id, assigned_staff_id=users[(index + 1) % 8].id)
+                 for index in range(20)]
+        db.session.add_all(cases)
+        db.session.flush()
+        for index, case in enumerate(cases):
+            db.session.add(Ticket(title='Payment question', description='When is the next payment due?',
+                                  case_id=case.id, created_by_id=case.client_id, assigned_to_id=users[index % 8].id))
+            for number in range(3):
+                db.session.add(Document(filename=f'{case.id}_{number}.txt', original_filename=f'{number}.txt',
+                                        file_path=f'missing/{case.id}_{number}.txt', file_size=0, mime_type='text/plain',
+                                        case_id=case.id,
+                                        uploaded_by_id=users[(index + number) % 8].id))
+        db.session.commit()
+        return cases[0].id
+
+@pytest.mark.parametrize('path', LIST_ENDPOINTS)
+def test_list_endpoints_stay_within_budget(app, admin_client, case_id, path):
+    response = admin_client.get(path.format(case_id=case_id))
+    assert response.status_code == 200
+    # Streamed bodies are checked once the response is closed
+    response.get_data()
+    response.close()
+
+@pytest.mark.parametrize('path', LIST_ENDPOINTS)
+def test_exceeding_the_budget_fails(app, admin_client, case_id, path, monkeypatch):
+    adapter = app.url_map.bind('localhost')
+    endpoint, _ = adapter.match(path.format(case_id=case_id).partition('?')[0])
+    monkeypatch.setattr(app.view_functions[endpoint], 'query_budget', 1)
+    with pytest.raises(QueryBudgetExceeded):
+        response = admin_client.get(path.format(case_id=case_id))
+        response.get_data()
+        response.close()
+
+def test_queries_while_streaming_count(app, admin_client, monkeypatch):
+    # The drill-down export only loads the user before streaming; its case query runs inside the body
+    monkeypatch.setattr(app.view_functions['reports.get_aging_report'], 'query_budget', 1)
+    response = admin_client.get('/api/reports/aging?format=csv&detail=1')
+    assert response.status_code == 200
+    body = response.get_data()
+    assert body.startswith(b'case_id')
+    with pytest.raises(QueryBudgetExceeded):
+        response.close()
@@ -0,0 +1,116 @@
+import csv
+import io
+import os
+import time
+from datetime import datetime
+import pytest
+from src.models.user import User, db
+from src.models.case import Case
+from src.models.document import Document
+from src.models.archive import ArchivedDocument
+from src.services import reconcile as reconcile_module
+from src.services.reconcile import reconcile
+from src.services.storage import LocalStorage
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(tmp_path / 'store')
+
+@pytest.fixture
+def documents(app_context, storage, tmp_path):
+    """Files and rows that drift apart in every way the reconciler knows about"""
+    admin = User.query.filter_by(username='admin').first()
+    case = Case(title='Reconcile case', amount_owed=10, debtor_company='Reconcile Ltd', client_id=admin.id)
+    db.session.add(case)
+    db.session.flush()
+
+    def stored(name, content=b'12345'):
+        key = storage.new_key(name)
+        storage.save(key, io.BytesIO(content))
+        return key
+
+    keys = {name: stored(name) for name in ('matched.pdf', 'shared.pdf', 'mismatch.pdf', 'orphan.pdf')}
+    keys['missing'] = storage.new_key('missing.pdf')
+    keys['legacy'] = 'case_7/old.pdf'
+    os.makedirs(storage.path(keys['legacy']).rsplit(os.sep, 1)[0])
+    with open(storage.path(keys['legacy']), 'wb') as handle:
+        handle.write(b'old')
+    outside = tmp_path / 'elsewhere.pdf'
+    outside.write_bytes(b'1234567')
+
+    def row(name, path, size, model=Document, **extra):
+        return model(filename=name, original_filename=name, file_path=path, file_size=size,
+                     mime_type='application/pdf', case_id=case.id, uploaded_by_id=admin.id, **extra)
+
+    rows = {
+        'matched': row('matched.pdf', keys['matched.pdf'], 5),
+        'shared_a': row('shared.pdf', keys['shared.pdf'], 5),
+        'shared_b': row('shared.pdf', keys['shared.pdf'], 5),
+        'mismatch': row('mismatch.pdf', keys['mismatch.pdf'], 99),
+        'missing': row('missing.pdf', keys['missing'], 5),
+        'legacy': row('old.pdf', 'uploads/case_7/old.pdf', 3),
+        'absolute_in_root': row('matched.pdf', storage.path(keys['matched.pdf']), 5),
+        'outside': row('elsewhere.pdf', str(outside), 7),
+        'outside_gone': row('gone.pdf', str(tmp_path / 'gone.pdf'), 1),
+        # Archive rows keep the id they had in the hot table, so this one needs an explicit id
+        'archived_missing': row('archived.pdf', storage.new_key('archived.pdf'), 4, ArchivedDocument,
+                                id=10 ** 6 + case.id, uploaded_at=datetime.utcnow(), archived_at=datetime.utcnow())
+    }
+    db.session.add_all(rows.values())
+    db.session.commit()
+    yield keys, rows
+    for document in rows.values():
+        db.session.delete(document)
+    db.session.delete(case)
+    db.session.commit()
+
+def our_issues(storage, keys, rows, workers=4):
+    """Issues for this test's files and rows; other tests leave rows whose files are not in this storage"""
+    ids = {(document.__table__.name, document.id) for document in rows.values()}
+    return sorted(
+        (issue.issue, issue.key, issue.table, issue.document_id, issue.recorded_size, issue.file_size)
+        for issue in reconcile(storage, workers)
+        if (issue.table, issue.document_id) in ids or (issue.document_id is None and issue.key in keys.values()))
+
+def test_reports_orphans_missing_files_and_mismatches(storage, documents, tmp_path):
+    keys, rows = documents
+    assert our_issues(storage, keys, rows) == sorted([
+        ('orphan', keys['orphan.pdf'], None, None, None, 5),
+        ('missing', keys['missing'], 'document', rows['missing'].id, 5, None),
+        ('missing', str(tmp_path / 'gone.pdf'), 'document', rows['outside_gone'].id, 1, None),
+        ('missing', rows['archived_missing'].file_path, 'document_archive', rows['archived_missing'].id, 4, None),
+        ('size_mismatch', keys['mismatch.pdf'], 'document', rows['mismatch'].id, 99, 5)
+    ])
+
+def test_worker_count_does_not_change_the_result(storage, documents):
+    keys, rows = documents
+    assert our_issues(storage, keys, rows, workers=1) == our_issues(storage, keys, rows, workers=16)
+
+def test_empty_storage_reports_every_row_missing(tmp_path, documents):
+    keys, rows = documents
+    empty = LocalStorage(tmp_path / 'empty')
+    issues = our_issues(empty, keys, rows)
+    assert {issue[0] for issue in issues} == {'missing'}
+    # Absolute paths outside this root are looked up where they are, and both of those files exist
+    assert len(issues) == len(rows) - 2
+    assert rows['outside'].id not in {issue[3] for issue in issues}
+
+def test_command_deletes_only_orphans_past_the_grace_period(app, storage, documents, monkeypatch, tmp_path):
+    keys, rows = documents
+    stale = storage.new_key('stale-orphan.pdf')
+    storage.save(stale, io.BytesIO(b'stale'))
+    old = time.time() - 2 * 3600
+    os.utime(storage.path(stale), (old, old))
+    monkeypatch.setattr(reconcile_module, 'get_storage', lambda: storage)
+
+    report = tmp_path / 'report.csv'
+    result = app.test_cli_runner().invoke(args=['reconcile-documents', '--delete-orphans', '--workers', '2',
+                                                '--output', str(report)])
+    assert result.exit_code == 0, result.output
+    issues = {(row['issue'], row['key']) for row in csv.DictReader(report.open())}
+    assert {('orphan', stale), ('orphan', keys['orphan.pdf'])} <= issues
+    assert ('missing', keys['missing']) in issues
+    assert storage.size(stale) is None
+    # Younger than the default 60-minute grace period: an upload may still be committing its row
+    assert storage.size(keys['orphan.pdf']) == 5
+    assert storage.size(keys['matched.pdf']) == 5
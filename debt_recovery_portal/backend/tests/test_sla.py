@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import User, db
+from src.models.ticket import Ticket
+from src.models.sla_breach import SlaBreach
+from src.services.sla import SlaScheduler
+
+@pytest.fixture
+def late_ticket(app_context):
+    """A Medium ticket four days old and never answered: past its 1 day response target, inside its 7 day resolution target"""
+    client = User.query.filter_by(role='client').first() or User.query.filter_by(username='admin').first()
+    ticket = Ticket(title='Missed call back', description='Nobody has replied yet', priority='Medium',
+                    status='Received', created_by_id=client.id, created_at=datetime.utcnow() - timedelta(days=4))
+    db.session.add(ticket)
+    db.session.commit()
+    yield ticket
+    SlaBreach.query.filter_by(entity_type='ticket', entity_id=ticket.id).delete()
+    db.session.delete(ticket)
+    db.session.commit()
+
+def ticket_breaches(ticket):
+    return SlaBreach.query.filter_by(entity_type='ticket', entity_id=ticket.id).order_by(SlaBreach.id).all()
+
+def test_escalation_restarts_both_clocks(late_ticket):
+    scheduler = SlaScheduler()
+    scheduler.load()
+    now = datetime.utcnow()
+
+    # The response breach raises it to High; its 3 day High resolution target starts now, not at creation
+    scheduler.fire_due(now)
+    assert [(breach.kind, breach.new_priority) for breach in ticket_breaches(late_ticket)] == [('response', 'High')]
+    assert db.session.get(Ticket, late_ticket.id).priority == 'High'
+
+    # Nothing more is due until the 4 hour High response window runs out
+    scheduler.fire_due(now + timedelta(hours=3))
+    assert len(ticket_breaches(late_ticket)) == 1
+
+    scheduler.fire_due(now + timedelta(hours=4, minutes=1))
+    assert [(breach.kind, breach.new_priority) for breach in ticket_breaches(late_ticket)] == \
+        [('response', 'High'), ('response', 'Critical')]
+    assert db.session.get(Ticket, late_ticket.id).priority == 'Critical'
+
+def test_restarted_clocks_survive_a_reload(late_ticket):
+    now = datetime.utcnow()
+    first = SlaScheduler()
+    first.load()
+    first.fire_due(now)
+
+    # A fresh scheduler rebuilds the clocks from sla_breach and sees the same deadlines
+    second = SlaScheduler()
+    second.load()
+    second.fire_due(now + timedelta(hours=3))
+    assert len(ticket_breaches(late_ticket)) == 1
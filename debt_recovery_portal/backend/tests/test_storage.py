@@ -0,0 +1,80 @@
+import io
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from bench.s3_server import create_server
+from src.services.storage import LocalStorage, S3Storage, StorageError, sharded_key
+
+def test_local_round_trip(tmp_path):
+    storage = LocalStorage(tmp_path)
+    key = storage.new_key('receipt.txt')
+    assert key == sharded_key('receipt.txt') and key.count('/') == 2
+
+    assert storage.save(key, io.BytesIO(b'paid in full')) == 12
+    with storage.open(key) as handle:
+        assert handle.read() == b'paid in full'
+    assert storage.size(key) == 12
+    assert [stored.key for stored in storage.iter_files()] == [key]
+
+    assert storage.delete(key) is True
+    assert storage.size(key) is None
+    assert storage.delete(key) is False
+    with pytest.raises(FileNotFoundError):
+        storage.open(key)
+
+def test_local_reads_legacy_keys(tmp_path):
+    storage = LocalStorage(tmp_path)
+    (tmp_path / 'case_12').mkdir()
+    (tmp_path / 'case_12' / 'old.pdf').write_bytes(b'%PDF')
+    with storage.open('uploads/case_12/old.pdf') as handle:
+        assert handle.read() == b'%PDF'
+
+@pytest.fixture(scope='module')
+def s3_endpoint(tmp_path_factory):
+    server = create_server('127.0.0.1', 0, tmp_path_factory.mktemp('s3'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def s3(s3_endpoint):
+    return S3Storage(s3_endpoint, 'documents', 'bench', 'benchsecret', timeout=5)
+
+def test_s3_round_trip(s3):
+    key = s3.new_key('statement.pdf')
+    assert s3.save(key, io.BytesIO(b'%PDF-1.7 statement'), 'application/pdf') == 18
+    assert s3.size(key) == 18
+    # A bare read() must stop at the end of the body, not wait for the kept-alive socket to close
+    with s3.open(key) as stream:
+        assert stream.read() == b'%PDF-1.7 statement'
+    assert key in [stored.key for stored in s3.iter_files()]
+
+    s3.delete(key)
+    assert s3.size(key) is None
+    with pytest.raises(FileNotFoundError):
+        s3.open(key)
+
+def test_s3_multipart_upload(s3):
+    body = bytes(range(256)) * (9 * 1024 * 1024 // 256)
+    key = s3.new_key('scan.tiff')
+    assert s3.save(key, io.BytesIO(body)) == len(body)
+    with s3.open(key) as stream:
+        assert stream.read() == body
+
+def test_s3_presigned_url(s3):
+    key = s3.new_key('letter.txt')
+    s3.save(key, io.BytesIO(b'final demand'), 'text/plain')
+    with urllib.request.urlopen(s3.presigned_url(key, 'letter.txt', 'text/plain')) as response:
+        assert response.read() == b'final demand'
+        assert 'letter.txt' in response.headers['Content-Disposition']
+
+def test_s3_rejects_a_bad_signature(s3_endpoint):
+    forged = S3Storage(s3_endpoint, 'documents', 'bench', 'not-the-secret', timeout=5)
+    with pytest.raises(StorageError):
+        forged.save('ab/cd/forged.txt', io.BytesIO(b'x'))
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(forged.presigned_url('ab/cd/forged.txt'))
+    assert error.value.code == 403
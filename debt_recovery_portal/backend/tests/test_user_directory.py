@@ -0,0 +1,91 @@
+import threading
+import pytest
+from src.models.user import User, db
+from src.services import user_directory
+from src.services.user_directory import UserDirectory
+
+@pytest.fixture(scope='module')
+def agents(app):
+    """Staff users whose names share the prefix 'collect'"""
+    with app.app_context():
+        users = [User(username=f'collector{index:02d}', email=f'collector{index:02d}@example.com',
+                      first_name='Colette', last_name=f'Agent{index:02d}', role='staff')
+                 for index in range(12)]
+        for user in users:
+            user.set_password('collect123')
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+def test_prefix_search_ranks_and_limits(admin_client, agents):
+    response = admin_client.get('/api/users/search?q=collect&limit=5')
+    assert response.status_code == 200
+    assert [user['id'] for user in response.get_json()] == agents[:5]
+
+    # Every term has to match, in any field
+    response = admin_client.get('/api/users/search?q=col agent07')
+    assert [user['id'] for user in response.get_json()] == [agents[7]]
+
+    response = admin_client.get('/api/users/search?q=collect&role=client')
+    assert response.get_json() == []
+
+def test_search_sees_committed_changes(app, admin_client, agents):
+    with app.app_context():
+        db.session.get(User, agents[0]).last_name = 'Zephyr'
+        db.session.commit()
+    response = admin_client.get('/api/users/search?q=zeph')
+    assert [user['id'] for user in response.get_json()] == [agents[0]]
+
+def test_user_list_pagination(admin_client, agents):
+    first = admin_client.get('/api/users?page=1&per_page=5&role=staff').get_json()
+    second = admin_client.get('/api/users?page=2&per_page=5&role=staff').get_json()
+    assert len(first['users']) == 5 and first['has_more']
+    assert first['total'] == second['total'] >= len(agents)
+    ids = [user['id'] for user in first['users'] + second['users']]
+    assert ids == sorted(set(ids))
+
+    assert admin_client.get('/api/users?page=0').status_code == 400
+
+def test_concurrent_requests_rebuild_once(app, agents, monkeypatch):
+    index = UserDirectory()
+    rebuilds = []
+    real_rebuild = index.rebuild
+    started = threading.Barrier(8)
+
+    def counted_rebuild():
+        rebuilds.append(threading.get_ident())
+        real_rebuild()
+    monkeypatch.setattr(index, 'rebuild', counted_rebuild)
+
+    def request():
+        with app.app_context():
+            started.wait()
+            index.ensure_fresh()
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(rebuilds) == 1
+    with app.app_context():
+        assert index.search('collector03') == [agents[3]]
+
+def test_changes_committed_during_a_rebuild_are_kept(app, agents, monkeypatch):
+    index = UserDirectory()
+    with app.app_context():
+        index.rebuild()
+        renamed = user_directory.user_columns(db.session.get(User, agents[5]))
+    renamed['last_name'] = 'Quillfeather'
+
+    real_execute = db.session.execute
+    def execute_then_commit_elsewhere(*args, **kwargs):
+        rows = real_execute(*args, **kwargs)
+        # Another request commits after the rebuild has read the table
+        index.apply({agents[5]: renamed})
+        return rows
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'execute', execute_then_commit_elsewhere)
+        index.rebuild()
+        monkeypatch.undo()
+        assert index.search('quill') == [agents[5]]